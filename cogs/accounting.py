@@ -1,6 +1,10 @@
 """
 会計申請 Cog - Discord UI（モーダルフォーム、ボタン、メッセージ監視）
 """
+import asyncio
+import contextlib
+import math
+import os
 import uuid
 import logging
 from datetime import datetime
@@ -12,10 +16,104 @@ from discord import app_commands
 from services.vision import VisionService
 from services.sheets import SheetsService
 from services.drive import DriveService
+from services.ledger_index import parse_sheet_date
+from services.routing import LedgerRouter, LedgerTarget, ServicePool
+from services.pipeline import ReceiptPipeline, build_row_data, parse_amount_input, run_job_async
+from services.ocr import build_ocr_service
+from services.merchant_index import MerchantIndex
+from services.prefilter import build_prefilter
+from services.admission import AdmissionController, AdmissionError
+from services.jobqueue import JobQueue, JobStillRunning
+from services.google_auth import get_credentials
+from services.google_rest import GoogleRestSession
+from services.ingest_server import IngestServer
+from services import tracing
 import config
 
 logger = logging.getLogger(__name__)
 
+NO_TARGET_MESSAGE = "❌ このチャンネルには書き込み先の台帳が設定されていません。管理者に連絡してください。"
+
+# 待ち行列の順番表示を更新する最短の間隔（秒）。Discord のメッセージ編集のレート制限を避ける
+WAIT_NOTICE_INTERVAL = 2.0
+
+# レシート以外と判定して解析しなかった投稿に付けるリアクション（PREFILTER_MODE=skip）
+PREFILTER_SKIPPED_REACTION = "🙈"
+
+
+# =============================================================================
+#  待ち行列の順番表示（受付制御で待たされている画像への返信）
+# =============================================================================
+class WaitNotice:
+    """「待機中 (n番目)」の返信を、順番が進むたびに一定間隔以上あけて更新する"""
+
+    def __init__(self, message: discord.Message):
+        self.message = message
+        self.sent: discord.Message | None = None
+        self.position: int | None = None
+        self._shown: int | None = None
+        self._task: asyncio.Task | None = None
+        self._sending = False
+        self._done = False
+
+    def update(self, position: int) -> None:
+        """AdmissionController から順番を通知されたときに呼ばれる"""
+        self.position = position
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._done and self.position != self._shown:
+            self._shown = self.position
+            content = f"⏳ 待機中 ({self._shown}番目)… 順番が来たら自動で解析します。"
+            self._sending = True
+            try:
+                if self.sent is None:
+                    self.sent = await self.message.reply(content)
+                else:
+                    await self.sent.edit(content=content)
+            except discord.HTTPException as e:
+                logger.warning(f"待機中メッセージの更新に失敗: {e}")
+            finally:
+                self._sending = False
+            if self._done:
+                return
+            await asyncio.sleep(WAIT_NOTICE_INTERVAL)
+
+    async def finish(self, content: str | None = None) -> discord.Message | None:
+        """
+        表示の更新を止め、待機中に送った返信（なければ None）を返す
+
+        content を指定した場合は、その内容で返信（または待機中の返信を書き換え）する。
+        """
+        self._done = True
+        if self._task and not self._task.done():
+            if self._sending:
+                await self._task  # 送信中の返信は完了を待つ（二重投稿を防ぐ）
+            else:
+                self._task.cancel()
+        if content is not None:
+            if self.sent is None:
+                self.sent = await self.message.reply(content)
+            else:
+                await self.sent.edit(content=content)
+        return self.sent
+
+
+async def _delete_quietly(message: discord.Message) -> None:
+    try:
+        await message.delete()
+    except Exception:
+        pass
+
+
+async def _react_quietly(message: discord.Message, emoji: str) -> None:
+    """リアクションを付ける（権限がない場合などは何もしない）"""
+    try:
+        await message.add_reaction(emoji)
+    except Exception as e:
+        logger.warning(f"リアクションを付けられませんでした: {e}")
+
 
 # =============================================================================
 #  モーダルフォーム（会計申請入力画面）
@@ -37,6 +135,14 @@ class AccountingModal(discord.ui.Modal, title="会計申請フォーム"):
         max_length=50,
         style=discord.TextStyle.short,
     )
+    category_input = discord.ui.TextInput(
+        label="勘定科目",
+        placeholder="例: 消耗品費、交通費、会議費",
+        default="経費",
+        required=True,
+        max_length=30,
+        style=discord.TextStyle.short,
+    )
     purpose_input = discord.ui.TextInput(
         label="使用用途",
         placeholder="例: ○○の購入、会議室利用料",
@@ -63,24 +169,28 @@ class AccountingModal(discord.ui.Modal, title="会計申請フォーム"):
                 self.date_input.default = defaults["date"]
             if defaults.get("payer"):
                 self.payer_input.default = defaults["payer"]
+            if defaults.get("category"):
+                self.category_input.default = defaults["category"]
             if defaults.get("purpose"):
                 self.purpose_input.default = defaults["purpose"]
             if defaults.get("amount"):
                 self.amount_input.default = defaults["amount"]
 
     async def on_submit(self, interaction: discord.Interaction):
-        await interaction.response.defer(ephemeral=True)
+        with tracing.span("on_submit", trace_id=self.submission_id):
+            await self._submit(interaction)
+
+    async def _submit(self, interaction: discord.Interaction):
+        """入力内容を検証し、Drive アップロードとスプレッドシート書き込みを行う"""
+        with tracing.span("defer"):
+            await interaction.response.defer(ephemeral=True)
 
         pending = self.cog.pending.pop(self.submission_id, {})
+        target = pending.get("target") or self.cog.resolve_target_name(interaction)
 
         # --- 金額のバリデーション ---
-        amount_str = (
-            self.amount_input.value
-            .replace(",", "").replace("¥", "").replace("￥", "")
-            .replace(" ", "").replace("　", "")
-        )
         try:
-            amount = int(amount_str)
+            amount = parse_amount_input(self.amount_input.value)
         except ValueError:
             await interaction.followup.send(
                 "❌ 金額が正しくありません。半角数字を入力してください。",
@@ -88,44 +198,57 @@ class AccountingModal(discord.ui.Modal, title="会計申請フォーム"):
             )
             return
 
-        # --- レシート画像を Google Drive にアップロード ---
-        drive_link = ""
-        if pending.get("image_bytes"):
-            try:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"receipt_{timestamp}_{interaction.user.name}.png"
-                drive_link = self.cog.drive_service.upload_image(
-                    pending["image_bytes"], filename
-                )
-            except Exception as e:
-                logger.error(f"Drive アップロード失敗: {e}")
-
-        # --- スプレッドシートに書き込み ---
-        today = datetime.now().strftime("%Y/%m/%d")
+        # --- スプレッドシートに書き込むデータ ---
         author = pending.get("author", interaction.user.display_name)
+        row_data = build_row_data(
+            author,
+            self.date_input.value,
+            self.category_input.value,
+            self.payer_input.value,
+            self.purpose_input.value,
+            amount,
+        )
 
-        row_data = {
-            "入力日": today,
-            "日付": self.date_input.value,
-            "記入者": author,
-            "勘定科目": "経費",
-            "立て替えた人": self.payer_input.value,
-            "使用用途": self.purpose_input.value,
-            "入金": 0,
-            "出金": amount,
-            "会計Check": "",
-            "精算": "",
-        }
+        # 同じ画像の別のレシートで Drive にアップロード済みなら、そのリンクを使う
+        # 同じ画像のレシートは1件ずつ送信し、最初の1件のアップロードが終わるまで他は待つ
+        # （同時に確定しても画像を二重にアップロードしない）
+        shared = pending.get("shared")
+        async with shared["lock"] if shared else contextlib.nullcontext():
+            image_bytes = pending.get("image_bytes")
+            if shared and shared["drive_link"]:
+                row_data["レシート"] = shared["drive_link"]
+                image_bytes = None
 
-        try:
-            self.cog.sheets_service.append_row(row_data)
-        except Exception as e:
-            logger.error(f"スプレッドシート書き込み失敗: {e}")
-            await interaction.followup.send(
-                f"❌ スプレッドシートへの保存に失敗しました。\n```{e}```",
-                ephemeral=True,
-            )
-            return
+            # --- レシート画像を Drive にアップロードし、スプレッドシートに書き込み ---
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            payload = {
+                "target": target,
+                "row_data": row_data,
+                "store": pending.get("ocr_data", {}).get("store", ""),
+                "filename": f"receipt_{timestamp}_{interaction.user.name}.png",
+                "submission_key": self.submission_id,
+            }
+            try:
+                with tracing.span("submit"):
+                    result = await self.cog.run_job("submit", payload, blob=image_bytes)
+            except JobStillRunning as e:
+                # ワーカーはこの後も書き込むことがあるので、失敗として再送信を促さない
+                logger.warning(f"申請の完了を確認できませんでした: {e}")
+                await interaction.followup.send(
+                    f"⏳ {e}。スプレッドシートを確認し、同じ申請を再送信しないでください。",
+                    ephemeral=True,
+                )
+                return
+            except Exception as e:
+                logger.error(f"スプレッドシート書き込み失敗: {e}")
+                await interaction.followup.send(
+                    f"❌ スプレッドシートへの保存に失敗しました。\n```{e}```",
+                    ephemeral=True,
+                )
+                return
+            drive_link = result.get("drive_link", "")
+            if shared is not None and drive_link:
+                shared["drive_link"] = drive_link
 
         # --- 成功メッセージ ---
         embed = discord.Embed(
@@ -134,7 +257,7 @@ class AccountingModal(discord.ui.Modal, title="会計申請フォーム"):
             timestamp=datetime.now(),
         )
         embed.add_field(name="日付（支払日）", value=self.date_input.value, inline=True)
-        embed.add_field(name="勘定科目", value="経費", inline=True)
+        embed.add_field(name="勘定科目", value=self.category_input.value, inline=True)
         embed.add_field(name="立て替えた人", value=self.payer_input.value, inline=True)
         embed.add_field(name="使用用途", value=self.purpose_input.value, inline=False)
         embed.add_field(name="出金額", value=f"¥{amount:,}", inline=True)
@@ -147,7 +270,8 @@ class AccountingModal(discord.ui.Modal, title="会計申請フォーム"):
             )
         embed.set_footer(text="スプレッドシートに保存済み")
 
-        await interaction.followup.send(embed=embed)
+        with tracing.span("followup"):
+            await interaction.followup.send(embed=embed)
         logger.info(f"会計申請完了: {author} ¥{amount:,} ({self.purpose_input.value})")
 
     async def on_error(self, interaction: discord.Interaction, error: Exception):
@@ -189,8 +313,9 @@ class ConfirmView(discord.ui.View):
         defaults = dict(data.get("ocr_data", {}))
         defaults["payer"] = interaction.user.display_name
 
-        modal = AccountingModal(self.cog, self.submission_id, defaults)
-        await interaction.response.send_modal(modal)
+        with tracing.span("open_form", trace_id=self.submission_id):
+            modal = AccountingModal(self.cog, self.submission_id, defaults)
+            await interaction.response.send_modal(modal)
 
     @discord.ui.button(
         label="❌ キャンセル",
@@ -209,37 +334,340 @@ class ConfirmView(discord.ui.View):
         self.cog.pending.pop(self.submission_id, None)
 
 
+# =============================================================================
+#  レシート判定の確認ビュー（レシートらしくない画像を OCR する前に表示）
+# =============================================================================
+class PrefilterConfirmView(discord.ui.View):
+    """レシートではなさそうな画像について、OCR 解析するかを投稿者に確認するビュー"""
+
+    def __init__(self, cog: "AccountingCog", submission_id: str):
+        super().__init__(timeout=600)  # 10分でタイムアウト
+        self.cog = cog
+        self.submission_id = submission_id
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        data = self.cog.pending.get(self.submission_id)
+        if data and interaction.user.id != data["author_id"]:
+            await interaction.response.send_message(
+                "画像を投稿した人のみ操作できます。",
+                ephemeral=True,
+            )
+            return False
+        return True
+
+    @discord.ui.button(
+        label="🔍 解析する",
+        style=discord.ButtonStyle.primary,
+    )
+    async def analyze(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if self.submission_id not in self.cog.pending:
+            await interaction.response.send_message(
+                "⏰ タイムアウトしました。もう一度レシート画像を送信してください。",
+                ephemeral=True,
+            )
+            return
+        self.stop()
+        await interaction.response.edit_message(content="📷 解析中...", view=None)
+        with tracing.span("prefilter_confirm", trace_id=self.submission_id):
+            try:
+                async with self.cog.admission.slot():
+                    await self.cog._analyze_receipt(interaction.message, self.submission_id)
+            except AdmissionError as e:
+                self.cog.pending.pop(self.submission_id, None)
+                await interaction.message.edit(
+                    content=f"🚧 {e}。しばらくしてから、もう一度送信してください。"
+                )
+
+    @discord.ui.button(
+        label="✖ 無視する",
+        style=discord.ButtonStyle.secondary,
+    )
+    async def dismiss(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.cog.pending.pop(self.submission_id, None)
+        self.stop()
+        await interaction.response.edit_message(
+            content="🚫 この画像は申請しません。",
+            view=None,
+        )
+
+    async def on_timeout(self):
+        self.cog.pending.pop(self.submission_id, None)
+
+
+# =============================================================================
+#  一括精算の確認ビュー（/精算 コマンドで対象行を確認してから実行）
+# =============================================================================
+class SettleConfirmView(discord.ui.View):
+    """一括精算の対象を表示し、「実行」ボタンで values.batchUpdate を1回行うビュー"""
+
+    def __init__(self, cog: "AccountingCog", target: str, entries: list[dict], column: str, value: str):
+        super().__init__(timeout=300)  # 5分でタイムアウト
+        self.cog = cog
+        self.target = target
+        # 確認時の行の要約（シート名・行番号。書き込み前に読み直して、行がずれていないかを照合する）
+        self.entries = entries
+        self.column = column
+        self.value = value
+
+    @discord.ui.button(
+        label="✅ 実行",
+        style=discord.ButtonStyle.success,
+    )
+    async def execute(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.defer(ephemeral=True)
+        self.stop()
+        try:
+            result = await self.cog.run_job("mark_rows", {
+                "target": self.target,
+                "entries": self.entries,
+                "column": self.column,
+                "value": self.value,
+            })
+            updated = result["updated"]
+        except JobStillRunning as e:
+            await interaction.edit_original_response(content=f"⏳ {e}", embed=None, view=None)
+            return
+        except Exception as e:
+            logger.error(f"一括精算失敗: {e}")
+            await interaction.edit_original_response(
+                content=f"❌ スプレッドシートの更新に失敗しました。\n```{e}```",
+                embed=None,
+                view=None,
+            )
+            return
+
+        await interaction.edit_original_response(
+            content=f"✅ {updated}件の「{self.column}」を「{self.value}」に更新しました。",
+            embed=None,
+            view=None,
+        )
+        logger.info(
+            f"一括精算完了: {interaction.user} {self.column}={self.value} {updated}件"
+        )
+
+    @discord.ui.button(
+        label="❌ キャンセル",
+        style=discord.ButtonStyle.secondary,
+    )
+    async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.edit_message(
+            content="🚫 一括精算をキャンセルしました。",
+            embed=None,
+            view=None,
+        )
+        self.stop()
+
+
+class RecomputeConfirmView(discord.ui.View):
+    """差引残高の確認結果を表示し、「修正する」ボタンで差引残高を書き直すビュー"""
+
+    def __init__(self, cog: "AccountingCog", target: str):
+        super().__init__(timeout=300)  # 5分でタイムアウト
+        self.cog = cog
+        self.target = target
+
+    @discord.ui.button(
+        label="✅ 修正する",
+        style=discord.ButtonStyle.success,
+    )
+    async def execute(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.defer(ephemeral=True)
+        self.stop()
+        try:
+            # 確認後に行が変わっていても正しく直せるよう、書き込み時にもう一度計算する
+            result = await self.cog.run_job("recompute_balances", {
+                "target": self.target,
+                "dry_run": False,
+            })
+        except JobStillRunning as e:
+            await interaction.edit_original_response(content=f"⏳ {e}", embed=None, view=None)
+            return
+        except Exception as e:
+            logger.error(f"差引残高の再計算失敗: {e}")
+            await interaction.edit_original_response(
+                content=f"❌ 差引残高の再計算に失敗しました。\n```{e}```",
+                embed=None,
+                view=None,
+            )
+            return
+
+        await interaction.edit_original_response(
+            content=None,
+            embed=recompute_embed(result, dry_run=False),
+            view=None,
+        )
+        logger.info(f"差引残高を修正: {interaction.user} {result['changed']}行")
+
+    @discord.ui.button(
+        label="❌ キャンセル",
+        style=discord.ButtonStyle.secondary,
+    )
+    async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.edit_message(
+            content="🚫 差引残高の修正をキャンセルしました。",
+            embed=None,
+            view=None,
+        )
+        self.stop()
+
+
+def recompute_embed(result: dict, dry_run: bool) -> discord.Embed:
+    """recompute_balances の結果の Embed（dry_run は修正前の確認結果）"""
+    embed = discord.Embed(
+        title="🔍 差引残高の確認結果（未修正）" if dry_run else "🧮 差引残高を修正しました",
+        color=discord.Color.orange() if dry_run else discord.Color.green(),
+        timestamp=datetime.now(),
+    )
+    embed.add_field(name="確認した行数", value=f"{result['rows']}行", inline=True)
+    embed.add_field(
+        name="修正が必要な行数" if dry_run else "修正した行数",
+        value=f"{result['changed']}行（行{result['first_row']}から）" if result["changed"] else "0行",
+        inline=True,
+    )
+    embed.add_field(
+        name="最終差引残高",
+        value=f"¥{result['old_balance']:,} → ¥{result['new_balance']:,}",
+        inline=False,
+    )
+    stale = result.get("stale_rows") or []
+    if stale:
+        shown = "、".join(f"行{n}" for n in stale[:10]) + (f" ほか{len(stale) - 10}行" if len(stale) > 10 else "")
+        embed.add_field(
+            name="⚠️ 入金・出金が空で差引残高だけがある行",
+            value=(
+                f"{shown}\n繰越行ではないため、前の行からの残高で計算します。"
+                f"繰越なら勘定科目を「{SheetsService.OPENING_CATEGORY}」にしてください。"
+            ),
+            inline=False,
+        )
+    return embed
+
+
 # =============================================================================
 #  メインCog
 # =============================================================================
 class AccountingCog(commands.Cog, name="会計申請"):
     """#会計申請 チャンネルのメッセージ監視とスラッシュコマンドを提供する"""
 
-    def __init__(self, bot: commands.Bot):
+    def __init__(
+        self,
+        bot: commands.Bot,
+        vision_service: VisionService | None = None,
+        sheets_service: SheetsService | None = None,
+        drive_service: DriveService | None = None,
+    ):
         self.bot = bot
         self.pending: dict[str, dict] = {}  # submission_id -> 申請データ
 
-        # Google サービス初期化
-        try:
-            self.vision_service = VisionService()
-            logger.info("Vision API 初期化完了")
-        except Exception as e:
-            logger.error(f"Vision API 初期化失敗: {e}")
-            self.vision_service = None
+        # Drive / Sheets の非同期クライアント（Bot と同じ aiohttp のコネクションプールを使う）
+        self.rest: GoogleRestSession | None = None
+        if config.GOOGLE_ASYNC_HTTP and not config.WORKER_MODE and not (sheets_service or drive_service):
+            self.rest = self._init_service(
+                "Google API 非同期クライアント",
+                lambda: GoogleRestSession(
+                    get_credentials(),
+                    # ログイン前は discord.py の MISSING（偽）になるので、その場合は専用のプールを作る
+                    connector=getattr(bot.http, "connector", None) or None,
+                    max_connections=config.GOOGLE_HTTP_MAX_CONNECTIONS,
+                ),
+            )
+
+        # 書き込み先の台帳（guild/チャンネル → 台帳）と台帳ごとのサービス
+        self.router = LedgerRouter.from_config()
+        self.services = ServicePool(self.router, self.rest)
+
+        # OCR 前のレシート判定（ゲートウェイで行う）
+        self.prefilter = build_prefilter(config.PREFILTER_MODE, config.PREFILTER_THRESHOLD)
+
+        # レシート解析の受付制御（ユーザーごとの頻度・同時実行数・待ち行列）
+        self.admission = AdmissionController(
+            max_in_flight=config.OCR_MAX_IN_FLIGHT,
+            queue_size=config.OCR_QUEUE_SIZE,
+            user_rate_per_minute=config.OCR_USER_RATE_PER_MINUTE,
+            user_burst=config.OCR_USER_BURST,
+        )
+        self.ingest: IngestServer | None = None  # cog_load で起動する
 
+        # ワーカーモードでは OCR・Drive・Sheets はワーカープロセスで実行する（worker.py）
+        self.job_queue: JobQueue | None = None
+        self.pipeline: ReceiptPipeline | None = None
+        if config.WORKER_MODE:
+            self.job_queue = JobQueue(config.JOB_QUEUE_PATH, self.router)
+            logger.info(f"ワーカーモード: ジョブキュー {config.JOB_QUEUE_PATH}")
+            return
+
+        # Google サービス初期化（引数で渡されたものはそのまま使う: 負荷試験用フェイク等）
+        # Sheets / Drive は台帳ごとに初回利用時に作成される
+        vision_service = vision_service or self._init_service("Vision API", VisionService)
+        if sheets_service or drive_service:
+            for name in self.router.targets:
+                self.services.register(name, sheets_service, drive_service)
+        self.pipeline = ReceiptPipeline(
+            build_ocr_service(vision_service),
+            self.services,
+            MerchantIndex(config.MERCHANT_INDEX_FILE),
+        )
+
+    @staticmethod
+    def _init_service(label: str, factory):
+        """サービスを初期化する。失敗した場合は None を返す"""
         try:
-            self.sheets_service = SheetsService()
-            logger.info("Sheets API 初期化完了")
+            service = factory()
+            logger.info(f"{label} 初期化完了")
+            return service
         except Exception as e:
-            logger.error(f"Sheets API 初期化失敗: {e}")
-            self.sheets_service = None
+            logger.error(f"{label} 初期化失敗: {e}")
+            return None
+
+    async def run_job(self, kind: str, payload: dict, blob: bytes | None = None) -> dict:
+        """
+        パイプラインのジョブを実行する（services/pipeline.py の run_job 参照）
 
+        ワーカーモードではジョブキューに登録し、ワーカーの結果を待つ。
+        """
+        if self.job_queue:
+            return await self.job_queue.run(kind, payload, blob, timeout=config.JOB_TIMEOUT)
+        return await run_job_async(self.pipeline, kind, payload, blob)
+
+    async def cog_load(self):
+        # HTTP 受付サーバー（Discord を使わない申請。Discord と同じパイプライン・受付制御を使う）
+        if not config.INGEST_PORT:
+            return
         try:
-            self.drive_service = DriveService()
-            logger.info("Drive API 初期化完了")
+            self.ingest = IngestServer(
+                self.run_job,
+                self.router,
+                self.admission,
+                token=config.INGEST_TOKEN,
+                host=config.INGEST_HOST,
+                port=config.INGEST_PORT,
+                upload_dir=config.INGEST_UPLOAD_DIR,
+                max_upload_bytes=config.INGEST_MAX_UPLOAD_BYTES,
+                job_ttl=config.INGEST_JOB_TTL,
+            )
+            await self.ingest.start()
         except Exception as e:
-            logger.error(f"Drive API 初期化失敗: {e}")
-            self.drive_service = None
+            logger.error(f"HTTP 受付サーバーを起動できませんでした: {e}")
+            self.ingest = None
+
+    async def cog_unload(self):
+        if self.ingest:
+            await self.ingest.stop()
+        if self.rest:
+            await self.rest.close()
+
+    def resolve_target_name(self, interaction: discord.Interaction) -> str | None:
+        target = self.resolve_target(interaction)
+        return target.name if target else None
+
+    def resolve_target(self, interaction: discord.Interaction) -> LedgerTarget | None:
+        """スラッシュコマンド・フォーム送信の書き込み先台帳を決める"""
+        channel = interaction.channel
+        return self.router.resolve_interaction(
+            getattr(channel, "id", None),
+            interaction.guild_id,
+            getattr(channel, "name", None),
+        )
 
     # -----------------------------------------------------------------
     #  メッセージ監視: #会計申請 チャンネルに画像が投稿されたら自動でOCR
@@ -250,10 +678,13 @@ class AccountingCog(commands.Cog, name="会計申請"):
         if message.author.bot:
             return
 
-        # 対象チャンネルかチェック
-        if not hasattr(message.channel, "name"):
-            return
-        if message.channel.name != config.CHANNEL_NAME:
+        # 対象チャンネルかチェック（チャンネルID → 台帳 の辞書引き）
+        target = self.router.resolve_channel(
+            message.channel.id,
+            message.guild.id if message.guild else None,
+            getattr(message.channel, "name", None),
+        )
+        if target is None:
             return
 
         # 画像添付があるかチェック
@@ -271,40 +702,167 @@ class AccountingCog(commands.Cog, name="会計申請"):
             f"({attachment.size} bytes) from {message.author}"
         )
 
-        # 処理中メッセージ
-        processing_msg = await message.reply("📷 レシートを検出しました。解析中...")
+        # 1人が短時間に送れる画像の数を制限する（トークンバケット）
+        try:
+            self.admission.check_user(message.author.id)
+        except AdmissionError as e:
+            await message.reply(
+                f"⏳ {e}。{math.ceil(e.retry_after)}秒ほど待ってから、もう一度送信してください。"
+            )
+            return
+
+        # submission_id をトレースIDとして、投稿から申請完了までを記録する
+        submission_id = str(uuid.uuid4())
+        with tracing.span("on_message", trace_id=submission_id, target=target.name):
+            await self._process_receipt(message, target, attachment, submission_id)
 
-        # --- 画像ダウンロード ---
+    async def _process_receipt(
+        self,
+        message: discord.Message,
+        target: LedgerTarget,
+        attachment: discord.Attachment,
+        submission_id: str,
+    ):
+        """レシート画像をダウンロードし、レシートらしければ OCR 解析して申請フォームを開くボタンを表示する"""
+        # --- 実行枠の確保（空きがなければ順番を表示して待つ） ---
+        notice = WaitNotice(message)
         try:
-            image_bytes = await attachment.read()
-        except Exception as e:
-            await processing_msg.edit(content=f"❌ 画像のダウンロードに失敗しました: {e}")
+            with tracing.span("admission") as attrs:
+                await self.admission.acquire(on_position=notice.update)
+                attrs["queued"] = notice.position is not None
+        except AdmissionError as e:
+            await notice.finish(f"🚧 {e}。しばらくしてから、もう一度送信してください。")
             return
 
-        # --- Vision API で OCR ---
-        ocr_text = ""
-        ocr_data = {}
-        if self.vision_service:
+        try:
+            processing_msg = await notice.finish()
+
+            # --- 画像ダウンロード ---
             try:
-                ocr_text, ocr_data = self.vision_service.analyze_receipt(image_bytes)
+                with tracing.span("download", bytes=attachment.size):
+                    image_bytes = await attachment.read()
             except Exception as e:
-                logger.error(f"OCR失敗: {e}")
-                ocr_text = ""
-                ocr_data = {}
+                content = f"❌ 画像のダウンロードに失敗しました: {e}"
+                if processing_msg:
+                    await processing_msg.edit(content=content)
+                else:
+                    await message.reply(content)
+                return
 
-        # --- 保留データを保存 ---
-        submission_id = str(uuid.uuid4())
-        self.pending[submission_id] = {
-            "image_bytes": image_bytes,
-            "ocr_data": ocr_data,
-            "ocr_text": ocr_text,
-            "attachment_url": attachment.url,
-            "author": message.author.display_name,
-        }
+            self.pending[submission_id] = {
+                "image_bytes": image_bytes,
+                "attachment_url": attachment.url,
+                "author": message.author.display_name,
+                "author_id": message.author.id,
+                "target": target.name,
+            }
+
+            # --- レシートらしいかを手元で判定（OCR の API 呼び出しを節約する） ---
+            if not await self._looks_like_receipt(image_bytes, attachment.filename):
+                if config.PREFILTER_MODE == "skip":
+                    # 解析しなかったことが投稿者に分かるよう、投稿にリアクションだけを付ける
+                    self.pending.pop(submission_id, None)
+                    if processing_msg:
+                        await _delete_quietly(processing_msg)
+                    await _react_quietly(message, PREFILTER_SKIPPED_REACTION)
+                    return
+                content = "🤔 レシートではない可能性があります。OCR解析しますか？"
+                view = PrefilterConfirmView(self, submission_id)
+                with tracing.span("reply"):
+                    if processing_msg:
+                        await processing_msg.edit(content=content, view=view)
+                    else:
+                        await message.reply(content, view=view)
+                return
+
+            # 処理中メッセージ
+            content = "📷 レシートを検出しました。解析中..."
+            with tracing.span("reply"):
+                if processing_msg:
+                    await processing_msg.edit(content=content)
+                else:
+                    processing_msg = await message.reply(content)
+            await self._analyze_receipt(processing_msg, submission_id)
+        finally:
+            self.admission.release()
+
+    async def _looks_like_receipt(self, image_bytes: bytes, filename: str) -> bool:
+        """前処理でレシートらしいかを判定する（判定できない場合はレシートとして扱う）"""
+        if self.prefilter is None:
+            return True
+        with tracing.span("prefilter") as attrs:
+            try:
+                result = await asyncio.to_thread(self.prefilter.classify, image_bytes)
+            except Exception as e:
+                logger.warning(f"レシート判定に失敗したため OCR します: {filename}: {e}")
+                attrs["error"] = str(e)
+                return True
+            attrs.update(is_receipt=result["is_receipt"], score=result["score"], **result["features"])
+        features = " ".join(f"{name}={value:.2f}" for name, value in result["features"].items())
+        logger.info(
+            f"レシート判定: {'レシート' if result['is_receipt'] else 'レシート以外'} "
+            f"score={result['score']:.2f} ({features}) {result['elapsed_ms']:.0f}ms {filename}"
+        )
+        return result["is_receipt"]
+
+    async def _analyze_receipt(self, processing_msg: discord.Message, submission_id: str):
+        """保留中の画像を OCR 解析し、結果の Embed と申請フォームを開くボタンを表示する"""
+        pending = self.pending.get(submission_id)
+        if pending is None:
+            return
+
+        # --- Vision API で OCR ---
+        try:
+            with tracing.span("ocr"):
+                analysis = await self.run_job("analyze", {}, blob=pending["image_bytes"])
+        except Exception as e:
+            logger.error(f"OCR失敗: {e}")
+            analysis = {"ocr_text": "", "ocr_data": {}, "ocr_enabled": True}
+        receipts = analysis.get("receipts") or [
+            {"ocr_text": analysis["ocr_text"], "ocr_data": analysis["ocr_data"]}
+        ]
+
+        # --- 1枚の画像に複数のレシートがあれば、レシートごとに申請を分ける ---
+        # 2枚目以降は同じ画像の保留データを複製し、Drive へのアップロードは1回だけにする
+        submissions = [submission_id]
+        if len(receipts) > 1:
+            pending["shared"] = {"drive_link": "", "lock": asyncio.Lock()}
+            for i in range(2, len(receipts) + 1):
+                child_id = f"{submission_id}/{i}"
+                self.pending[child_id] = dict(pending)
+                submissions.append(child_id)
+
+        for i, (child_id, receipt) in enumerate(zip(submissions, receipts), start=1):
+            # --- 保留データに解析結果を追加 ---
+            self.pending[child_id]["ocr_data"] = receipt["ocr_data"]
+            self.pending[child_id]["ocr_text"] = receipt["ocr_text"]
+
+            # --- 解析結果の Embed とボタン付きメッセージ ---
+            embed = self._analysis_embed(
+                receipt["ocr_text"],
+                receipt["ocr_data"],
+                analysis["ocr_enabled"],
+                pending["attachment_url"],
+                f" ({i}/{len(receipts)})" if len(receipts) > 1 else "",
+            )
+            view = ConfirmView(self, child_id)
+            with tracing.span("edit_embed"):
+                if i == 1:
+                    await processing_msg.edit(content=None, embed=embed, view=view)
+                else:
+                    await processing_msg.channel.send(embed=embed, view=view)
 
-        # --- 解析結果の Embed 表示 ---
+    @staticmethod
+    def _analysis_embed(
+        ocr_text: str,
+        ocr_data: dict,
+        ocr_enabled: bool,
+        attachment_url: str,
+        suffix: str = "",
+    ) -> discord.Embed:
+        """レシート解析結果の Embed（suffix は複数レシートの場合の「(1/3)」など）"""
         embed = discord.Embed(
-            title="📄 レシート解析結果",
+            title=f"📄 レシート解析結果{suffix}",
             color=discord.Color.blue(),
             timestamp=datetime.now(),
         )
@@ -327,28 +885,27 @@ class AccountingCog(commands.Cog, name="会計申請"):
                 value=f"```\n{truncated}\n```",
                 inline=False,
             )
-        elif not self.vision_service:
+        elif not ocr_enabled:
             embed.add_field(
                 name="⚠️ 注意",
-                value="Vision APIが無効のため、OCR解析はスキップされました。",
+                value="OCRエンジン（Vision API / Tesseract）が無効のため、OCR解析はスキップされました。",
                 inline=False,
             )
 
-        embed.set_thumbnail(url=attachment.url)
+        embed.set_thumbnail(url=attachment_url)
         embed.set_footer(text="下のボタンを押してフォームに入力してください")
-
-        # --- ボタン付きメッセージ送信 ---
-        view = ConfirmView(self, submission_id)
-        await processing_msg.edit(content=None, embed=embed, view=view)
+        return embed
 
     # -----------------------------------------------------------------
     #  スラッシュコマンド: /申請 （画像なしで直接フォーム入力）
     # -----------------------------------------------------------------
     @app_commands.command(name="申請", description="会計申請フォームを開きます（画像なし）")
     async def submit_expense(self, interaction: discord.Interaction):
-        if not self.sheets_service:
+        # Sheets への接続はフォーム送信時に行う（モーダル表示の応答期限に間に合わせるため）
+        target = self.resolve_target(interaction)
+        if target is None:
             await interaction.response.send_message(
-                "❌ Google Sheets への接続が確立されていません。管理者に連絡してください。",
+                NO_TARGET_MESSAGE,
                 ephemeral=True,
             )
             return
@@ -358,6 +915,7 @@ class AccountingCog(commands.Cog, name="会計申請"):
             "image_bytes": None,
             "ocr_data": {},
             "author": interaction.user.display_name,
+            "target": target.name,
         }
 
         defaults = {
@@ -367,6 +925,257 @@ class AccountingCog(commands.Cog, name="会計申請"):
         modal = AccountingModal(self, submission_id, defaults)
         await interaction.response.send_modal(modal)
 
+    # -----------------------------------------------------------------
+    #  スラッシュコマンド: /精算 （会計Check / 精算 列の一括更新）
+    # -----------------------------------------------------------------
+    @app_commands.command(name="精算", description="未処理の申請をまとめて会計Check済み/精算済みにします（会計担当者用）")
+    @app_commands.rename(column="対象", payer="立て替えた人", date_from="開始日", date_to="終了日", value="値")
+    @app_commands.describe(
+        column="更新する列",
+        payer="立て替えた人で絞り込む（省略時は全員）",
+        date_from="この日付以降の支払日（例: 2026/02/01）",
+        date_to="この日付以前の支払日（例: 2026/02/28）",
+        value="書き込む値（省略時は「済」）",
+    )
+    @app_commands.choices(column=[
+        app_commands.Choice(name="精算", value="精算"),
+        app_commands.Choice(name="会計Check", value="会計Check"),
+    ])
+    async def settle(
+        self,
+        interaction: discord.Interaction,
+        column: app_commands.Choice[str],
+        payer: str | None = None,
+        date_from: str | None = None,
+        date_to: str | None = None,
+        value: str = "済",
+    ):
+        if not self._is_treasurer(interaction):
+            await interaction.response.send_message(
+                "❌ このコマンドは会計担当者のみ使用できます。",
+                ephemeral=True,
+            )
+            return
+        target = self.resolve_target(interaction)
+        if target is None:
+            await interaction.response.send_message(
+                NO_TARGET_MESSAGE,
+                ephemeral=True,
+            )
+            return
+
+        start = parse_sheet_date(date_from) if date_from else None
+        end = parse_sheet_date(date_to) if date_to else None
+        if (date_from and not start) or (date_to and not end):
+            await interaction.response.send_message(
+                "❌ 日付が正しくありません。例: 2026/02/08",
+                ephemeral=True,
+            )
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        try:
+            result = await self.run_job("find_unsettled", {
+                "target": target.name,
+                "column": column.value,
+                "payer": payer,
+                "date_from": start.isoformat() if start else None,
+                "date_to": end.isoformat() if end else None,
+            })
+        except Exception as e:
+            logger.error(f"一括精算の対象取得失敗: {e}")
+            await interaction.followup.send(
+                f"❌ スプレッドシートの読み込みに失敗しました。\n```{e}```",
+                ephemeral=True,
+            )
+            return
+        entries = result["entries"]
+
+        if not entries:
+            await interaction.followup.send(
+                f"該当する未処理の行はありません（{column.value}）。",
+                ephemeral=True,
+            )
+            return
+
+        total = sum(e["expense"] for e in entries)
+        embed = discord.Embed(
+            title=f"🧾 一括更新の確認: {column.value} → {value}（{target.name}）",
+            description=f"**{len(entries)}件** / 出金合計 **¥{total:,}**",
+            color=discord.Color.orange(),
+        )
+        # 年度シートの切り替え直後は前年度のシートの行も含まれるので、その場合はシート名も表示する
+        show_sheet = len({e["sheet"] for e in entries}) > 1
+        lines = [
+            f"{e['sheet'] + ' ' if show_sheet else ''}行{e['row']}: {e['date_str']} {e['payer']} ¥{e['expense']:,}"
+            for e in entries[:20]
+        ]
+        if len(entries) > 20:
+            lines.append(f"…ほか{len(entries) - 20}件")
+        embed.add_field(name="対象", value="\n".join(lines), inline=False)
+        embed.set_footer(text="「実行」を押すとまとめて書き込みます")
+
+        view = SettleConfirmView(self, target.name, entries, column.value, value)
+        await interaction.followup.send(embed=embed, view=view, ephemeral=True)
+
+    @staticmethod
+    def _is_treasurer(interaction: discord.Interaction) -> bool:
+        """会計担当ロール（TREASURER_ROLE）またはサーバー管理権限を持つか"""
+        user = interaction.user
+        permissions = getattr(user, "guild_permissions", None)
+        if permissions and permissions.manage_guild:
+            return True
+        if config.TREASURER_ROLE:
+            return any(role.name == config.TREASURER_ROLE for role in getattr(user, "roles", []))
+        return False
+
+    # -----------------------------------------------------------------
+    #  スラッシュコマンド: /エクスポート （期間で絞り込んだ台帳を CSV / XLSX で出力）
+    # -----------------------------------------------------------------
+    @app_commands.command(name="エクスポート", description="台帳を期間で絞り込んで CSV / Excel で出力します（会計担当者用）")
+    @app_commands.rename(
+        date_from="開始日",
+        date_to="終了日",
+        fmt="形式",
+        include_links="レシートリンク",
+        sheet_name="シート",
+    )
+    @app_commands.describe(
+        date_from="この日付以降の支払日（例: 2026/04/01）",
+        date_to="この日付以前の支払日（例: 2027/03/31）",
+        fmt="出力形式（省略時は CSV）",
+        include_links="レシート画像（Google Drive）のリンク列を含める",
+        sheet_name="読み出すシート名（省略時は期間に重なる年度のシートすべて）",
+    )
+    @app_commands.choices(fmt=[
+        app_commands.Choice(name="CSV", value="csv"),
+        app_commands.Choice(name="Excel (xlsx)", value="xlsx"),
+    ])
+    async def export(
+        self,
+        interaction: discord.Interaction,
+        date_from: str | None = None,
+        date_to: str | None = None,
+        fmt: app_commands.Choice[str] | None = None,
+        include_links: bool = False,
+        sheet_name: str | None = None,
+    ):
+        if not self._is_treasurer(interaction):
+            await interaction.response.send_message(
+                "❌ このコマンドは会計担当者のみ使用できます。",
+                ephemeral=True,
+            )
+            return
+        target = self.resolve_target(interaction)
+        if target is None:
+            await interaction.response.send_message(
+                NO_TARGET_MESSAGE,
+                ephemeral=True,
+            )
+            return
+
+        start = parse_sheet_date(date_from) if date_from else None
+        end = parse_sheet_date(date_to) if date_to else None
+        if (date_from and not start) or (date_to and not end):
+            await interaction.response.send_message(
+                "❌ 日付が正しくありません。例: 2026/02/08",
+                ephemeral=True,
+            )
+            return
+
+        file_format = fmt.value if fmt else "csv"
+        await interaction.response.defer(ephemeral=True)
+        try:
+            result = await self.run_job("export", {
+                "target": target.name,
+                "format": file_format,
+                "date_from": start.isoformat() if start else None,
+                "date_to": end.isoformat() if end else None,
+                "include_links": include_links,
+                "sheet_name": sheet_name,
+            })
+        except Exception as e:
+            logger.error(f"台帳エクスポート失敗: {e}")
+            await interaction.followup.send(
+                f"❌ 台帳の出力に失敗しました。\n```{e}```",
+                ephemeral=True,
+            )
+            return
+
+        path = result["path"]
+        try:
+            period = f"{start or '最初'} 〜 {end or '最後'}"
+            if result["rows"] == 0:
+                await interaction.followup.send(
+                    f"該当する行はありません（{period}）。",
+                    ephemeral=True,
+                )
+                return
+            if result["size"] > config.EXPORT_MAX_UPLOAD_BYTES:
+                await interaction.followup.send(
+                    f"❌ ファイルが大きすぎるため添付できません（{result['size'] / 1024 / 1024:.1f}MB）。\n"
+                    "期間を短くするか、サーバー上で `python export_ledger.py` を実行してください。",
+                    ephemeral=True,
+                )
+                return
+            filename = f"{target.name}_{start or 'all'}_{end or 'all'}.{file_format}"
+            await interaction.followup.send(
+                f"📤 台帳を出力しました: **{result['rows']}行**（{period}）",
+                file=discord.File(path, filename=filename),
+                ephemeral=True,
+            )
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    # -----------------------------------------------------------------
+    #  スラッシュコマンド: /残高再計算 （手作業の修正後に差引残高を修復）
+    # -----------------------------------------------------------------
+    @app_commands.command(name="残高再計算", description="入金・出金から差引残高を計算し直して修正します（会計担当者用）")
+    async def recompute_balances(self, interaction: discord.Interaction):
+        if not self._is_treasurer(interaction):
+            await interaction.response.send_message(
+                "❌ このコマンドは会計担当者のみ使用できます。",
+                ephemeral=True,
+            )
+            return
+        target = self.resolve_target(interaction)
+        if target is None:
+            await interaction.response.send_message(
+                NO_TARGET_MESSAGE,
+                ephemeral=True,
+            )
+            return
+
+        # まず書き込まずに確認し、修正が必要なら確認ボタンを表示する
+        await interaction.response.defer(ephemeral=True)
+        try:
+            result = await self.run_job("recompute_balances", {
+                "target": target.name,
+                "dry_run": True,
+            })
+        except Exception as e:
+            logger.error(f"差引残高の再計算失敗: {e}")
+            await interaction.followup.send(
+                f"❌ 差引残高の再計算に失敗しました。\n```{e}```",
+                ephemeral=True,
+            )
+            return
+
+        if result["changed"] == 0:
+            await interaction.followup.send(
+                f"✅ 差引残高はすべて正しく計算されています（{result['rows']}行、最終残高 ¥{result['new_balance']:,}）。",
+                ephemeral=True,
+            )
+            return
+
+        embed = recompute_embed(result, dry_run=True)
+        embed.set_footer(text="「修正する」を押すと差引残高を書き直します（5分以内）")
+        view = RecomputeConfirmView(self, target.name)
+        await interaction.followup.send(embed=embed, view=view, ephemeral=True)
+
     # -----------------------------------------------------------------
     #  スラッシュコマンド: /会計ヘルプ
     # -----------------------------------------------------------------
@@ -376,10 +1185,11 @@ class AccountingCog(commands.Cog, name="会計申請"):
             title="📋 会計申請ボットの使い方",
             color=discord.Color.gold(),
         )
+        channels = "、".join(f"**{label}**" for label in self.router.channel_labels(interaction.guild_id))
         embed.add_field(
             name="方法1: レシート画像を送信",
             value=(
-                f"**#{config.CHANNEL_NAME}** チャンネルにレシート画像を送信すると、\n"
+                f"{channels or '受付'} チャンネルにレシート画像を送信すると、\n"
                 "自動でOCR解析し、申請フォームを表示します。\n"
                 "フォームにはOCR結果がプレフィルされます。"
             ),
@@ -393,6 +1203,31 @@ class AccountingCog(commands.Cog, name="会計申請"):
             ),
             inline=False,
         )
+        embed.add_field(
+            name="/精算 コマンド（会計担当者用）",
+            value=(
+                "立て替えた人・支払日の範囲で未処理の申請を絞り込み、\n"
+                "会計Check / 精算 列をまとめて「済」にします。"
+            ),
+            inline=False,
+        )
+        embed.add_field(
+            name="/エクスポート コマンド（会計担当者用）",
+            value=(
+                "支払日の範囲で絞り込んだ台帳を CSV / Excel で出力します。\n"
+                "レシート画像のリンク列も含められます。"
+            ),
+            inline=False,
+        )
+        embed.add_field(
+            name="/残高再計算 コマンド（会計担当者用）",
+            value=(
+                "シートを手作業で修正した後に、入金・出金から差引残高を計算し直し、\n"
+                "修正が必要な行数を表示します。「修正する」を押すと値が違うセルだけを修正します。\n"
+                f"勘定科目が「{SheetsService.OPENING_CATEGORY}」の行は書き換えず、その残高から数え直します。"
+            ),
+            inline=False,
+        )
         embed.add_field(
             name="入力項目",
             value=(
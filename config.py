@@ -9,15 +9,93 @@ load_dotenv()
 # ===== Discord =====
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN", "")
 CHANNEL_NAME = os.getenv("CHANNEL_NAME", "会計申請")
+# /精算 コマンドを使えるロール名（空の場合は「サーバー管理」権限を持つメンバーのみ）
+TREASURER_ROLE = os.getenv("TREASURER_ROLE", "会計")
+
+# ===== 複数台帳のルーティング =====
+# サーバー/チャンネルごとの書き込み先を定義した JSON ファイル（空の場合は下記の単一設定を使う）
+ROUTES_FILE = os.getenv("ROUTES_FILE", "")
+
+# ===== ワーカーモード =====
+# 1 にすると OCR・Drive・Sheets の処理を worker.py のワーカープロセスに任せる
+WORKER_MODE = os.getenv("WORKER_MODE", "0") == "1"
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "2"))
+# ゲートウェイとワーカーが共有するジョブキュー（SQLite ファイル）
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "jobs.sqlite3")
+# ジョブ完了を待つ最大秒数
+JOB_TIMEOUT = int(os.getenv("JOB_TIMEOUT", "120"))
+
+# ===== トレーシング =====
+# 申請ごとの処理時間を記録する JSONL ファイル（空の場合は記録しない）。集計は trace_report.py
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+# ファイルがこの大きさを超えたら切り替え、古いファイルを TRACE_BACKUP_COUNT 世代まで残す
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(10 * 1024 * 1024)))
+TRACE_BACKUP_COUNT = int(os.getenv("TRACE_BACKUP_COUNT", "3"))
 
 # ===== Google Cloud =====
 GOOGLE_CREDENTIALS_FILE = os.getenv("GOOGLE_CREDENTIALS_FILE", "credentials.json")
+# 1 にすると、申請の Drive アップロード・Sheets 書き込みを aiohttp で非同期に行う
+# （Bot と同じコネクションプールを使う。services/google_rest.py）。0 は googleapiclient を別スレッドで呼び出す
+GOOGLE_ASYNC_HTTP = os.getenv("GOOGLE_ASYNC_HTTP", "0") == "1"
+# 非同期で同時に送る Google API リクエストの上限
+GOOGLE_HTTP_MAX_CONNECTIONS = int(os.getenv("GOOGLE_HTTP_MAX_CONNECTIONS", "16"))
+
+# ===== OCR =====
+# vision / vision+tesseract / tesseract+vision / tesseract（詳細は services/ocr.py）
+OCR_MODE = os.getenv("OCR_MODE", "vision")
+# tesseract+vision のとき、この信頼度（0〜1）未満なら Vision API に回す
+OCR_CONFIDENCE_THRESHOLD = float(os.getenv("OCR_CONFIDENCE_THRESHOLD", "0.6"))
+TESSERACT_LANG = os.getenv("TESSERACT_LANG", "jpn")
+TESSERACT_PROCESSES = int(os.getenv("TESSERACT_PROCESSES", "2"))
+TESSERACT_CMD = os.getenv("TESSERACT_CMD", "")  # tesseract 実行ファイルのパス（PATH にない場合）
+# 1枚の写真に並べて撮った複数のレシートを切り分ける上限（Vision API のみ。1 で切り分けない）
+MAX_RECEIPTS_PER_IMAGE = int(os.getenv("MAX_RECEIPTS_PER_IMAGE", "5"))
+
+# 店名 → 使用用途・勘定科目 の学習結果を保存するファイル（空の場合は保存しない）
+MERCHANT_INDEX_FILE = os.getenv("MERCHANT_INDEX_FILE", "merchants.json")
+
+# レシート解析の受付制御
+OCR_MAX_IN_FLIGHT = int(os.getenv("OCR_MAX_IN_FLIGHT", "4"))  # 同時に解析する画像の数
+OCR_QUEUE_SIZE = int(os.getenv("OCR_QUEUE_SIZE", "20"))  # 解析を待てる画像の数（超えたら受け付けない）
+OCR_USER_RATE_PER_MINUTE = float(os.getenv("OCR_USER_RATE_PER_MINUTE", "6"))  # 1人あたりの受付数（毎分）
+OCR_USER_BURST = int(os.getenv("OCR_USER_BURST", "5"))  # 1人が続けて送れる画像の数
+
+# OCR の前に画像がレシートらしいかを手元で判定する
+#   confirm: レシートらしくない画像は、OCR する前に確認ボタンを表示する
+#   skip:    レシートらしくない画像は何もしない（ログにだけ記録）
+#   off:     判定しない（すべて OCR）
+PREFILTER_MODE = os.getenv("PREFILTER_MODE", "confirm")
+PREFILTER_THRESHOLD = float(os.getenv("PREFILTER_THRESHOLD", "0.45"))  # これ未満のスコアはレシートではないとみなす
 
 # ===== Google Spreadsheet =====
 SPREADSHEET_ID = os.getenv("SPREADSHEET_ID", "")
 SHEET_GID = int(os.getenv("SHEET_GID", "0"))
 SHEET_NAME = os.getenv("SHEET_NAME", "")  # シート名を直接指定（xlsx対応用）
+# 年度ごとにシートを分ける（1 で有効）。新年度の最初の書き込み時に前年度の残高を繰り越したシートを作る
+FISCAL_YEAR_ROLLOVER = os.getenv("FISCAL_YEAR_ROLLOVER", "0") == "1"
+FISCAL_YEAR_START_MONTH = int(os.getenv("FISCAL_YEAR_START_MONTH", "4"))
+FISCAL_SHEET_NAME_FORMAT = os.getenv("FISCAL_SHEET_NAME_FORMAT", "{year}年度")
+FISCAL_SHEET_ROWS = int(os.getenv("FISCAL_SHEET_ROWS", "2000"))  # 年度シートを作成時に確保する行数
+# 一括精算で使う台帳インデックスの有効期間（秒）。手作業の編集を取り込むため定期的に作り直す
+LEDGER_INDEX_TTL = int(os.getenv("LEDGER_INDEX_TTL", "300"))
 
 # ===== Google Drive =====
 # レシート画像を保存するGoogle DriveフォルダのID（空の場合はアップロードしない）
 DRIVE_FOLDER_ID = os.getenv("DRIVE_FOLDER_ID", "")
+
+# ===== エクスポート =====
+# 台帳を読み出すときの1回あたりの行数
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))
+# Discord に添付できるファイルサイズの上限（バイト）。超える場合は export_ledger.py を使う
+EXPORT_MAX_UPLOAD_BYTES = int(os.getenv("EXPORT_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+
+# ===== HTTP 受付（Discord を使わない申請。services/ingest_server.py） =====
+# ポート番号（0 の場合は起動しない）。INGEST_TOKEN の設定が必須
+INGEST_PORT = int(os.getenv("INGEST_PORT", "0"))
+INGEST_HOST = os.getenv("INGEST_HOST", "127.0.0.1")
+INGEST_TOKEN = os.getenv("INGEST_TOKEN", "")
+# アップロードされた画像の一時保存先（空の場合は OS の一時ディレクトリ）と上限サイズ（バイト）
+INGEST_UPLOAD_DIR = os.getenv("INGEST_UPLOAD_DIR", "")
+INGEST_MAX_UPLOAD_BYTES = int(os.getenv("INGEST_MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+# 終了したジョブの結果を保持する秒数
+INGEST_JOB_TTL = int(os.getenv("INGEST_JOB_TTL", "3600"))
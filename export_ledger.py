@@ -0,0 +1,81 @@
+"""
+台帳エクスポート - 期間で絞り込んだ台帳を CSV / XLSX に書き出す（監査用の抽出など）
+
+    python export_ledger.py --from 2026/04/01 --to 2027/03/31 -o 2026年度.xlsx
+    python export_ledger.py --target 本部 --links > ledger.csv
+
+シートは EXPORT_CHUNK_ROWS 行ずつ読み出して書き出すため、台帳が大きくてもメモリ使用量は一定。
+Discord の添付サイズ上限を超える場合もこちらを使う。
+"""
+import argparse
+import logging
+import shutil
+import sys
+import tempfile
+
+import config
+from services.export import FORMATS, export_ledger
+from services.ledger_index import parse_sheet_date
+from services.routing import DEFAULT_TARGET, LedgerRouter, ServicePool
+
+# 標準出力に書き出す XLSX をメモリに置く上限（超えたら一時ファイルに移る）
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+
+def _date_arg(value: str):
+    parsed = parse_sheet_date(value)
+    if parsed is None:
+        raise argparse.ArgumentTypeError(f"日付が正しくありません: {value}（例: 2026/02/08）")
+    return parsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="台帳を期間で絞り込んで CSV / XLSX に書き出す")
+    parser.add_argument("--target", default=None, help=f"台帳名（ROUTES_FILE の name。省略時は {DEFAULT_TARGET} または先頭の台帳）")
+    parser.add_argument("--from", dest="date_from", type=_date_arg, help="この日付以降の支払日")
+    parser.add_argument("--to", dest="date_to", type=_date_arg, help="この日付以前の支払日")
+    parser.add_argument("--format", choices=FORMATS, help="出力形式（省略時は出力ファイルの拡張子、なければ csv）")
+    parser.add_argument("--links", action="store_true", help="レシート画像（Google Drive）のリンク列を含める")
+    parser.add_argument("--sheet", default=None, help="読み出すシート名（省略時は期間に重なる年度のシートすべて）")
+    parser.add_argument("-o", "--output", default="-", help="出力ファイル（省略時は標準出力）")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+        stream=sys.stderr,
+    )
+
+    fmt = args.format
+    if fmt is None:
+        fmt = "xlsx" if args.output.lower().endswith(".xlsx") else "csv"
+
+    router = LedgerRouter.from_config()
+    target = args.target or router.default_target_name
+    if target not in router.targets:
+        print(f"台帳が見つかりません: {target}（{', '.join(router.targets)}）", file=sys.stderr)
+        raise SystemExit(1)
+    sheets = ServicePool(router).sheets(target)
+    if sheets is None:
+        print("Google Sheets に接続できませんでした", file=sys.stderr)
+        raise SystemExit(1)
+
+    rows = sheets.iter_ledger(config.EXPORT_CHUNK_ROWS, args.date_from, args.date_to, args.sheet)
+    options = (fmt, args.date_from, args.date_to, args.links)
+    if args.output != "-":
+        with open(args.output, "wb") as fp:
+            count = export_ledger(rows, fp, *options)
+    elif fmt == "csv":
+        count = export_ledger(rows, sys.stdout.buffer, *options)
+    else:
+        # XLSX（zip）は書き出し中にシークが必要なため、一旦スプールしてから標準出力へ流す
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as fp:
+            count = export_ledger(rows, fp, *options)
+            fp.seek(0)
+            shutil.copyfileobj(fp, sys.stdout.buffer)
+    sys.stdout.flush()
+    print(f"{count}行を書き出しました", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+オフライン負荷試験 - フェイクバックエンドで N 人の同時申請をシミュレートする
+
+実際の AccountingCog（on_message → AccountingModal.on_submit）を、
+services/fakes.py のフェイク API と Discord オブジェクトの代役で動かし、
+レイテンシ分布・申請あたりの API 呼び出し回数・差引残高の整合性を表示する。
+ネットワーク接続は不要。
+
+    python loadtest.py --users 10 --receipts 5 --sheets-latency 0.05
+"""
+import argparse
+import asyncio
+import logging
+import time
+from types import SimpleNamespace
+
+import config
+from cogs.accounting import AccountingCog, AccountingModal
+from services.drive import DriveService
+from services.fakes import FakeDriveAPI, FakeSheetsAPI, FakeVisionClient
+from services.sheets import SheetsService
+from services.vision import VisionService
+
+logger = logging.getLogger("loadtest")
+
+
+# =============================================================================
+#  Discord オブジェクトの代役（Cog が使う属性・メソッドだけを持つ）
+# =============================================================================
+class FakeUser:
+    def __init__(self, name: str):
+        self.id = id(self)
+        self.name = name
+        self.display_name = name
+        self.bot = False
+
+    def __str__(self):
+        return self.name
+
+
+class FakeSentMessage:
+    """reply() / followup.send() で送信されたメッセージ"""
+
+    def __init__(self, content=None, embed=None, view=None):
+        self.content = content
+        self.embed = embed
+        self.view = view
+
+    async def edit(self, content=None, embed=None, view=None, **kwargs):
+        self.content = content
+        self.embed = embed
+        self.view = view
+
+
+class FakeAttachment:
+    def __init__(self, data: bytes, filename: str = "receipt.png"):
+        self._data = data
+        self.filename = filename
+        self.size = len(data)
+        self.content_type = "image/png"
+        self.url = f"https://cdn.example.invalid/{filename}"
+
+    async def read(self) -> bytes:
+        return self._data
+
+
+class FakeMessage:
+    def __init__(self, author: FakeUser, channel_name: str, attachments: list[FakeAttachment]):
+        self.author = author
+        self.channel = SimpleNamespace(name=channel_name, id=0)
+        self.guild = None
+        self.attachments = attachments
+        self.replies: list[FakeSentMessage] = []
+
+    async def reply(self, content=None, **kwargs) -> FakeSentMessage:
+        sent = FakeSentMessage(content=content, **kwargs)
+        self.replies.append(sent)
+        return sent
+
+
+class FakeResponse:
+    async def defer(self, **kwargs):
+        pass
+
+    async def send_message(self, *args, **kwargs):
+        pass
+
+
+class FakeFollowup:
+    def __init__(self):
+        self.sent: list[FakeSentMessage] = []
+
+    async def send(self, content=None, embed=None, **kwargs):
+        self.sent.append(FakeSentMessage(content=content, embed=embed))
+
+
+class FakeInteraction:
+    def __init__(self, user: FakeUser):
+        self.user = user
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+
+
+# =============================================================================
+#  シミュレーション本体
+# =============================================================================
+def percentile(values: list[float], p: float) -> float:
+    """最近傍法によるパーセンタイル"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[k]
+
+
+async def simulate_user(
+    cog: AccountingCog,
+    user: FakeUser,
+    receipts: int,
+    think_time: float,
+    latencies: dict[str, list[float]],
+    failures: list[str],
+):
+    """1ユーザー分: レシート投稿 → フォーム送信 を receipts 回繰り返す"""
+    for i in range(receipts):
+        message = FakeMessage(
+            user,
+            config.CHANNEL_NAME,
+            [FakeAttachment(b"\x89PNG fake receipt " + user.name.encode(), f"{user.name}_{i}.png")],
+        )
+
+        t0 = time.perf_counter()
+        await cog.on_message(message)
+        t1 = time.perf_counter()
+
+        view = message.replies[-1].view if message.replies else None
+        if view is None:
+            failures.append(f"{user.name}#{i}: 解析結果のビューが表示されませんでした")
+            continue
+
+        if think_time:
+            await asyncio.sleep(think_time)
+
+        # ConfirmView.open_form と同じデフォルト値でモーダルを作り、そのまま送信する
+        data = cog.pending.get(view.submission_id, {})
+        defaults = dict(data.get("ocr_data", {}))
+        defaults["payer"] = user.display_name
+        modal = AccountingModal(cog, view.submission_id, defaults)
+        interaction = FakeInteraction(user)
+        for item in (modal.date_input, modal.category_input, modal.payer_input, modal.purpose_input, modal.amount_input):
+            item._refresh_state(interaction, {"value": item.default or ""})
+
+        t2 = time.perf_counter()
+        await modal.on_submit(interaction)
+        t3 = time.perf_counter()
+
+        sent = interaction.followup.sent[-1] if interaction.followup.sent else None
+        if sent is None or sent.embed is None:
+            failures.append(f"{user.name}#{i}: {sent.content if sent else '応答なし'}")
+            continue
+
+        latencies["on_message"].append(t1 - t0)
+        latencies["on_submit"].append(t3 - t2)
+        latencies["total"].append((t1 - t0) + (t3 - t2))
+
+
+def check_balances(sheets_api: FakeSheetsAPI, sheet_title: str) -> list[str]:
+    """シート上の差引残高が入金・出金の累積と一致するか確認する"""
+    problems = []
+    rows = sheets_api.sheets[sheet_title]["values"][1:]
+    balance = 0
+    for i, row in enumerate(rows, start=2):
+        row = row + [""] * (11 - len(row))
+        income = int(row[6] or 0)
+        expense = int(row[7] or 0)
+        balance += income - expense
+        if str(balance) != row[8]:
+            problems.append(f"行{i}: 差引残高 {row[8]} (期待値 {balance})")
+    return problems
+
+
+async def run(args) -> int:
+    sheets_api = FakeSheetsAPI(
+        header=SheetsService.COLUMNS,
+        row_count=args.row_count,
+        latency=args.sheets_latency,
+        jitter=args.jitter,
+        quota_per_minute=args.quota,
+    )
+    drive_api = FakeDriveAPI(latency=args.drive_latency, jitter=args.jitter)
+    vision_client = FakeVisionClient(latency=args.vision_latency, jitter=args.jitter)
+
+    config.MERCHANT_INDEX_FILE = ""  # 店名辞書はメモリ上だけで使う（実運用の辞書を汚さない）
+    config.PREFILTER_MODE = "off"  # ダミーの画像データは判定できないため
+    # 受付制御: 同時実行数・待ち行列は指定どおり、ユーザーごとの頻度制限では落とさない
+    config.OCR_MAX_IN_FLIGHT = args.max_in_flight
+    config.OCR_QUEUE_SIZE = args.queue_size
+    config.OCR_USER_BURST = max(config.OCR_USER_BURST, args.receipts)
+    # フェイクは非同期クライアントとしても使える（GOOGLE_ASYNC_HTTP=1 相当）
+    async_google = not args.sync_google
+    sheets_service = SheetsService(
+        service=sheets_api,
+        drive_service=drive_api,
+        async_service=sheets_api if async_google else None,
+    )
+    cog = AccountingCog(
+        bot=None,
+        vision_service=VisionService(client=vision_client),
+        sheets_service=sheets_service,
+        drive_service=DriveService(
+            service=drive_api,
+            folder_id="fake-folder",
+            async_service=drive_api if async_google else None,
+        ),
+    )
+    # 初期化時の呼び出し（シート名解決など）は申請あたりの回数に含めない
+    sheets_api.calls.clear()
+    drive_api.calls.clear()
+
+    latencies: dict[str, list[float]] = {"on_message": [], "on_submit": [], "total": []}
+    failures: list[str] = []
+    users = [FakeUser(f"user{n:02d}") for n in range(args.users)]
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        simulate_user(cog, user, args.receipts, args.think_time, latencies, failures)
+        for user in users
+    ))
+    elapsed = time.perf_counter() - started
+
+    completed = len(latencies["total"])
+    print(f"\n===== 負荷試験結果 ({args.users}ユーザー × {args.receipts}件) =====")
+    print(f"完了: {completed}件 / 失敗: {len(failures)}件 / 所要時間: {elapsed:.2f}秒"
+          f" ({completed / elapsed if elapsed else 0:.1f}件/秒)")
+
+    print("\nレイテンシ (ms)      p50      p95      p99      max")
+    for stage, values in latencies.items():
+        print(
+            f"  {stage:<14}"
+            + "".join(f"{percentile(values, p) * 1000:9.1f}" for p in (50, 95, 99, 100))
+        )
+
+    print("\nAPI 呼び出し回数（申請あたり）")
+    for label, backend in (("Sheets", sheets_api), ("Drive", drive_api), ("Vision", vision_client)):
+        per = backend.total_calls() / completed if completed else 0
+        detail = ", ".join(f"{k}={v}" for k, v in sorted(backend.calls.items()))
+        print(f"  {label:<7}{per:6.2f}  ({detail or 'なし'})")
+
+    problems = check_balances(sheets_api, sheets_service.sheet_name)
+    rows = len(sheets_api.sheets[sheets_service.sheet_name]["values"]) - 1
+    print(f"\n差引残高の整合性: 書き込み行数={rows} (期待値 {completed})")
+    if problems or rows != completed:
+        for p in problems[:10]:
+            print(f"  ✗ {p}")
+        print("  ✗ 不整合あり")
+    else:
+        print("  ✓ すべての行で一致")
+
+    for f in failures[:10]:
+        print(f"  失敗: {f}")
+
+    return 1 if problems or rows != completed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="フェイクバックエンドによるオフライン負荷試験")
+    parser.add_argument("--users", type=int, default=10, help="同時ユーザー数")
+    parser.add_argument("--receipts", type=int, default=5, help="ユーザーあたりの申請数")
+    parser.add_argument("--think-time", type=float, default=0.0, help="解析結果表示からフォーム送信までの待ち時間（秒）")
+    parser.add_argument("--sheets-latency", type=float, default=0.05, help="Sheets API 1回あたりの遅延（秒）")
+    parser.add_argument("--drive-latency", type=float, default=0.1, help="Drive API 1回あたりの遅延（秒）")
+    parser.add_argument("--vision-latency", type=float, default=0.3, help="Vision API 1回あたりの遅延（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="遅延に加える一様乱数の最大値（秒）")
+    parser.add_argument("--quota", type=int, default=None, help="Sheets API の1分あたりの上限回数")
+    parser.add_argument("--row-count", type=int, default=1000, help="シートの初期行数")
+    parser.add_argument("--max-in-flight", type=int, default=config.OCR_MAX_IN_FLIGHT, help="同時に解析する画像の数")
+    parser.add_argument("--queue-size", type=int, default=config.OCR_QUEUE_SIZE, help="解析を待てる画像の数")
+    parser.add_argument("--sync-google", action="store_true", help="Drive / Sheets を同期クライアントで呼び出す（GOOGLE_ASYNC_HTTP=0 相当）")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Bot のログを表示する")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    )
+    raise SystemExit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
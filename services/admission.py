@@ -0,0 +1,163 @@
+"""
+受付制御 - レシート解析（ダウンロード・判定・OCR）の同時実行数を抑える
+
+    ユーザーごとのトークンバケット   1人が短時間に大量の画像を送った場合は受け付けない
+    全体の同時実行数の上限           同時に解析する画像は max_in_flight 件まで
+    上限付きの FIFO 待ち行列          あふれた分は到着順に待たせ、待ち行列も満杯なら受け付けない
+
+待っている間は on_position コールバックで順番（1 始まり）を通知する。
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionError(Exception):
+    """受け付けられなかった（retry_after 秒後には受け付けられる見込み。0 は不明）"""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """capacity 個まで貯まり、毎秒 rate 個ずつ回復するトークン"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> float:
+        """トークンを1つ使う。足りなければ使わずに、次の1つが貯まるまでの秒数を返す"""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    @property
+    def full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class _Waiter:
+    def __init__(self, future: asyncio.Future, on_position: Callable[[int], None] | None):
+        self.future = future
+        self.on_position = on_position
+
+
+class AdmissionController:
+    """トークンバケット（ユーザーごと）+ 同時実行数の上限 + 上限付き FIFO 待ち行列"""
+
+    # これを超えたら、満杯（しばらく使われていない）のバケットを捨てる
+    MAX_BUCKETS = 1000
+
+    def __init__(
+        self,
+        max_in_flight: int = 4,
+        queue_size: int = 20,
+        user_rate_per_minute: float = 6,
+        user_burst: int = 5,
+    ):
+        self.max_in_flight = max_in_flight
+        self.queue_size = queue_size
+        self.user_rate = user_rate_per_minute / 60
+        self.user_burst = user_burst
+        self.in_flight = 0
+        self._waiters: deque[_Waiter] = deque()
+        self._buckets: dict[int, TokenBucket] = {}
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    # -----------------------------------------------------------------
+    #  ユーザーごとの受付頻度
+    # -----------------------------------------------------------------
+    def check_user(self, user_id: int) -> None:
+        """
+        ユーザーのトークンを1つ使う
+
+        Raises:
+            AdmissionError: 短時間に送信しすぎている
+        """
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= self.MAX_BUCKETS:
+                self._buckets = {uid: b for uid, b in self._buckets.items() if not b.full}
+            bucket = self._buckets[user_id] = TokenBucket(self.user_rate, self.user_burst)
+        retry_after = bucket.take()
+        if retry_after:
+            logger.info(f"受付制限: user={user_id} 次の受付まで {retry_after:.0f}秒")
+            raise AdmissionError("短時間に送信された画像が多すぎます", retry_after)
+
+    # -----------------------------------------------------------------
+    #  同時実行数と待ち行列
+    # -----------------------------------------------------------------
+    async def acquire(self, on_position: Callable[[int], None] | None = None) -> None:
+        """
+        実行枠を1つ確保する（空きがなければ待ち行列に並ぶ）
+
+        on_position は並んだとき・順番が進んだときに順番（1 始まり）を引数に呼ばれる。
+
+        Raises:
+            AdmissionError: 待ち行列が満杯
+        """
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            logger.warning(f"受付制限: 待ち行列が満杯です ({self.queue_size}件)")
+            raise AdmissionError("現在混み合っています")
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), on_position)
+        self._waiters.append(waiter)
+        logger.info(f"待ち行列に追加: {len(self._waiters)}番目 (実行中 {self.in_flight}件)")
+        if on_position:
+            on_position(len(self._waiters))
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release()  # 枠を譲られた直後に取り消された
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._notify_positions()
+            raise
+
+    def release(self) -> None:
+        """実行枠を返す（待っている先頭に譲る）"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.future.done():
+                waiter.future.set_result(None)  # 枠はそのまま譲るので in_flight は変えない
+                self._notify_positions()
+                return
+        self.in_flight -= 1
+
+    def _notify_positions(self) -> None:
+        for position, waiter in enumerate(self._waiters, start=1):
+            if waiter.on_position:
+                waiter.on_position(position)
+
+    @asynccontextmanager
+    async def slot(self, on_position: Callable[[int], None] | None = None):
+        """acquire() ～ release() を行うコンテキストマネージャ"""
+        await self.acquire(on_position)
+        try:
+            yield
+        finally:
+            self.release()
@@ -1,11 +1,12 @@
 """
 Google Drive サービス - レシート画像のアップロード
 """
+import asyncio
 import logging
 from datetime import datetime
-from googleapiclient.discovery import build
 from googleapiclient.http import MediaInMemoryUpload
-from services.google_auth import get_credentials
+from services.google_auth import build_service
+from services.tracing import traced_execute, traced_execute_async
 import config
 
 logger = logging.getLogger(__name__)
@@ -14,12 +15,14 @@ logger = logging.getLogger(__name__)
 class DriveService:
     """Google Drive にレシート画像をアップロードする"""
 
-    def __init__(self):
-        self.enabled = bool(config.DRIVE_FOLDER_ID)
+    def __init__(self, service=None, folder_id: str | None = None, async_service=None):
+        # async_service はアップロードを非同期で行うクライアント（services/google_rest.py の AsyncDriveApi）
+        self.async_service = async_service
+        self.folder_id = config.DRIVE_FOLDER_ID if folder_id is None else folder_id
+        self.enabled = bool(self.folder_id)
         if self.enabled:
-            credentials = get_credentials()
-            self.service = build("drive", "v3", credentials=credentials)
-            logger.info(f"Google Drive 接続完了 (フォルダID: {config.DRIVE_FOLDER_ID})")
+            self.service = service or build_service("drive", "v3")
+            logger.info(f"Google Drive 接続完了 (フォルダID: {self.folder_id})")
         else:
             self.service = None
             logger.info("DRIVE_FOLDER_ID 未設定のため、画像アップロードは無効です")
@@ -38,33 +41,59 @@ class DriveService:
         """
         if not self.enabled:
             return ""
+        filename = filename or self._default_filename()
+        try:
+            file = traced_execute(
+                "drive.files.create",
+                self._create_request(self.service, image_bytes, filename, mimetype),
+            )
+        except Exception as e:
+            logger.error(f"画像アップロード失敗: {e}")
+            raise
+        return self._uploaded(file, filename)
 
-        if not filename:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"receipt_{timestamp}.png"
+    async def upload_image_async(
+        self,
+        image_bytes: bytes,
+        filename: str | None = None,
+        mimetype: str = "image/png",
+    ) -> str:
+        """upload_image の非同期版（async_service がなければ upload_image を別スレッドで呼ぶ）"""
+        if not self.enabled:
+            return ""
+        if self.async_service is None:
+            return await asyncio.to_thread(self.upload_image, image_bytes, filename, mimetype)
+        filename = filename or self._default_filename()
+        try:
+            file = await traced_execute_async(
+                "drive.files.create",
+                self._create_request(self.async_service, image_bytes, filename, mimetype),
+            )
+        except Exception as e:
+            logger.error(f"画像アップロード失敗: {e}")
+            raise
+        return self._uploaded(file, filename)
+
+    @staticmethod
+    def _default_filename() -> str:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        return f"receipt_{timestamp}.png"
 
+    def _create_request(self, service, image_bytes: bytes, filename: str, mimetype: str):
         file_metadata = {
             "name": filename,
-            "parents": [config.DRIVE_FOLDER_ID],
+            "parents": [self.folder_id],
         }
 
         media = MediaInMemoryUpload(image_bytes, mimetype=mimetype)
+        return service.files().create(
+            body=file_metadata,
+            media_body=media,
+            fields="id, webViewLink",
+        )
 
-        try:
-            file = (
-                self.service.files()
-                .create(
-                    body=file_metadata,
-                    media_body=media,
-                    fields="id, webViewLink",
-                )
-                .execute()
-            )
-
-            web_link = file.get("webViewLink", "")
-            logger.info(f"画像アップロード完了: {filename} -> {web_link}")
-            return web_link
-
-        except Exception as e:
-            logger.error(f"画像アップロード失敗: {e}")
-            raise
+    @staticmethod
+    def _uploaded(file: dict, filename: str) -> str:
+        web_link = file.get("webViewLink", "")
+        logger.info(f"画像アップロード完了: {filename} -> {web_link}")
+        return web_link
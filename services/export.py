@@ -0,0 +1,122 @@
+"""
+台帳エクスポート - 期間で絞り込んだ台帳を CSV / XLSX に書き出す
+
+シートは SheetsService.iter_rows で一定行数ずつ読み、1行ずつ絞り込んで
+ファイルに書き出すため、台帳の大きさによらずメモリ使用量は一定。
+XLSX の書き出しには openpyxl（write_only モード）が必要。未インストールの場合は CSV のみ。
+"""
+import csv
+import io
+import logging
+from datetime import date
+from typing import BinaryIO, Iterable
+
+from services.ledger_index import COL_DATE, parse_amount, parse_sheet_date
+from services.sheets import SheetsService
+
+logger = logging.getLogger(__name__)
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # 任意の依存パッケージ
+    Workbook = None
+
+FORMATS = ("csv", "xlsx")
+
+# 出力する列（シートの列順）。レシートのリンク（最終列）は include_links=True の場合だけ出力する
+LINK_COLUMN = SheetsService.COLUMNS[-1]
+EXPORT_COLUMNS = SheetsService.COLUMNS[:-1]
+
+# 金額の列（XLSX では数値として書き込む）
+_AMOUNT_COLUMNS = (6, 7, 8)
+
+
+def filter_rows(
+    rows: Iterable[tuple[int, list]],
+    date_from: date | None = None,
+    date_to: date | None = None,
+    include_links: bool = False,
+):
+    """
+    (行番号, 行の値) から、支払日が期間内の行を出力列に揃えて返す
+
+    期間を指定した場合、支払日が読み取れない行は含めない。途中の空行は含めない。
+    """
+    width = len(EXPORT_COLUMNS) + (1 if include_links else 0)
+    for _, row in rows:
+        if not any(str(v).strip() for v in row):
+            continue
+        if date_from or date_to:
+            paid = parse_sheet_date(row[COL_DATE] if len(row) > COL_DATE else "")
+            if paid is None:
+                continue
+            if date_from and paid < date_from:
+                continue
+            if date_to and paid > date_to:
+                continue
+        cells = [str(v) for v in row[:width]]
+        cells += [""] * (width - len(cells))
+        yield cells
+
+
+def write_csv(rows: Iterable[list[str]], fp: BinaryIO, include_links: bool = False) -> int:
+    """CSV（UTF-8 BOM 付き。Excel でそのまま開ける）を書き出し、データ行数を返す"""
+    text = io.TextIOWrapper(fp, encoding="utf-8-sig", newline="")
+    writer = csv.writer(text)
+    writer.writerow(EXPORT_COLUMNS + ([LINK_COLUMN] if include_links else []))
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    text.flush()
+    text.detach()  # fp は呼び出し元が閉じる
+    return count
+
+
+def write_xlsx(rows: Iterable[list[str]], fp: BinaryIO, include_links: bool = False) -> int:
+    """XLSX を write_only モードで書き出し、データ行数を返す"""
+    if Workbook is None:
+        raise RuntimeError("openpyxl がインストールされていないため XLSX で出力できません")
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("台帳")
+    sheet.append(EXPORT_COLUMNS + ([LINK_COLUMN] if include_links else []))
+    count = 0
+    for row in rows:
+        for i in _AMOUNT_COLUMNS:
+            if row[i].strip():
+                row[i] = parse_amount(row[i])
+        sheet.append(row)
+        count += 1
+    workbook.save(fp)
+    return count
+
+
+def export_ledger(
+    rows: Iterable[tuple[int, list]],
+    fp: BinaryIO,
+    fmt: str = "csv",
+    date_from: date | None = None,
+    date_to: date | None = None,
+    include_links: bool = False,
+) -> int:
+    """
+    台帳の行を絞り込んで fp に書き出す
+
+    Args:
+        rows: SheetsService.iter_rows() / iter_ledger() の戻り値
+        fp: 書き込み先（バイナリモード）
+        fmt: "csv" または "xlsx"
+
+    Returns:
+        書き出したデータ行数（ヘッダーを除く）
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"不明な出力形式: {fmt}")
+    filtered = filter_rows(rows, date_from, date_to, include_links)
+    writer = write_xlsx if fmt == "xlsx" else write_csv
+    count = writer(filtered, fp, include_links)
+    logger.info(
+        f"台帳エクスポート: {count}行 ({fmt}) "
+        f"期間={date_from or '指定なし'}〜{date_to or '指定なし'}"
+    )
+    return count
@@ -0,0 +1,476 @@
+"""
+オフライン用フェイクバックエンド - Google API を使わずにサービスを動かす
+
+VisionService / SheetsService / DriveService にはクライアントを差し替える
+引数があるので、ここのフェイクを渡すとネットワークなしで同じコードが動く。
+負荷試験（loadtest.py）や動作確認に使う。
+
+    sheets_api = FakeSheetsAPI(latency=0.05, quota_per_minute=300)
+    drive_api = FakeDriveAPI(latency=0.1)
+    sheets = SheetsService(service=sheets_api, drive_service=drive_api)
+    drive = DriveService(service=drive_api, folder_id="fake-folder")
+    vision = VisionService(client=FakeVisionClient())
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from types import SimpleNamespace
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+# Vision フェイクが返すデフォルトのレシートテキスト
+DEFAULT_RECEIPT_TEXT = """セブンイレブン 渋谷店
+2026年2月8日(日) 12:34
+ボールペン ¥150
+ノート ¥300
+合計 ¥450
+お預り ¥1,000
+お釣り ¥550"""
+
+
+def _http_error(status: int, message: str) -> HttpError:
+    """googleapiclient と同じ形の HttpError を作る"""
+    resp = httplib2.Response({"status": status})
+    content = json.dumps({"error": {"code": status, "message": message}}).encode()
+    return HttpError(resp, content)
+
+
+# =============================================================================
+#  共通: レイテンシ・クォータのシミュレーションと呼び出し回数の記録
+# =============================================================================
+class FakeBackend:
+    """フェイク API の共通基盤（レイテンシ、クォータ、呼び出しカウント）"""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        quota_per_minute: int | None = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.quota_per_minute = quota_per_minute
+        self.calls: Counter[str] = Counter()
+        self._lock = threading.RLock()
+        self._recent: deque[float] = deque()  # クォータ判定用の呼び出し時刻
+
+    def _execute(self, method: str, fn):
+        """1回の API 呼び出しを処理する（クォータ確認 → 待機 → 実行）"""
+        self._admit(method)
+        delay = self._delay()
+        if delay > 0:
+            time.sleep(delay)
+        with self._lock:
+            return fn()
+
+    async def _execute_async(self, method: str, fn):
+        """_execute の非同期版（待機中も他の呼び出しを進められる）"""
+        self._admit(method)
+        delay = self._delay()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        with self._lock:
+            return fn()
+
+    def _admit(self, method: str) -> None:
+        """呼び出しを数え、クォータを超えていれば 429 を送出する"""
+        with self._lock:
+            self.calls[method] += 1
+            if self.quota_per_minute is not None:
+                now = time.monotonic()
+                while self._recent and now - self._recent[0] > 60:
+                    self._recent.popleft()
+                if len(self._recent) >= self.quota_per_minute:
+                    self.calls["quota_exceeded"] += 1
+                    raise _http_error(429, "Quota exceeded (fake)")
+                self._recent.append(now)
+
+    def _delay(self) -> float:
+        return self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+
+    def total_calls(self) -> int:
+        """クォータ超過を除いた API 呼び出し総数"""
+        return sum(n for name, n in self.calls.items() if name != "quota_exceeded")
+
+
+class _Request:
+    """googleapiclient の HttpRequest 相当（execute() で実行される）"""
+
+    def __init__(self, backend: FakeBackend, method: str, fn):
+        self._backend = backend
+        self._method = method
+        self._fn = fn
+
+    def execute(self):
+        return self._backend._execute(self._method, self._fn)
+
+    async def execute_async(self):
+        return await self._backend._execute_async(self._method, self._fn)
+
+
+# =============================================================================
+#  Sheets API v4 フェイク（インメモリのシート）
+# =============================================================================
+_A1_CELL = re.compile(r"^([A-Z]*)(\d*)$")
+
+
+def _col_to_index(col: str) -> int:
+    """列名（A, B, ..., AA）を 0-indexed の列番号に変換する"""
+    index = 0
+    for ch in col:
+        index = index * 26 + (ord(ch) - ord("A") + 1)
+    return index - 1
+
+
+def _index_to_col(index: int) -> str:
+    """0-indexed の列番号を列名（A, B, ..., AA）に変換する"""
+    col = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        col = chr(ord("A") + rem) + col
+    return col
+
+
+def _cell_str(value) -> str:
+    """USER_ENTERED で書き込まれた値を、読み出し時の文字列表現にする"""
+    if value is None:
+        return ""
+    return str(value)
+
+
+def _entered_value(value: dict):
+    """updateCells の userEnteredValue を、values API で書き込んだ場合と同じ形にする"""
+    if "numberValue" in value:
+        number = value["numberValue"]
+        return int(number) if float(number).is_integer() else number
+    for key in ("stringValue", "formulaValue", "boolValue"):
+        if key in value:
+            return value[key]
+    return ""
+
+
+class FakeSheetsAPI(FakeBackend):
+    """
+    Sheets API v4 のインメモリ実装
+
+    spreadsheets().get / values().get / batchGet / update / batchUpdate /
+    spreadsheets().batchUpdate（addSheet, appendDimension, updateCells）に対応する。
+    行数（rowCount）・列数（columnCount）を超える書き込みは本物と同様にエラーになる。
+    """
+
+    def __init__(
+        self,
+        header: list[str] | None = None,
+        sheet_title: str = "Sheet1",
+        sheet_id: int = 0,
+        row_count: int = 1000,
+        column_count: int = 26,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.sheets: dict[str, dict] = {}
+        self._next_sheet_id = sheet_id + 1
+        self._add_sheet(sheet_title, sheet_id, row_count, column_count)
+        if header:
+            self.sheets[sheet_title]["values"].append([_cell_str(v) for v in header])
+
+    # --- 内部データ操作 ---
+    def _add_sheet(self, title: str, sheet_id: int, row_count: int, column_count: int = 26) -> dict:
+        if title in self.sheets:
+            raise _http_error(400, f"A sheet with the name \"{title}\" already exists")
+        self.sheets[title] = {
+            "sheetId": sheet_id,
+            "rowCount": row_count,
+            "columnCount": column_count,
+            "values": [],
+        }
+        return self.sheets[title]
+
+    def _parse_range(self, range_str: str) -> tuple[dict, int, int, int, int | None]:
+        """
+        A1 表記のレンジを解析する
+
+        Returns:
+            (sheet, 開始行, 開始列, 終了列, 終了行) ※行・列は 0-indexed、終了行 None は末尾まで
+        """
+        if "!" in range_str:
+            title, cells = range_str.rsplit("!", 1)
+        else:
+            title, cells = range_str, ""
+        title = title.strip("'")
+        if title not in self.sheets:
+            raise _http_error(400, f"Unable to parse range: {range_str}")
+        sheet = self.sheets[title]
+
+        start, _, end = cells.partition(":")
+        m_start = _A1_CELL.match(start)
+        m_end = _A1_CELL.match(end or start)
+        if not m_start or not m_end:
+            raise _http_error(400, f"Unable to parse range: {range_str}")
+        c1, r1 = m_start.groups()
+        c2, r2 = m_end.groups()
+
+        row_start = int(r1) - 1 if r1 else 0
+        row_end = int(r2) if r2 else None
+        col_start = _col_to_index(c1) if c1 else 0
+        col_end = _col_to_index(c2) + 1 if c2 else sheet["columnCount"]
+        return sheet, row_start, col_start, col_end, row_end
+
+    def _read(self, range_str: str) -> dict:
+        sheet, row_start, col_start, col_end, row_end = self._parse_range(range_str)
+        if row_end is not None and row_end > sheet["rowCount"]:
+            raise _http_error(
+                400,
+                f"Range ({range_str}) exceeds grid limits. Max rows: {sheet['rowCount']}",
+            )
+        rows = sheet["values"][row_start:row_end]
+        values = []
+        for row in rows:
+            cells = row[col_start:col_end]
+            while cells and cells[-1] == "":
+                cells = cells[:-1]
+            values.append(list(cells))
+        while values and not values[-1]:
+            values.pop()
+        result = {"range": range_str, "majorDimension": "ROWS"}
+        if values:
+            result["values"] = values
+        return result
+
+    def _write(self, range_str: str, values: list[list]) -> dict:
+        sheet, row_start, col_start, _, _ = self._parse_range(range_str)
+        if row_start + len(values) > sheet["rowCount"]:
+            raise _http_error(
+                400,
+                f"Range ({range_str}) exceeds grid limits. Max rows: {sheet['rowCount']}",
+            )
+        if col_start + max((len(row) for row in values), default=0) > sheet["columnCount"]:
+            raise _http_error(
+                400,
+                f"Range ({range_str}) exceeds grid limits. Max columns: {sheet['columnCount']}",
+            )
+        grid = sheet["values"]
+        for i, row in enumerate(values):
+            r = row_start + i
+            while len(grid) <= r:
+                grid.append([])
+            line = grid[r]
+            for j, value in enumerate(row):
+                c = col_start + j
+                while len(line) <= c:
+                    line.append("")
+                line[c] = _cell_str(value)
+        return {
+            "updatedRange": range_str,
+            "updatedRows": len(values),
+            "updatedCells": sum(len(row) for row in values),
+        }
+
+    def _metadata(self) -> dict:
+        return {
+            "sheets": [
+                {
+                    "properties": {
+                        "sheetId": sheet["sheetId"],
+                        "title": title,
+                        "gridProperties": {
+                            "rowCount": sheet["rowCount"],
+                            "columnCount": sheet["columnCount"],
+                        },
+                    }
+                }
+                for title, sheet in self.sheets.items()
+            ]
+        }
+
+    def _sheet_by_id(self, sheet_id: int) -> dict:
+        for sheet in self.sheets.values():
+            if sheet["sheetId"] == sheet_id:
+                return sheet
+        raise _http_error(400, f"No grid with id: {sheet_id}")
+
+    def _batch_update(self, body: dict) -> dict:
+        replies = []
+        for request in body.get("requests", []):
+            if "appendDimension" in request:
+                req = request["appendDimension"]
+                sheet = self._sheet_by_id(req.get("sheetId", 0))
+                if req.get("dimension") == "ROWS":
+                    sheet["rowCount"] += req["length"]
+                else:
+                    sheet["columnCount"] += req["length"]
+                replies.append({})
+            elif "addSheet" in request:
+                props = request["addSheet"].get("properties", {})
+                grid = props.get("gridProperties", {})
+                sheet_id = props.get("sheetId", self._next_sheet_id)
+                self._next_sheet_id = max(self._next_sheet_id, sheet_id) + 1
+                self._add_sheet(
+                    props["title"],
+                    sheet_id,
+                    grid.get("rowCount", 1000),
+                    grid.get("columnCount", 26),
+                )
+                replies.append({"addSheet": {"properties": {"sheetId": sheet_id, "title": props["title"]}}})
+            elif "updateCells" in request:
+                req = request["updateCells"]
+                start = req.get("start", {})
+                sheet = self._sheet_by_id(start.get("sheetId", 0))
+                title = next(t for t, s in self.sheets.items() if s is sheet)
+                rows = [
+                    [_entered_value(v.get("userEnteredValue", {})) for v in row.get("values", [])]
+                    for row in req.get("rows", [])
+                ]
+                col = _index_to_col(start.get("columnIndex", 0))
+                self._write(f"'{title}'!{col}{start.get('rowIndex', 0) + 1}", rows)
+                replies.append({})
+            else:
+                raise _http_error(400, f"Unsupported request (fake): {list(request)}")
+        return {"replies": replies}
+
+    # --- googleapiclient 互換のリソース ---
+    def spreadsheets(self):
+        return _FakeSpreadsheets(self)
+
+
+class _FakeSpreadsheets:
+    def __init__(self, api: FakeSheetsAPI):
+        self._api = api
+
+    def get(self, spreadsheetId: str, **kwargs):
+        return _Request(self._api, "spreadsheets.get", self._api._metadata)
+
+    def batchUpdate(self, spreadsheetId: str, body: dict):
+        return _Request(self._api, "spreadsheets.batchUpdate", lambda: self._api._batch_update(body))
+
+    def values(self):
+        return _FakeValues(self._api)
+
+
+class _FakeValues:
+    def __init__(self, api: FakeSheetsAPI):
+        self._api = api
+
+    def get(self, spreadsheetId: str, range: str, **kwargs):
+        return _Request(self._api, "values.get", lambda: self._api._read(range))
+
+    def batchGet(self, spreadsheetId: str, ranges: list[str], **kwargs):
+        return _Request(
+            self._api,
+            "values.batchGet",
+            lambda: {"valueRanges": [self._api._read(r) for r in ranges]},
+        )
+
+    def update(self, spreadsheetId: str, range: str, body: dict, **kwargs):
+        return _Request(self._api, "values.update", lambda: self._api._write(range, body.get("values", [])))
+
+    def batchUpdate(self, spreadsheetId: str, body: dict):
+        def run():
+            responses = [self._api._write(d["range"], d.get("values", [])) for d in body.get("data", [])]
+            return {
+                "totalUpdatedCells": sum(r["updatedCells"] for r in responses),
+                "responses": responses,
+            }
+        return _Request(self._api, "values.batchUpdate", run)
+
+
+# =============================================================================
+#  Drive API v3 フェイク
+# =============================================================================
+class FakeDriveAPI(FakeBackend):
+    """Drive API v3 のフェイク（アップロードされたファイルはメモリに保持）"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.files_store: dict[str, dict] = {}
+        self._counter = 0
+
+    def files(self):
+        return _FakeFiles(self)
+
+    def _create(self, body: dict, media_body) -> dict:
+        self._counter += 1
+        file_id = f"fake-file-{self._counter}"
+        size = media_body.size() if media_body is not None else 0
+        self.files_store[file_id] = {"name": body.get("name", ""), "size": size}
+        return {"id": file_id, "webViewLink": f"https://drive.google.com/file/d/{file_id}/view"}
+
+
+class _FakeFiles:
+    def __init__(self, api: FakeDriveAPI):
+        self._api = api
+
+    def get(self, fileId: str, **kwargs):
+        return _Request(
+            self._api,
+            "files.get",
+            lambda: {"mimeType": "application/vnd.google-apps.spreadsheet", "name": "fake"},
+        )
+
+    def create(self, body: dict, media_body=None, **kwargs):
+        return _Request(self._api, "files.create", lambda: self._api._create(body, media_body))
+
+    def copy(self, fileId: str, body: dict, **kwargs):
+        return _Request(self._api, "files.copy", lambda: {"id": f"{fileId}-copy"})
+
+
+# =============================================================================
+#  Vision API フェイク（固定テキストを返す）
+# =============================================================================
+class FakeVisionClient(FakeBackend):
+    """
+    vision.ImageAnnotatorClient のフェイク
+
+    texts を渡すと呼び出しごとに順番に返す（末尾まで来たら先頭に戻る）。
+    要素をテキストのリストにすると、複数のレシートを横に並べて撮った画像として返す。
+    単語ごとの注釈（bounding_poly 付き）は、1文字 CHAR_WIDTH・1行 LINE_HEIGHT の配置で作る。
+    """
+
+    CHAR_WIDTH = 20
+    LINE_HEIGHT = 30
+    RECEIPT_GAP = 200
+
+    def __init__(self, texts: list[str | list[str]] | None = None, **kwargs):
+        super().__init__(**kwargs)
+        self.texts = texts or [DEFAULT_RECEIPT_TEXT]
+        self._index = 0
+
+    def text_detection(self, image=None, **kwargs):
+        return self._execute("text_detection", self._respond)
+
+    def _respond(self):
+        item = self.texts[self._index % len(self.texts)]
+        self._index += 1
+        receipts = [item] if isinstance(item, str) else item
+        text = "\n".join(t.strip("\n") for t in receipts if t)
+
+        annotations = [SimpleNamespace(description=text)] if text else []
+        left = 0
+        for receipt in receipts:
+            lines = receipt.strip("\n").splitlines()
+            for row, line in enumerate(lines):
+                top = row * self.LINE_HEIGHT
+                for match in re.finditer(r"\S+", line):
+                    x0 = left + match.start() * self.CHAR_WIDTH
+                    x1 = left + match.end() * self.CHAR_WIDTH
+                    annotations.append(SimpleNamespace(
+                        description=match.group(),
+                        bounding_poly=SimpleNamespace(vertices=[
+                            SimpleNamespace(x=x0, y=top),
+                            SimpleNamespace(x=x1, y=top),
+                            SimpleNamespace(x=x1, y=top + self.LINE_HEIGHT * 2 // 3),
+                            SimpleNamespace(x=x0, y=top + self.LINE_HEIGHT * 2 // 3),
+                        ]),
+                    ))
+            width = max((len(line) for line in lines), default=0)
+            left += width * self.CHAR_WIDTH + self.RECEIPT_GAP
+        return SimpleNamespace(
+            error=SimpleNamespace(message=""),
+            text_annotations=annotations,
+        )
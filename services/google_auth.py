@@ -1,7 +1,13 @@
 """
 Google 認証ヘルパー - サービスアカウント認証を一元管理
 """
+import threading
+
+import google_auth_httplib2
+import httplib2
 from google.oauth2.service_account import Credentials
+from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest
 import config
 
 SCOPES = [
@@ -17,3 +23,24 @@ def get_credentials() -> Credentials:
         config.GOOGLE_CREDENTIALS_FILE,
         scopes=SCOPES,
     )
+
+
+def build_service(name: str, version: str, credentials: Credentials | None = None):
+    """
+    googleapiclient のクライアントを作成する（複数のスレッドから使える）
+
+    httplib2.Http はスレッドセーフではないため、リクエストごとに呼び出し元スレッドの
+    Http（スレッドごとに1つ作成して使い回す）で送信する。
+    """
+    credentials = credentials or get_credentials()
+    local = threading.local()
+
+    def thread_http() -> google_auth_httplib2.AuthorizedHttp:
+        if not hasattr(local, "http"):
+            local.http = google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http())
+        return local.http
+
+    def request_builder(http, *args, **kwargs):
+        return HttpRequest(thread_http(), *args, **kwargs)
+
+    return build(name, version, http=thread_http(), requestBuilder=request_builder)
@@ -0,0 +1,314 @@
+"""
+Google REST クライアント（非同期） - Sheets API v4 / Drive API v3 を aiohttp で直接呼び出す
+
+googleapiclient（httplib2）は同期処理で、呼び出し中はイベントループが止まる。
+こちらは discord.py と同じ aiohttp のコネクションプール（bot.http.connector）を共有し、
+複数の申請の API 呼び出しを同時に進められる。
+
+    rest = GoogleRestSession(credentials, connector=bot.http.connector)
+    sheets = AsyncSheetsApi(rest)
+    result = await sheets.spreadsheets().values().get(spreadsheetId=..., range=...).execute_async()
+
+リソースとメソッドの名前・引数は googleapiclient と同じにしてあるので、SheetsService / DriveService は
+同じ形で呼び出せる（同期版は execute()、こちらは execute_async()）。
+
+- HTTP keep-alive とコネクションプール（aiohttp）
+- gzip 圧縮（Accept-Encoding と User-Agent に gzip を指定）
+- fields マスク（メソッドごとに必要な項目だけを返させる。呼び出し側で上書き可）
+- 429 / 5xx・通信エラーは指数バックオフで再試行、401 はトークンを更新して再試行
+  （POST は同じ内容が二重に処理されないよう、サーバーに届いていないことが確かな
+  接続失敗と 429 だけを再試行する）
+- エラーは googleapiclient と同じ HttpError で送出する
+"""
+import asyncio
+import json
+import logging
+import random
+from urllib.parse import quote
+
+import aiohttp
+import google_auth_httplib2
+import httplib2
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger(__name__)
+
+SHEETS_URL = "https://sheets.googleapis.com/v4/spreadsheets"
+DRIVE_URL = "https://www.googleapis.com/drive/v3/files"
+DRIVE_UPLOAD_URL = "https://www.googleapis.com/upload/drive/v3/files"
+
+# 再試行するステータスコード
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# 同じリクエストを繰り返しても結果が変わらないメソッド（タイムアウト・5xx でも再試行してよい）
+_IDEMPOTENT_METHODS = ("GET", "PUT")
+
+# POST でも再試行してよい失敗（リクエストが処理されていない）
+_UNSENT_ERRORS = (aiohttp.ClientConnectorError,)
+_UNPROCESSED_STATUSES = (429,)
+
+
+def _http_error(status: int, content: bytes, uri: str) -> HttpError:
+    return HttpError(httplib2.Response({"status": status}), content, uri=uri)
+
+
+class GoogleRestSession:
+    """認証・コネクションプール・再試行をまとめた aiohttp のセッション"""
+
+    def __init__(
+        self,
+        credentials,
+        connector: aiohttp.BaseConnector | None = None,
+        max_connections: int = 16,
+        timeout: float = 30,
+        max_retries: int = 4,
+    ):
+        # connector を渡すと、そのコネクションプールを共有する（閉じるのは持ち主の責任）
+        self.credentials = credentials
+        self.connector = connector
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._session: aiohttp.ClientSession | None = None
+        self._limit = asyncio.Semaphore(max_connections)
+        self._refresh_lock = asyncio.Lock()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=self.connector,
+                connector_owner=self.connector is None,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={
+                    "Accept-Encoding": "gzip",
+                    "User-Agent": "kaikei-bot (gzip)",  # Google API は User-Agent にも gzip が必要
+                },
+                cookie_jar=aiohttp.DummyCookieJar(),
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _auth_headers(self, force_refresh: bool = False) -> dict:
+        """アクセストークンを付けたヘッダー（期限切れなら別スレッドで更新する）"""
+        async with self._refresh_lock:
+            if force_refresh or not self.credentials.valid:
+                request = google_auth_httplib2.Request(httplib2.Http())
+                await asyncio.to_thread(self.credentials.refresh, request)
+        headers: dict = {}
+        self.credentials.apply(headers)
+        return headers
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        params: dict | list | None = None,
+        json_body: dict | None = None,
+        data=None,
+    ) -> dict:
+        """
+        API を1回呼び出し、JSON の応答を返す
+
+        GET / PUT は通信エラー・429・5xx で再試行する。POST（ファイル作成・行の追加など）は、
+        タイムアウトや 5xx ではサーバー側で処理済みの可能性があり、再送すると二重に作成されるため、
+        接続できなかった場合と 429 の場合だけ再試行する。
+
+        Raises:
+            HttpError: 再試行しても成功しなかった
+        """
+        session = self._get_session()
+        idempotent = method.upper() in _IDEMPOTENT_METHODS
+        force_refresh = False
+        for attempt in range(self.max_retries + 1):
+            headers = await self._auth_headers(force_refresh)
+            force_refresh = False
+            try:
+                async with self._limit, session.request(
+                    method, url, params=params, json=json_body, data=data, headers=headers
+                ) as resp:
+                    content = await resp.read()
+                    status = resp.status
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.max_retries or not (idempotent or isinstance(e, _UNSENT_ERRORS)):
+                    raise
+                logger.warning(f"Google API 通信エラー、再試行します ({attempt + 1}/{self.max_retries}): {e}")
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+
+            if status < 300:
+                return json.loads(content) if content else {}
+            if status == 401 and attempt == 0:
+                force_refresh = True
+                continue
+            retryable = _RETRY_STATUSES if idempotent else _UNPROCESSED_STATUSES
+            if status in retryable and attempt < self.max_retries:
+                logger.warning(f"Google API {status}、再試行します ({attempt + 1}/{self.max_retries}): {method} {url}")
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            raise _http_error(status, content, url)
+        raise RuntimeError("unreachable")
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        return min(32, 2 ** attempt) * (0.5 + random.random() / 2)
+
+
+class RestRequest:
+    """googleapiclient の HttpRequest に相当（await request.execute_async() で実行する）"""
+
+    def __init__(self, rest: GoogleRestSession, method: str, url: str, params=None, json_body=None, data=None):
+        self.rest = rest
+        self.method = method
+        self.url = url
+        self.params = params
+        self.json_body = json_body
+        self.data = data
+
+    async def execute_async(self) -> dict:
+        return await self.rest.request(self.method, self.url, self.params, self.json_body, self.data)
+
+    def execute(self):
+        raise RuntimeError("非同期クライアントのリクエストです。execute_async() を使ってください")
+
+
+def _params(fields: str | None, default_fields: str, **params) -> dict:
+    """None を除いたクエリパラメータ（fields は省略時に既定のマスクを使う）"""
+    result = {k: v for k, v in params.items() if v is not None}
+    result["fields"] = fields or default_fields
+    return result
+
+
+# =============================================================================
+#  Sheets API v4
+# =============================================================================
+class AsyncSheetsApi:
+    """build("sheets", "v4") と同じ形の非同期クライアント"""
+
+    def __init__(self, rest: GoogleRestSession):
+        self.rest = rest
+
+    def spreadsheets(self):
+        return _Spreadsheets(self.rest)
+
+
+class _Spreadsheets:
+    def __init__(self, rest: GoogleRestSession):
+        self.rest = rest
+
+    def get(
+        self,
+        spreadsheetId: str,
+        ranges: list[str] | None = None,
+        includeGridData: bool | None = None,
+        fields: str | None = None,
+    ):
+        params = [("ranges", r) for r in ranges or []]
+        params += list(_params(
+            fields,
+            "spreadsheetId,sheets.properties",
+            includeGridData=None if includeGridData is None else str(includeGridData).lower(),
+        ).items())
+        return RestRequest(self.rest, "GET", f"{SHEETS_URL}/{spreadsheetId}", params=params)
+
+    def batchUpdate(self, spreadsheetId: str, body: dict, fields: str | None = None):
+        return RestRequest(
+            self.rest, "POST", f"{SHEETS_URL}/{spreadsheetId}:batchUpdate",
+            params=_params(fields, "spreadsheetId,replies"), json_body=body,
+        )
+
+    def values(self):
+        return _Values(self.rest)
+
+
+class _Values:
+    def __init__(self, rest: GoogleRestSession):
+        self.rest = rest
+
+    def get(self, spreadsheetId: str, range: str, fields: str | None = None, **kwargs):
+        return RestRequest(
+            self.rest, "GET", f"{SHEETS_URL}/{spreadsheetId}/values/{quote(range, safe='')}",
+            params=_params(fields, "range,values", **kwargs),
+        )
+
+    def batchGet(self, spreadsheetId: str, ranges: list[str], fields: str | None = None, **kwargs):
+        params = [("ranges", r) for r in ranges]
+        params += list(_params(fields, "valueRanges(range,values)", **kwargs).items())
+        return RestRequest(self.rest, "GET", f"{SHEETS_URL}/{spreadsheetId}/values:batchGet", params=params)
+
+    def update(
+        self,
+        spreadsheetId: str,
+        range: str,
+        body: dict,
+        valueInputOption: str = "USER_ENTERED",
+        fields: str | None = None,
+    ):
+        return RestRequest(
+            self.rest, "PUT", f"{SHEETS_URL}/{spreadsheetId}/values/{quote(range, safe='')}",
+            params=_params(fields, "updatedRange,updatedRows,updatedCells", valueInputOption=valueInputOption),
+            json_body=body,
+        )
+
+    def batchUpdate(self, spreadsheetId: str, body: dict, fields: str | None = None):
+        return RestRequest(
+            self.rest, "POST", f"{SHEETS_URL}/{spreadsheetId}/values:batchUpdate",
+            params=_params(fields, "totalUpdatedCells,totalUpdatedRows"), json_body=body,
+        )
+
+
+# =============================================================================
+#  Drive API v3
+# =============================================================================
+class AsyncDriveApi:
+    """build("drive", "v3") と同じ形の非同期クライアント"""
+
+    def __init__(self, rest: GoogleRestSession):
+        self.rest = rest
+
+    def files(self):
+        return _Files(self.rest)
+
+
+class _Files:
+    def __init__(self, rest: GoogleRestSession):
+        self.rest = rest
+
+    def get(self, fileId: str, fields: str | None = None, supportsAllDrives: bool = True):
+        return RestRequest(
+            self.rest, "GET", f"{DRIVE_URL}/{fileId}",
+            params=_params(fields, "id,name,mimeType", supportsAllDrives=str(supportsAllDrives).lower()),
+        )
+
+    def copy(self, fileId: str, body: dict, fields: str | None = None, supportsAllDrives: bool = True):
+        return RestRequest(
+            self.rest, "POST", f"{DRIVE_URL}/{fileId}/copy",
+            params=_params(fields, "id", supportsAllDrives=str(supportsAllDrives).lower()), json_body=body,
+        )
+
+    def create(
+        self,
+        body: dict,
+        media_body=None,
+        fields: str | None = None,
+        supportsAllDrives: bool = True,
+    ):
+        """
+        ファイルを作成する（media_body は googleapiclient の MediaInMemoryUpload 等）
+
+        メディアがある場合はメタデータと本体を multipart/related で1回のリクエストで送る。
+        """
+        params = _params(fields, "id,webViewLink", supportsAllDrives=str(supportsAllDrives).lower())
+        if media_body is None:
+            return RestRequest(self.rest, "POST", DRIVE_URL, params=params, json_body=body)
+
+        writer = aiohttp.MultipartWriter("related")
+        writer.append_json(body)
+        writer.append(
+            media_body.getbytes(0, media_body.size()),
+            {"Content-Type": media_body.mimetype()},
+        )
+        params["uploadType"] = "multipart"
+        return RestRequest(self.rest, "POST", DRIVE_UPLOAD_URL, params=params, data=writer)
@@ -0,0 +1,457 @@
+"""
+HTTP 受付サーバー - Discord を使わずにレシート画像・申請データを受け付ける（スマホのショートカット・スキャナー等）
+
+Bot と同じプロセスで aiohttp のサーバーを動かし、Discord からの申請と同じパイプライン
+（run_job: OCR → Drive → Sheets）で処理する。結果はジョブIDで後から取得する。
+
+    POST /receipts   multipart/form-data（image: 画像、その他の項目は任意） → 202 {"job_id": ...}
+                     OCR 結果で日付・金額・使用用途などを埋めて申請する（送った項目が優先）
+                     1枚の写真に複数のレシートがあれば、レシートごとに申請する
+    POST /entries    JSON {"date", "amount", "purpose", ...}（画像なし） → 202 {"job_id": ...}
+    GET  /jobs/{id}  ジョブの状態（queued / running / done / partial / failed / processing）と結果
+    POST /jobs/{id}/retry  partial / failed / processing のジョブのうち、まだ書き込んでいない申請だけをやり直す
+
+複数のレシートの途中で失敗した場合は partial になり、result.submitted に書き込み済みの行、
+result.remaining に残りの件数が入る（再試行しても書き込み済みの行は二重に書き込まない）。
+ワーカーでの書き込みが時間内に完了しなかった場合は（失敗ではないので）processing になる。
+申請にはジョブIDとレシートの番号から submission_key を付けるため、再試行すると
+ワーカーは同じ申請を二重に書き込まず、実行中・完了済みのジョブの結果を待つ。
+
+項目: target（台帳名）, author（記入者）, date, amount, purpose, payer, category
+すべてのリクエストに Authorization: Bearer <INGEST_TOKEN> が必要。
+アップロードは一定サイズずつ一時ファイルに書き出し、メモリに溜めない。
+"""
+import asyncio
+import hmac
+import logging
+import os
+import tempfile
+import time
+import uuid
+from datetime import date
+from typing import Awaitable, Callable
+
+from aiohttp import web
+
+from services.admission import AdmissionController, AdmissionError
+from services.jobqueue import JobStillRunning
+from services.pipeline import build_row_data, parse_amount_input
+from services.routing import LedgerRouter
+from services import tracing
+
+logger = logging.getLogger(__name__)
+
+# アップロードを一時ファイルに書き出す単位（バイト）
+CHUNK_BYTES = 64 * 1024
+
+# 受け付ける項目
+FIELDS = ("target", "author", "date", "amount", "purpose", "payer", "category")
+
+RunJob = Callable[[str, dict, bytes | None], Awaitable[dict]]
+
+
+class IngestError(Exception):
+    """リクエストを受け付けられない（status は HTTP ステータスコード）"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class PartialSubmitError(Exception):
+    """一部の申請だけを書き込んだところで失敗した（result は書き込み済みの行を含むジョブの結果）"""
+
+    def __init__(self, message: str, result: dict):
+        super().__init__(message)
+        self.result = result
+
+
+class IngestServer:
+    """レシート画像・申請データを受け付け、パイプラインのジョブとして実行する HTTP サーバー"""
+
+    def __init__(
+        self,
+        run_job: RunJob,
+        router: LedgerRouter,
+        admission: AdmissionController,
+        token: str,
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        upload_dir: str = "",
+        max_upload_bytes: int = 20 * 1024 * 1024,
+        job_ttl: float = 3600,
+        default_author: str = "HTTP受付",
+    ):
+        # run_job は AccountingCog.run_job（同一プロセス・ワーカーモードのどちらでも同じ入出力）
+        # admission は Discord からの解析と共有し、OCR の同時実行数をまとめて抑える
+        if not token:
+            raise ValueError("INGEST_TOKEN が設定されていません")
+        self.run_job = run_job
+        self.router = router
+        self.admission = admission
+        self.token = token
+        self.host = host
+        self.port = port
+        self.upload_dir = upload_dir or tempfile.gettempdir()
+        self.max_upload_bytes = max_upload_bytes
+        self.job_ttl = job_ttl
+        self.default_author = default_author
+        self.jobs: dict[str, dict] = {}
+        # 書き込みの途中経過（ジョブID → 未書き込みの行・書き込み済みの行・画像の一時ファイル）
+        # 失敗したジョブを再試行するときに、書き込み済みの行を飛ばすために使う
+        self._progress: dict[str, dict] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._runner: web.AppRunner | None = None
+
+    # -----------------------------------------------------------------
+    #  起動・停止
+    # -----------------------------------------------------------------
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_post("/receipts", self.post_receipt)
+        app.router.add_post("/entries", self.post_entry)
+        app.router.add_get("/jobs/{job_id}", self.get_job)
+        app.router.add_post("/jobs/{job_id}/retry", self.retry_job)
+        return app
+
+    async def start(self) -> None:
+        os.makedirs(self.upload_dir, exist_ok=True)
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"HTTP 受付サーバー起動: http://{self.host}:{self.port}")
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        for task in list(self._tasks):
+            task.cancel()
+        for job_id in list(self._progress):
+            self._discard_progress(job_id)
+        logger.info("HTTP 受付サーバー停止")
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        """トークンの確認と、IngestError の JSON 応答への変換"""
+        # compare_digest は ASCII 以外を含む str を比べられない（TypeError）ため、バイト列で比べる
+        received = request.headers.get("Authorization", "").encode("utf-8", "surrogatepass")
+        expected = f"Bearer {self.token}".encode("utf-8")
+        if not hmac.compare_digest(received, expected):
+            return web.json_response({"error": "認証に失敗しました"}, status=401)
+        try:
+            return await handler(request)
+        except IngestError as e:
+            return web.json_response({"error": str(e)}, status=e.status)
+
+    # -----------------------------------------------------------------
+    #  エンドポイント
+    # -----------------------------------------------------------------
+    async def post_receipt(self, request: web.Request) -> web.Response:
+        """レシート画像（multipart）を受け付ける"""
+        if self.admission.waiting >= self.admission.queue_size:
+            raise IngestError("現在混み合っています。しばらくしてから再送信してください", 503)
+        if not request.content_type.startswith("multipart/"):
+            raise IngestError("multipart/form-data で送信してください", 415)
+
+        fields: dict[str, str] = {}
+        path = None
+        try:
+            reader = await request.multipart()
+            async for part in reader:
+                if part.name == "image":
+                    if path is not None:
+                        raise IngestError("画像は1枚だけ送信してください")
+                    if not (part.headers.get("Content-Type") or "").startswith("image/"):
+                        raise IngestError("image には画像ファイルを指定してください", 415)
+                    path = await self._save_upload(part)
+                elif part.name in FIELDS:
+                    fields[part.name] = (await part.text()).strip()
+            if path is None:
+                raise IngestError("image（画像ファイル）がありません")
+            target = self._target(fields.get("target"))
+            job = self._create_job("receipt", target)
+        except BaseException:
+            if path is not None:
+                os.remove(path)
+            raise
+
+        self._spawn(job, self._run_receipt(job, path, fields))
+        return self._accepted(job)
+
+    async def post_entry(self, request: web.Request) -> web.Response:
+        """画像なしの申請データ（JSON）を受け付ける"""
+        try:
+            body = await request.json()
+        except ValueError:
+            raise IngestError("JSON を送信してください")
+        if not isinstance(body, dict):
+            raise IngestError("JSON オブジェクトを送信してください")
+        fields = {k: str(v).strip() for k, v in body.items() if k in FIELDS and v is not None}
+        target = self._target(fields.get("target"))
+        row_data = self._row_data(fields, {})  # 金額の誤りはここで 400 を返す
+        job = self._create_job("entry", target)
+        self._spawn(job, self._run_entry(job, row_data))
+        return self._accepted(job)
+
+    async def get_job(self, request: web.Request) -> web.Response:
+        return web.json_response(self._job(request.match_info["job_id"]))
+
+    async def retry_job(self, request: web.Request) -> web.Response:
+        """失敗したジョブの、まだ書き込んでいない申請をやり直す（OCR はやり直さない）"""
+        job = self._job(request.match_info["job_id"])
+        if job["status"] not in ("partial", "failed", "processing") or job["id"] not in self._progress:
+            raise IngestError("再試行できるのは、書き込みの途中で失敗したジョブだけです", 409)
+        job["status"] = "queued"
+        job["error"] = None
+        job["finished"] = None
+        self._spawn(job, self._submit_rows(job))
+        return self._accepted(job)
+
+    # -----------------------------------------------------------------
+    #  ジョブ
+    # -----------------------------------------------------------------
+    async def _run_receipt(self, job: dict, path: str, fields: dict) -> dict:
+        """OCR 解析 → 入力項目との統合 → レシートごとに申請"""
+        try:
+            async with self.admission.slot():
+                with tracing.span("ocr"):
+                    image_bytes = await asyncio.to_thread(_read_file, path)
+                    analysis = await self.run_job("analyze", {}, image_bytes)
+
+            receipts = analysis.get("receipts") or [{"ocr_text": "", "ocr_data": {}}]
+            if fields.get("amount"):
+                receipts = receipts[:1]  # 金額を指定された場合は1枚のレシートとして扱う
+            rows = [
+                (self._row_data(fields, r["ocr_data"]), r["ocr_data"].get("store", ""))
+                for r in receipts
+            ]
+        except BaseException:
+            os.remove(path)
+            raise
+
+        # 画像の一時ファイルは、Drive にアップロードできるか、すべて書き込むまで残す（再試行用）
+        self._progress[job["id"]] = {
+            "rows": rows,
+            "submitted": [],
+            "path": path,
+            "filename": f"receipt_{time.strftime('%Y%m%d_%H%M%S')}_{job['id'][:8]}.png",
+            "drive_link": "",
+            "ocr_text": analysis.get("ocr_text", ""),
+        }
+        return await self._submit_rows(job, image_bytes)
+
+    async def _run_entry(self, job: dict, row_data: dict) -> dict:
+        self._progress[job["id"]] = {"rows": [(row_data, "")], "submitted": [], "path": None, "drive_link": ""}
+        return await self._submit_rows(job)
+
+    async def _submit_rows(self, job: dict, image_bytes: bytes | None = None) -> dict:
+        """
+        ジョブの未書き込みの行を1件ずつ申請する
+
+        書き込めた行はその都度記録するため、途中で失敗しても再試行で二重に書き込まない。
+        1件も書き込めずに失敗した場合は例外をそのまま、途中で失敗した場合は PartialSubmitError を送出する。
+        ワーカーで実行中のまま完了しなかった場合は JobStillRunning をそのまま送出する
+        （行は未書き込みとして残し、再試行では同じ submission_key で結果を待つ）。
+        """
+        progress = self._progress[job["id"]]
+        try:
+            while progress["rows"]:
+                row_data, store = progress["rows"][0]
+                blob = None
+                if progress["drive_link"]:
+                    row_data["レシート"] = progress["drive_link"]  # 同じ画像は1回だけアップロードする
+                elif progress["path"]:
+                    if image_bytes is None:
+                        image_bytes = await asyncio.to_thread(_read_file, progress["path"])
+                    blob = image_bytes
+                payload = {
+                    "target": job["target"],
+                    "row_data": row_data,
+                    "store": store,
+                    # 行は順に書き込むので、書き込み済みの件数がこの行の番号になる
+                    "submission_key": f"{job['id']}/{len(progress['submitted']) + 1}",
+                }
+                if progress.get("filename"):
+                    payload["filename"] = progress["filename"]
+                with tracing.span("submit"):
+                    result = await self.run_job("submit", payload, blob)
+                progress["rows"].pop(0)
+                progress["submitted"].append(_summary(row_data, result))
+                if not progress["drive_link"] and result.get("drive_link"):
+                    progress["drive_link"] = result["drive_link"]
+                    self._remove_upload(progress)
+        except JobStillRunning:
+            raise
+        except Exception as e:
+            if not progress["submitted"]:
+                raise
+            raise PartialSubmitError(
+                f"{len(progress['submitted'])}件を書き込んだ後、残り{len(progress['rows'])}件の書き込みに失敗しました: {e}",
+                self._result(progress),
+            ) from e
+
+        self._discard_progress(job["id"])
+        return self._result(progress)
+
+    @staticmethod
+    def _result(progress: dict) -> dict:
+        result = {"submitted": list(progress["submitted"])}
+        if progress["rows"]:
+            result["remaining"] = len(progress["rows"])
+        if "ocr_text" in progress:
+            result["ocr_text"] = progress["ocr_text"]
+        return result
+
+    def _discard_progress(self, job_id: str) -> None:
+        progress = self._progress.pop(job_id, None)
+        if progress is not None:
+            self._remove_upload(progress)
+
+    @staticmethod
+    def _remove_upload(progress: dict) -> None:
+        if progress["path"]:
+            try:
+                os.remove(progress["path"])
+            except FileNotFoundError:
+                pass
+            progress["path"] = None
+
+    def _create_job(self, kind: str, target: str) -> dict:
+        self._expire_jobs()
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "target": target,
+            "status": "queued",
+            "created": time.time(),
+            "finished": None,
+            "result": None,
+            "error": None,
+        }
+        self.jobs[job["id"]] = job
+        return job
+
+    def _spawn(self, job: dict, coro) -> None:
+        task = asyncio.create_task(self._track(job, coro))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _track(self, job: dict, coro) -> None:
+        """ジョブを実行して状態を記録する（ジョブIDをトレースIDにする）"""
+        job["status"] = "running"
+        with tracing.span("ingest", trace_id=job["id"], kind=job["kind"], target=job["target"]):
+            try:
+                job["result"] = await coro
+                job["status"] = "done"
+            except asyncio.CancelledError:
+                job["status"] = "failed"
+                job["error"] = "サーバーの停止により中断しました"
+                raise
+            except PartialSubmitError as e:
+                logger.error(f"HTTP 受付ジョブ一部失敗 ({job['id']}): {e}")
+                job["status"] = "partial"
+                job["result"] = e.result
+                job["error"] = f"{e}。POST /jobs/{job['id']}/retry で残りだけを再試行できます"
+            except JobStillRunning as e:
+                logger.warning(f"HTTP 受付ジョブ処理中 ({job['id']}): {e}")
+                job["status"] = "processing"
+                progress = self._progress.get(job["id"])
+                job["result"] = self._result(progress) if progress else None
+                job["error"] = f"{e}。POST /jobs/{job['id']}/retry で完了を確認し、残りを続けられます"
+            except AdmissionError as e:
+                job["status"] = "failed"
+                job["error"] = f"{e}。しばらくしてから再送信してください"
+            except Exception as e:
+                logger.error(f"HTTP 受付ジョブ失敗 ({job['id']}): {e}")
+                job["status"] = "failed"
+                job["error"] = str(e)
+            finally:
+                job["finished"] = time.time()
+        logger.info(f"HTTP 受付ジョブ {job['status']}: {job['id']} ({job['kind']})")
+
+    def _expire_jobs(self) -> None:
+        """終了から job_ttl 秒が経ったジョブの記録を捨てる"""
+        deadline = time.time() - self.job_ttl
+        expired = [i for i, j in self.jobs.items() if j["finished"] and j["finished"] < deadline]
+        for job_id in expired:
+            del self.jobs[job_id]
+            self._discard_progress(job_id)
+
+    # -----------------------------------------------------------------
+    #  補助
+    # -----------------------------------------------------------------
+    async def _save_upload(self, part) -> str:
+        """アップロードを CHUNK_BYTES ずつ一時ファイルに書き出し、パスを返す"""
+        fd, path = tempfile.mkstemp(prefix="ingest_", dir=self.upload_dir)
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while chunk := await part.read_chunk(CHUNK_BYTES):
+                    size += len(chunk)
+                    if size > self.max_upload_bytes:
+                        raise IngestError(
+                            f"画像が大きすぎます（上限 {self.max_upload_bytes // (1024 * 1024)}MB）", 413
+                        )
+                    f.write(chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+        if size == 0:
+            os.remove(path)
+            raise IngestError("画像ファイルが空です")
+        return path
+
+    def _job(self, job_id: str) -> dict:
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise IngestError("ジョブが見つかりません（期限切れの可能性があります）", 404)
+        return job
+
+    def _target(self, name: str | None) -> str:
+        name = name or self.router.default_target_name
+        if name not in self.router.targets:
+            raise IngestError(f"台帳が見つかりません: {name}")
+        return name
+
+    def _row_data(self, fields: dict, ocr_data: dict) -> dict:
+        """入力項目（優先）と OCR 結果から書き込みデータを作る"""
+        amount_text = fields.get("amount") or ocr_data.get("amount", "")
+        if not amount_text:
+            raise IngestError("金額を読み取れませんでした。amount を指定してください", 422)
+        try:
+            amount = parse_amount_input(amount_text)
+        except ValueError:
+            raise IngestError(f"金額が正しくありません: {amount_text}")
+        author = fields.get("author") or self.default_author
+        return build_row_data(
+            author,
+            fields.get("date") or ocr_data.get("date") or date.today().strftime("%Y/%m/%d"),
+            fields.get("category") or ocr_data.get("category") or "経費",
+            fields.get("payer") or author,
+            fields.get("purpose") or ocr_data.get("purpose", ""),
+            amount,
+        )
+
+    @staticmethod
+    def _accepted(job: dict) -> web.Response:
+        return web.json_response(
+            {"job_id": job["id"], "status": job["status"], "url": f"/jobs/{job['id']}"},
+            status=202,
+        )
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _summary(row_data: dict, result: dict) -> dict:
+    return {
+        "date": row_data["日付"],
+        "purpose": row_data["使用用途"],
+        "category": row_data["勘定科目"],
+        "payer": row_data["立て替えた人"],
+        "amount": row_data["出金"],
+        "drive_link": result.get("drive_link", ""),
+    }
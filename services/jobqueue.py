@@ -0,0 +1,286 @@
+"""
+ジョブキュー - SQLite を使ったプロセス間のローカルキュー
+
+ワーカーモード（WORKER_MODE=1）では、ゲートウェイ（bot.py）が OCR・Drive・Sheets の
+処理をジョブとして登録し、worker.py のワーカープロセスが取り出して実行する。
+結果は同じテーブルに書き戻され、ゲートウェイがポーリングして Embed を更新する。
+
+同じスプレッドシートへの書き込みジョブは、差引残高と行番号の競合を避けるため
+同時に1つのワーカーしか実行しない（スプレッドシート内では登録順。台帳名が違っても
+同じスプレッドシートなら直列にする）。読み取りだけのジョブは target を記録せず、
+書き込みジョブの実行中でも取り出す。
+
+申請（submit）の payload に submission_key があれば、同じキーの未完了・完了済みのジョブを
+再登録せずにそのジョブを返す（時間内に完了しなかった申請を再送信しても二重に書き込まない）。
+
+ゲートウェイ側の SQLite 呼び出し（登録・ポーリング）は、ワーカーがロックを持っている間に
+Discord のイベントループを止めないよう、別スレッドで行う。
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+from services import tracing
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    target      TEXT,
+    dedupe_key  TEXT,
+    payload     TEXT NOT NULL,
+    blob        BLOB,
+    status      TEXT NOT NULL DEFAULT 'queued',
+    result      TEXT,
+    error       TEXT,
+    worker      TEXT,
+    created_at  REAL NOT NULL,
+    started_at  REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+# 以前のスキーマ（dedupe_key 列なし）のキューに追加する
+_MIGRATIONS = {
+    "dedupe_key": "ALTER TABLE jobs ADD COLUMN dedupe_key TEXT",
+}
+
+
+# 台帳を読むだけのジョブ（同じ台帳の書き込みジョブと並行して実行してよい）
+READ_ONLY_KINDS = frozenset({"analyze", "find_unsettled", "export"})
+
+
+def _serial_target(kind: str, payload: dict, router=None) -> str | None:
+    """
+    同じスプレッドシートのジョブと直列に実行すべきなら、その直列化のキーを返す
+
+    router（LedgerRouter）があれば台帳のスプレッドシート ID、なければ台帳名をキーにする。
+    """
+    if kind in READ_ONLY_KINDS:
+        return None
+    if kind == "recompute_balances" and payload.get("dry_run"):
+        return None
+    name = payload.get("target")
+    if router is None:
+        return name
+    target = router.targets.get(name or router.default_target_name)
+    return target.spreadsheet_id if target else name
+
+
+def _dedupe_key(kind: str, payload: dict) -> str | None:
+    """再送信を同じジョブにまとめるキー（申請の submission_key）"""
+    key = payload.get("submission_key")
+    return f"{kind}:{key}" if kind == "submit" and key else None
+
+
+class JobError(Exception):
+    """ワーカーでのジョブ実行に失敗した、またはワーカーが応答せず取り消した"""
+
+
+class JobStillRunning(Exception):
+    """
+    ワーカーがジョブを実行中のまま時間内に完了しなかった（失敗ではない）
+
+    ワーカーはこの後も書き込むことがあるため、同じ内容を別のジョブとして再登録しない。
+    submission_key を付けた申請なら、再送信すると同じジョブの結果を待つ。
+    """
+
+    def __init__(self, job_id: str):
+        super().__init__(f"ワーカーで処理中です（ジョブ ID: {job_id}）。完了すると台帳に反映されます")
+        self.job_id = job_id
+
+
+class JobQueue:
+    """SQLite テーブル1つで実装したジョブキュー（複数プロセスから同時に使える）"""
+
+    def __init__(self, path: str, router=None):
+        # router（LedgerRouter）を渡すと、書き込みジョブをスプレッドシートごとに直列化する
+        self.path = path
+        self.router = router
+        # ゲートウェイでは asyncio.to_thread の複数のスレッドから使うため、接続の利用は _lock で直列化する
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+        for column, sql in _MIGRATIONS.items():
+            if column not in columns:
+                self.conn.execute(sql)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_dedupe_key ON jobs (dedupe_key)")
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self.conn.execute(sql, params)
+
+    # -----------------------------------------------------------------
+    #  ゲートウェイ側
+    # -----------------------------------------------------------------
+    def enqueue(self, kind: str, payload: dict, blob: bytes | None = None) -> str:
+        """
+        ジョブを登録して ID を返す（トレース中なら、その情報もワーカーに引き継ぐ）
+
+        同じ submission_key のジョブが未完了・完了済みなら、登録せずにそのジョブの ID を返す
+        （失敗・取り消し済みなら書き込んでいないので、新しく登録する）。
+        """
+        trace = tracing.context()
+        if trace:
+            payload = {**payload, "_trace": trace}
+        dedupe_key = _dedupe_key(kind, payload)
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if dedupe_key:
+                    row = self.conn.execute(
+                        "SELECT id FROM jobs WHERE dedupe_key = ? AND status IN ('queued', 'running', 'done') "
+                        "ORDER BY created_at DESC LIMIT 1",
+                        (dedupe_key,),
+                    ).fetchone()
+                    if row is not None:
+                        self.conn.execute("COMMIT")
+                        logger.info(f"同じ申請のジョブを再利用します: {row['id']}")
+                        return row["id"]
+                self.conn.execute(
+                    "INSERT INTO jobs (id, kind, target, dedupe_key, payload, blob, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        job_id,
+                        kind,
+                        _serial_target(kind, payload, self.router),
+                        dedupe_key,
+                        json.dumps(payload, ensure_ascii=False),
+                        blob,
+                        time.time(),
+                    ),
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def get(self, job_id: str) -> sqlite3.Row | None:
+        with self._lock:
+            return self.conn.execute(
+                "SELECT id, kind, status, result, error FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+
+    def cancel(self, job_id: str) -> bool:
+        """未着手のジョブを取り消す（実行中・完了済みなら False）"""
+        cur = self._execute(
+            "UPDATE jobs SET status = 'cancelled', blob = NULL, finished_at = ? "
+            "WHERE id = ? AND status = 'queued'",
+            (time.time(), job_id),
+        )
+        return cur.rowcount > 0
+
+    async def wait(self, job_id: str, timeout: float, poll_interval: float = 0.2) -> dict:
+        """
+        ジョブの完了を待って結果を返す
+
+        timeout 秒以内に完了しなかった場合、未着手なら取り消して JobError を、
+        実行中なら（この後も書き込むことがあるため）JobStillRunning を送出する。
+
+        Raises:
+            JobError: ワーカーで失敗した、または未着手のまま取り消した
+            JobStillRunning: 実行中のまま時間内に完了しなかった
+        """
+        deadline = time.monotonic() + timeout
+        timed_out = False
+        while True:
+            row = await asyncio.to_thread(self.get, job_id)
+            if row is None:
+                raise JobError("ジョブが見つかりません")
+            if row["status"] == "done":
+                return json.loads(row["result"])
+            if row["status"] in ("error", "cancelled"):
+                raise JobError(row["error"] or "ジョブが取り消されました")
+            if timed_out:
+                raise JobStillRunning(job_id)
+            if time.monotonic() > deadline:
+                if await asyncio.to_thread(self.cancel, job_id):
+                    raise JobError("ワーカーが応答しません（ジョブを取り消しました）")
+                timed_out = True  # 取り消す前に完了・失敗していないか、もう一度確かめる
+                continue
+            await asyncio.sleep(poll_interval)
+
+    async def run(self, kind: str, payload: dict, blob: bytes | None = None, timeout: float = 120) -> dict:
+        """ジョブを登録し、完了まで待って結果を返す"""
+        job_id = await asyncio.to_thread(self.enqueue, kind, payload, blob)
+        return await self.wait(job_id, timeout)
+
+    # -----------------------------------------------------------------
+    #  ワーカー側
+    # -----------------------------------------------------------------
+    def claim(self, worker_id: str) -> sqlite3.Row | None:
+        """
+        実行可能な最も古いジョブを1件取り出して実行中にする
+
+        同じ台帳の書き込みジョブが他のワーカーで実行中の場合、その台帳の書き込みジョブは取り出さない
+        （読み取りだけのジョブは target が NULL なので、いつでも取り出せる）。
+        """
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT id, kind, payload, blob FROM jobs "
+                    "WHERE status = 'queued' AND (target IS NULL OR target NOT IN ("
+                    "    SELECT target FROM jobs WHERE status = 'running' AND target IS NOT NULL"
+                    ")) ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self.conn.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, started_at = ? WHERE id = ?",
+                        (worker_id, time.time(), row["id"]),
+                    )
+                self.conn.execute("COMMIT")
+                return row
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def complete(self, job_id: str, result: dict) -> None:
+        self._execute(
+            "UPDATE jobs SET status = 'done', result = ?, blob = NULL, finished_at = ? WHERE id = ?",
+            (json.dumps(result, ensure_ascii=False), time.time(), job_id),
+        )
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._execute(
+            "UPDATE jobs SET status = 'error', error = ?, blob = NULL, finished_at = ? WHERE id = ?",
+            (error, time.time(), job_id),
+        )
+
+    def fail_stale(self, older_than: float) -> int:
+        """
+        older_than 秒以上「実行中」のままのジョブを失敗扱いにする（ワーカー異常終了時の後始末）
+
+        書き込みが途中まで行われた可能性があるため、再実行はしない。
+        """
+        cur = self._execute(
+            "UPDATE jobs SET status = 'error', error = 'ワーカーが異常終了しました', "
+            "blob = NULL, finished_at = ? WHERE status = 'running' AND started_at < ?",
+            (time.time(), time.time() - older_than),
+        )
+        return cur.rowcount
+
+    def purge(self, older_than: float) -> int:
+        """完了・失敗してから older_than 秒以上経ったジョブを削除する"""
+        cur = self._execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'error', 'cancelled') AND finished_at < ?",
+            (time.time() - older_than,),
+        )
+        return cur.rowcount
@@ -0,0 +1,135 @@
+"""
+台帳インデックス - 行番号をシート全体のスキャンなしで引けるようにする
+
+シートを1回読み込んで「行番号 → 行の要約」を保持し、
+append_row や一括精算で書き込んだ内容はその場で反映する。
+手作業での編集に追従するため、一定時間（LEDGER_INDEX_TTL）で作り直す。
+"""
+import re
+import time
+from datetime import date
+
+# インデックスに保持する列（0-indexed）
+COL_DATE = 1      # B: 日付（支払日）
+COL_PAYER = 4     # E: 立て替えた人
+COL_EXPENSE = 7   # H: 出金
+COL_CHECK = 9     # J: 会計Check
+COL_SETTLE = 10   # K: 精算
+
+# 未処理とみなす値
+UNDONE_MARKS = ("未", "")
+
+
+def parse_sheet_date(value: str) -> date | None:
+    """シート上の日付文字列（2026/02/08, 2026-2-8, 2026年2月8日）を date に変換する"""
+    match = re.search(r"(\d{4})\s*[/\-\.年]\s*(\d{1,2})\s*[/\-\.月]\s*(\d{1,2})", value or "")
+    if not match:
+        return None
+    try:
+        return date(*(int(g) for g in match.groups()))
+    except ValueError:
+        return None
+
+
+def parse_amount(value) -> int:
+    """シート上の金額（¥1,500 等）を整数にする。数値でなければ 0"""
+    text = str(value).replace(",", "").replace("¥", "").replace("￥", "").replace(" ", "")
+    try:
+        return int(float(text))
+    except ValueError:
+        return 0
+
+
+def _cell(row: list, index: int) -> str:
+    return str(row[index]).strip() if len(row) > index else ""
+
+
+class LedgerIndex:
+    """行番号（1-indexed）→ 日付・立て替えた人・出金・会計Check・精算 のインデックス"""
+
+    def __init__(self, ttl: float = 300):
+        self.ttl = ttl
+        self.entries: dict[int, dict] = {}
+        self.built_at: float | None = None
+
+    @property
+    def stale(self) -> bool:
+        return self.built_at is None or time.monotonic() - self.built_at > self.ttl
+
+    def build(self, all_values: list[list[str]]) -> None:
+        """シート全体の値（ヘッダー行を含む）からインデックスを作り直す"""
+        self.entries = {}
+        for row_number, row in enumerate(all_values[1:], start=2):
+            self.update(row_number, row)
+        self.built_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        self.built_at = None
+
+    def update(self, row_number: int, row: list) -> None:
+        """1行分の内容を反映する（立て替えた人が空の行は対象外）"""
+        payer = _cell(row, COL_PAYER)
+        if not payer:
+            self.entries.pop(row_number, None)
+            return
+        self.entries[row_number] = {
+            "row": row_number,
+            "date": parse_sheet_date(_cell(row, COL_DATE)),
+            "date_str": _cell(row, COL_DATE),
+            "payer": payer,
+            "expense": parse_amount(_cell(row, COL_EXPENSE)),
+            COL_CHECK: _cell(row, COL_CHECK),
+            COL_SETTLE: _cell(row, COL_SETTLE),
+        }
+
+    def set_mark(self, row_numbers: list[int], column: int, value: str) -> None:
+        """会計Check / 精算 の書き込みをインデックスに反映する"""
+        for row_number in row_numbers:
+            entry = self.entries.get(row_number)
+            if entry is not None:
+                entry[column] = value
+
+    def find_undone(
+        self,
+        column: int,
+        payer: str | None = None,
+        date_from: date | None = None,
+        date_to: date | None = None,
+    ) -> list[dict]:
+        """指定列が未処理の行を、立て替えた人・日付範囲で絞り込んで返す（行番号順）"""
+        result = []
+        for entry in self.entries.values():
+            if entry[column] not in UNDONE_MARKS:
+                continue
+            if payer and entry["payer"] != payer:
+                continue
+            if date_from or date_to:
+                if entry["date"] is None:
+                    continue
+                if date_from and entry["date"] < date_from:
+                    continue
+                if date_to and entry["date"] > date_to:
+                    continue
+            result.append(entry)
+        result.sort(key=lambda e: e["row"])
+        return result
+
+
+def entry_matches(entry: dict, row: list) -> bool:
+    """インデックスの行の要約が、読み直した行の値（A列から）と同じ内容か（日付・立て替えた人・出金で比べる）"""
+    return (
+        _cell(row, COL_DATE) == entry["date_str"]
+        and _cell(row, COL_PAYER) == entry["payer"]
+        and parse_amount(_cell(row, COL_EXPENSE)) == entry["expense"]
+    )
+
+
+def contiguous_runs(row_numbers: list[int]) -> list[tuple[int, int]]:
+    """行番号のリストを連続区間 [(開始, 終了), ...] にまとめる"""
+    runs: list[tuple[int, int]] = []
+    for n in sorted(set(row_numbers)):
+        if runs and n == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], n)
+        else:
+            runs.append((n, n))
+    return runs
@@ -0,0 +1,306 @@
+"""
+店名辞書 - 過去の申請から「店名 → よく使う使用用途・勘定科目」を学習し、フォームに自動入力する
+
+学習元は申請時に OCR で検出した店名と、ユーザーが最終的に入力した使用用途・勘定科目。
+（台帳には店名の列がなく、使用用途の語は「お茶」のような品名が多いため、台帳からは学習しない）
+
+店名はレシートの先頭の店名欄（日付・金額の行より上、store_lines()）から取り、照合もそこだけで行う。
+「領収書」「レシート」などの見出し・定型文や短すぎる語は店名として登録しない。
+照合は、正規化した店名すべてを Aho-Corasick オートマトンにまとめ、
+店名欄を1回走査するだけで行う（店名の数によらずテキスト長に比例）。
+辞書は MERCHANT_INDEX_FILE（JSON）に保存する。保存はファイルロックの中で
+最新の内容を読み直してから行うため、複数のワーカーが同時に学習しても更新は失われない。
+"""
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, deque
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows ではプロセス間のロックなし
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 正規化で取り除く文字（空白・記号。長音記号「ー」は店名の一部なので残す）
+_STRIP_CHARS = re.compile(r"[\s\-‐－―_・,.、。:：;；/／\\|()（）\[\]【】「」『』\"'*#＊＃!！?？~〜]")
+# 店名の末尾の支店名（「渋谷店」「駅前店」など）
+_BRANCH_SUFFIX = re.compile(r"\S{1,8}店$")
+# 店名欄の終わり（日付・金額が書かれた行）
+_DATE_OR_AMOUNT = re.compile(r"\d{1,4}\s*[/\-\.年]\s*\d{1,2}|[¥￥]\s*\d|\d\s*円")
+
+MIN_KEY_LENGTH = 3
+# 店名欄とみなす先頭の行数
+STORE_LINES = 4
+
+# 店名として登録しないレシートの見出し・定型文（正規化した形）
+STOP_WORDS = (
+    "領収書", "領収証", "領収", "レシート", "receipt", "御買上", "お買上げ", "お買い上げ", "お買上",
+    "明細書", "明細", "お客様控え", "控え", "売上票", "伝票", "合計", "小計", "税込", "消費税",
+    "お預り", "お預かり", "お釣り", "現金", "担当", "登録番号", "電話", "tel", "fax",
+    "毎度ありがとうございます", "ありがとうございました", "いらっしゃいませ", "上記正に領収いたしました",
+    "但し", "品代として", "御中",
+)
+_STOP_PATTERN = re.compile("|".join(sorted(map(re.escape, STOP_WORDS), key=len, reverse=True)))
+
+
+def normalize(text: str) -> str:
+    """全角・半角、大文字・小文字、空白・記号の違いを吸収する"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return _STRIP_CHARS.sub("", text)
+
+
+def store_key(name: str) -> str:
+    """店名を辞書のキーにする（支店名は取り除く）"""
+    name = name.strip()
+    parts = name.split()
+    if len(parts) > 1 and _BRANCH_SUFFIX.fullmatch(parts[-1]):
+        name = " ".join(parts[:-1])
+    return normalize(name)
+
+
+def is_store_key(key: str) -> bool:
+    """
+    辞書のキーにしてよいか
+
+    見出し・定型文と数字を除いて MIN_KEY_LENGTH 文字以上残るものだけを店名とみなす
+    （「領収書」「合計¥450」「No.123」や「お茶」のような短い語は登録しない）。
+    """
+    return len(re.sub(r"\d", "", _STOP_PATTERN.sub("", key))) >= MIN_KEY_LENGTH
+
+
+def store_lines(text: str) -> list[str]:
+    """レシートの店名欄（先頭から日付・金額の行の手前まで。最大 STORE_LINES 行）"""
+    lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if len(lines) >= STORE_LINES or _DATE_OR_AMOUNT.search(line):
+            break
+        lines.append(line)
+    return lines
+
+
+def guess_store(text: str) -> str:
+    """店名欄から店名らしい最初の行を返す（なければ空文字）"""
+    for line in store_lines(text):
+        if is_store_key(store_key(line)):
+            return line[:50]
+    return ""
+
+
+class AhoCorasick:
+    """複数パターンの同時照合（goto / failure / output の古典的な構成）"""
+
+    def __init__(self, patterns: list[str]):
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.output: list[int] = [-1]  # その状態で終わる最長パターンの番号（-1 はなし）
+        self.patterns = patterns
+
+        for index, pattern in enumerate(patterns):
+            state = 0
+            for ch in pattern:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(-1)
+                state = nxt
+            self.output[state] = index
+
+        # 幅優先で failure リンクを張る
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                if self.output[nxt] == -1:
+                    self.output[nxt] = self.output[self.fail[nxt]]
+
+    def search(self, text: str):
+        """(終了位置, パターン番号) を出現順に返す（各位置で最長のもの）"""
+        state = 0
+        for pos, ch in enumerate(text):
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            if self.output[state] != -1:
+                yield pos, self.output[state]
+
+
+class MerchantIndex:
+    """正規化した店名 → 使用用途・勘定科目の出現回数"""
+
+    def __init__(self, path: str = ""):
+        self.path = path
+        self.entries: dict[str, dict] = {}
+        self._automaton: AhoCorasick | None = None
+        self._mtime: float | None = None
+        self._lock = threading.Lock()
+        self._load()
+
+    # -----------------------------------------------------------------
+    #  学習
+    # -----------------------------------------------------------------
+    def learn(self, store: str, purpose: str, category: str) -> None:
+        """
+        店名と、そのとき使われた使用用途・勘定科目を1件登録する
+
+        ファイルに保存する場合は、他のプロセスの更新を失わないよう、ファイルロックの中で
+        最新の辞書を読み直してから追加して書き込む。
+        """
+        key = store_key(store or "")
+        if not is_store_key(key):
+            return
+        with self._file_lock():
+            self._reload_if_changed()
+            with self._lock:
+                entry = self.entries.get(key)
+                if entry is None:
+                    entry = {"name": store.strip(), "purposes": Counter(), "categories": Counter()}
+                    self.entries[key] = entry
+                    self._automaton = None
+                if purpose:
+                    entry["purposes"][purpose.strip()] += 1
+                if category:
+                    entry["categories"][category.strip()] += 1
+            self._save()
+
+    # -----------------------------------------------------------------
+    #  照合
+    # -----------------------------------------------------------------
+    def match(self, text: str) -> dict | None:
+        """
+        OCR テキストの店名欄（store_lines）で既知の店名を探し、最もよく使われた使用用途・勘定科目を返す
+
+        複数見つかった場合は最も長い店名を優先する（同じ長さならテキストの先頭に近いもの）。
+
+        Returns:
+            {"store", "purpose", "category"} または None
+        """
+        self._reload_if_changed()
+        automaton = self._get_automaton()
+        if automaton is None:
+            return None
+
+        best = None
+        for line in store_lines(text):
+            for pos, index in automaton.search(normalize(line)):
+                key = automaton.patterns[index]
+                if best is None or len(key) > len(best):
+                    best = key
+        if best is None:
+            return None
+
+        # analyze（別スレッド）と learn が同時に動くことがあるため、ロックの中で読む
+        with self._lock:
+            entry = self.entries.get(best)
+            if entry is None:
+                return None
+            purpose = entry["purposes"].most_common(1)
+            category = entry["categories"].most_common(1)
+        return {
+            "store": entry["name"],
+            "purpose": purpose[0][0] if purpose else "",
+            "category": category[0][0] if category else "",
+        }
+
+    def _get_automaton(self) -> AhoCorasick | None:
+        with self._lock:
+            if self._automaton is None and self.entries:
+                self._automaton = AhoCorasick(list(self.entries))
+            return self._automaton
+
+    # -----------------------------------------------------------------
+    #  保存・読み込み
+    # -----------------------------------------------------------------
+    @contextmanager
+    def _file_lock(self):
+        """辞書ファイルの読み直し〜書き込みを、プロセス間で排他する（MERCHANT_INDEX_FILE.lock）"""
+        if not self.path or fcntl is None:
+            yield
+            return
+        try:
+            lock_file = open(f"{self.path}.lock", "a")
+        except OSError as e:
+            logger.warning(f"店名辞書のロックファイルを開けません: {e}")
+            yield
+            return
+        with lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save(self) -> None:
+        """一時ファイルに書いてから置き換える（_file_lock の中で呼ぶ）"""
+        if not self.path:
+            return
+        with self._lock:
+            data = {
+                "entries": {
+                    key: {
+                        "name": e["name"],
+                        "purposes": dict(e["purposes"]),
+                        "categories": dict(e["categories"]),
+                    }
+                    for key, e in self.entries.items()
+                },
+            }
+        tmp = f"{self.path}.tmp{os.getpid()}.{threading.get_ident()}"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+            self._mtime = os.path.getmtime(self.path)
+        except OSError as e:
+            logger.warning(f"店名辞書の保存に失敗: {e}")
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            mtime = os.path.getmtime(self.path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"店名辞書の読み込みに失敗: {e}")
+            return
+        with self._lock:
+            # 以前の版で登録された見出し・短い語（「領収書」「お茶」など）は読み込まない
+            self.entries = {
+                key: {
+                    "name": e["name"],
+                    "purposes": Counter(e.get("purposes", {})),
+                    "categories": Counter(e.get("categories", {})),
+                }
+                for key, e in data.get("entries", {}).items()
+                if is_store_key(key)
+            }
+            self._automaton = None
+            self._mtime = mtime
+
+    def _reload_if_changed(self) -> None:
+        """他のプロセス（ワーカー）が辞書を更新していれば読み直す"""
+        if not self.path:
+            return
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self._load()
@@ -0,0 +1,244 @@
+"""
+OCR エンジン - Vision API とローカル Tesseract を切り替え・併用する
+
+OCR_MODE で使い方を選ぶ:
+    vision            Vision API のみ（従来どおり）
+    vision+tesseract  Vision API が未設定・クォータ超過・通信不可のとき Tesseract で代替
+    tesseract+vision  まず Tesseract で読み、信頼度が低い・金額が読めない場合だけ Vision API
+    tesseract         Tesseract のみ（オフライン）
+
+Tesseract の利用には tesseract 本体（日本語データ jpn を含む）と
+pytesseract・Pillow のインストールが必要。未インストールの場合は自動的に無効になる。
+"""
+import abc
+import io
+import logging
+import statistics
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from services.receipt_layout import Word, join_line
+from services.receipt_parser import parse_receipt_text
+from services.tracing import span
+from services.vision import VisionService
+import config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pytesseract
+    from PIL import Image
+except ImportError:  # 任意の依存パッケージ
+    pytesseract = None
+    Image = None
+
+
+class OcrEngine(abc.ABC):
+    """OCR エンジンの共通インターフェース"""
+
+    name = "base"
+
+    @abc.abstractmethod
+    def recognize(self, image_bytes: bytes) -> dict:
+        """
+        画像からテキストを読み取る
+
+        Returns:
+            {"text": str, "confidence": float (0.0〜1.0)}
+            複数のレシートを切り分けられるエンジンは "receipts"（レシートごとのテキスト）も返す
+        """
+
+
+class VisionEngine(OcrEngine):
+    """Google Vision API（信頼度は返らないため、テキストがあれば 1.0 とする）"""
+
+    name = "vision"
+
+    def __init__(self, vision_service: VisionService):
+        self.vision_service = vision_service
+
+    def recognize(self, image_bytes: bytes) -> dict:
+        text, receipts = self.vision_service.detect_receipts(image_bytes)
+        return {"text": text, "confidence": 1.0 if text else 0.0, "receipts": receipts}
+
+
+def _tesseract_recognize(image_bytes: bytes, lang: str, tesseract_cmd: str) -> dict:
+    """Tesseract で OCR する（ProcessPoolExecutor の子プロセスで実行される）"""
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    image = Image.open(io.BytesIO(image_bytes)).convert("L")
+    data = pytesseract.image_to_data(image, lang=lang, output_type=pytesseract.Output.DICT)
+
+    # 単語を行ごとにまとめ、単語の位置のすき間で空白を入れるか決めてテキストを組み立てる
+    # （jpn は1文字ずつに分かれやすいため、空白でつなぐと「合 計 ¥ 1 , 5 0 0」になり金額が読めない）
+    # 単語の信頼度の平均を全体の信頼度とする
+    lines: dict[tuple, list[Word]] = {}
+    confidences = []
+    for i, word in enumerate(data["text"]):
+        word = word.strip()
+        conf = float(data["conf"][i])
+        if not word or conf < 0:
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        left, top = data["left"][i], data["top"][i]
+        lines.setdefault(key, []).append(
+            Word(word, left, top, left + data["width"][i], top + data["height"][i])
+        )
+        confidences.append(conf)
+
+    unit = statistics.median(w.height for words in lines.values() for w in words) if lines else 1.0
+    text = "\n".join(join_line(words, unit or 1.0) for _, words in sorted(lines.items()))
+    confidence = sum(confidences) / len(confidences) / 100 if confidences else 0.0
+    return {"text": text, "confidence": confidence}
+
+
+class TesseractEngine(OcrEngine):
+    """ローカルの Tesseract（プロセスプールで実行し、イベントループや他の処理と CPU を分ける）"""
+
+    name = "tesseract"
+
+    def __init__(
+        self,
+        lang: str = "jpn",
+        processes: int = 2,
+        tesseract_cmd: str = "",
+        timeout: float = 60,
+    ):
+        if pytesseract is None:
+            raise RuntimeError("pytesseract / Pillow がインストールされていません")
+        self.lang = lang
+        self.tesseract_cmd = tesseract_cmd
+        self.timeout = timeout
+        self.processes = processes
+        self._pool = ProcessPoolExecutor(max_workers=processes)
+        self._pool_lock = threading.Lock()
+
+    def recognize(self, image_bytes: bytes) -> dict:
+        pool = self._pool
+        future = pool.submit(_tesseract_recognize, image_bytes, self.lang, self.tesseract_cmd)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            self._recycle(pool)
+            raise TimeoutError(f"Tesseract が {self.timeout:.0f}秒以内に終わりませんでした")
+
+    def _recycle(self, pool: ProcessPoolExecutor) -> None:
+        """
+        応答しない子プロセスを止め、プロセスプールを作り直す
+
+        実行中の子プロセスは取り消せないため、プールごと終了させる。
+        同じプールで実行中だった他の OCR も失敗し、次の OCR エンジンに回される。
+        """
+        with self._pool_lock:
+            if self._pool is not pool:
+                return  # 他のスレッドが作り直し済み
+            self._pool = ProcessPoolExecutor(max_workers=self.processes)
+        logger.warning("Tesseract が応答しないため、プロセスプールを作り直しました")
+        kill_workers = getattr(pool, "kill_workers", None)  # Python 3.14 以降
+        if kill_workers is not None:
+            kill_workers()
+        else:
+            for process in list((getattr(pool, "_processes", None) or {}).values()):
+                process.kill()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+class OcrService:
+    """
+    複数の OCR エンジンを順に試すサービス（VisionService と同じ analyze_receipt を持つ）
+
+    escalate=True の場合は、信頼度が threshold 未満、または金額が読み取れなかったときも
+    次のエンジンに回す（例: Tesseract で読めなければ Vision API）。
+    escalate=False の場合は、エラー・空の結果のときだけ次のエンジンに回す（フォールバック）。
+    """
+
+    def __init__(self, engines: list[OcrEngine], escalate: bool = False, threshold: float = 0.6):
+        if not engines:
+            raise ValueError("OCR エンジンが1つもありません")
+        self.engines = engines
+        self.escalate = escalate
+        self.threshold = threshold
+
+    def analyze_receipt(self, image_bytes: bytes) -> tuple[str, dict]:
+        """
+        レシート画像を解析し、OCRテキストと構造化データを返す
+
+        Returns:
+            (raw_text, parsed_data) のタプル（parsed_data は receipt_parser 参照）
+        """
+        raw_text, receipts = self.analyze_receipts(image_bytes)
+        return raw_text, receipts[0][1] if receipts else {}
+
+    def analyze_receipts(self, image_bytes: bytes) -> tuple[str, list[tuple[str, dict]]]:
+        """
+        レシート画像を解析し、OCRテキストとレシートごとの (テキスト, 構造化データ) を返す
+
+        1枚の画像に複数のレシートが写っている場合（Vision API のみ対応）は、レシートごとに解析する。
+        1枚の場合は (全体のテキスト, 構造化データ) の1件だけになる。テキストがなければ空のリスト。
+        """
+        best: tuple[str, list] = ("", [])
+        last_error: Exception | None = None
+        for i, engine in enumerate(self.engines):
+            is_last = i == len(self.engines) - 1
+            started = time.perf_counter()
+            try:
+                with span(f"ocr.{engine.name}"):
+                    result = engine.recognize(image_bytes)
+            except Exception as e:
+                logger.warning(f"OCRエンジン {engine.name} 失敗: {e}")
+                last_error = e
+                continue
+            elapsed = (time.perf_counter() - started) * 1000
+
+            text = result["text"]
+            if not text:
+                logger.info(f"OCRエンジン {engine.name}: テキストなし ({elapsed:.0f}ms)")
+                continue
+
+            receipts = [(t, parse_receipt_text(t)) for t in result.get("receipts") or [text]]
+            best = (text, receipts)
+            amounts = [parsed.get("amount") for _, parsed in receipts]
+            confident = result["confidence"] >= self.threshold and all(amounts)
+            logger.info(
+                f"OCRエンジン {engine.name}: 信頼度 {result['confidence']:.2f} "
+                f"金額 {', '.join(a or 'なし' for a in amounts)} ({elapsed:.0f}ms)"
+            )
+            if is_last or not self.escalate or confident:
+                return best
+            logger.info(f"信頼度が低いため次のOCRエンジンに回します: {engine.name} → {self.engines[i + 1].name}")
+
+        if best[0]:
+            return best
+        if last_error is not None:
+            raise last_error
+        return best
+
+
+def build_ocr_service(vision_service: VisionService | None) -> OcrService | None:
+    """OCR_MODE の設定に従って OcrService を組み立てる（使えるエンジンがなければ None）"""
+    engines: dict[str, OcrEngine] = {}
+    if vision_service is not None:
+        engines["vision"] = VisionEngine(vision_service)
+    if "tesseract" in config.OCR_MODE:
+        try:
+            engines["tesseract"] = TesseractEngine(
+                lang=config.TESSERACT_LANG,
+                processes=config.TESSERACT_PROCESSES,
+                tesseract_cmd=config.TESSERACT_CMD,
+            )
+            logger.info(f"Tesseract 初期化完了 (lang={config.TESSERACT_LANG})")
+        except Exception as e:
+            logger.error(f"Tesseract 初期化失敗: {e}")
+
+    order = [name for name in config.OCR_MODE.split("+") if name in engines]
+    if not order:
+        return None
+    escalate = config.OCR_MODE.startswith("tesseract+")
+    logger.info(f"OCRエンジン: {' → '.join(order)}" + ("（信頼度が低い場合に次へ）" if escalate else ""))
+    return OcrService(
+        [engines[name] for name in order],
+        escalate=escalate,
+        threshold=config.OCR_CONFIDENCE_THRESHOLD,
+    )
@@ -0,0 +1,386 @@
+"""
+レシート処理パイプライン - Discord に依存しない OCR・Drive・Sheets の処理
+
+Cog（ゲートウェイ）からは run_job() 経由で呼び出す。
+同一プロセスで実行する場合も、worker.py のワーカープロセスで実行する場合も
+同じ関数・同じ入出力（JSON 化できる dict）になるようにしている。
+同一プロセスでは run_job_async() を使うと、OCR は別スレッド、Drive / Sheets は
+非同期クライアント（services/google_rest.py）で実行され、イベントループを止めない。
+"""
+import asyncio
+import logging
+import os
+import tempfile
+from collections import defaultdict
+from datetime import date
+
+from services.export import export_ledger
+from services.merchant_index import MerchantIndex, guess_store
+from services.ocr import OcrService
+from services.routing import ServicePool
+from services.tracing import span
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class ReceiptPipeline:
+    """OCR 解析と申請データの保存（Drive アップロード → Sheets 書き込み）"""
+
+    def __init__(
+        self,
+        ocr_service: OcrService | None,
+        services: ServicePool,
+        merchant_index: MerchantIndex | None = None,
+    ):
+        self.ocr_service = ocr_service
+        self.services = services
+        self.merchant_index = merchant_index
+        # submit_async で同じスプレッドシートへの行追加を直列化するロック（スプレッドシートID → Lock）
+        self._append_locks: defaultdict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    def analyze(self, image_bytes: bytes) -> dict:
+        """
+        レシート画像を OCR 解析する（OCR が無効・失敗の場合は空の結果）
+
+        1枚の画像に複数のレシートが並んでいる場合は、receipts にレシートごとの結果が入る
+        （ocr_text / ocr_data は1枚目と同じ。1枚の場合は ocr_text は画像全体のテキスト）。
+        店名辞書に一致する店名があれば、過去に最もよく使われた使用用途・勘定科目を
+        ocr_data の purpose / category に入れる（store には店名を入れる）。
+
+        Returns:
+            {"ocr_text": str, "ocr_data": dict, "receipts": [{"ocr_text", "ocr_data"}, ...],
+             "ocr_enabled": bool}
+        """
+        ocr_text = ""
+        receipts = []
+        if self.ocr_service:
+            try:
+                ocr_text, receipts = self.ocr_service.analyze_receipts(image_bytes)
+            except Exception as e:
+                logger.error(f"OCR失敗: {e}")
+                ocr_text = ""
+                receipts = []
+
+        results = [
+            {"ocr_text": text, "ocr_data": self._prefill(text, parsed)}
+            for text, parsed in receipts
+        ]
+        return {
+            "ocr_text": results[0]["ocr_text"] if results else ocr_text,
+            "ocr_data": results[0]["ocr_data"] if results else {},
+            "receipts": results,
+            "ocr_enabled": self.ocr_service is not None,
+        }
+
+    def _prefill(self, text: str, ocr_data: dict) -> dict:
+        """
+        店名辞書から店名・使用用途・勘定科目を補う
+
+        store には店名欄から取った店名を入れる（「領収書」などの見出ししかなければ空。
+        空の場合は申請時に店名辞書に登録しない）。
+        """
+        ocr_data = dict(ocr_data)
+        ocr_data["store"] = guess_store(text)
+        if self.merchant_index:
+            with span("merchant_match"):
+                match = self.merchant_index.match(text)
+            if match:
+                ocr_data["store"] = match["store"]
+                if match["purpose"]:
+                    ocr_data["purpose"] = match["purpose"]
+                if match["category"]:
+                    ocr_data["category"] = match["category"]
+        return ocr_data
+
+    def submit(
+        self,
+        target: str | None,
+        row_data: dict,
+        image_bytes: bytes | None = None,
+        filename: str | None = None,
+        store: str = "",
+    ) -> dict:
+        """
+        レシート画像を Drive にアップロードし、申請データを Sheets に1行追加する
+
+        Drive のアップロード失敗は記録して続行し、Sheets の書き込み失敗は例外を送出する。
+        アップロードできた場合は、画像のリンクを L列（レシート）に書き込む。
+        row_data に「レシート」のリンクがあれば（同じ画像の2枚目以降のレシート）、アップロードしない。
+        書き込み後、店名（store）と入力された使用用途・勘定科目を店名辞書に登録する。
+
+        Returns:
+            {"drive_link": str}
+        """
+        drive_link = row_data.get("レシート", "")
+        if image_bytes and not drive_link:
+            try:
+                with span("drive.upload"):
+                    drive_link = self.services.drive(target).upload_image(image_bytes, filename)
+            except Exception as e:
+                logger.error(f"Drive アップロード失敗: {e}")
+        if drive_link:
+            row_data = {**row_data, "レシート": drive_link}
+
+        sheets_service = self._sheets(target)
+        with span("sheets.append_row"):
+            sheets_service.append_row(row_data)
+
+        self._learn_merchant(store, row_data)
+        return {"drive_link": drive_link}
+
+    async def submit_async(
+        self,
+        target: str | None,
+        row_data: dict,
+        image_bytes: bytes | None = None,
+        filename: str | None = None,
+        store: str = "",
+    ) -> dict:
+        """
+        submit の非同期版（同一プロセス実行用）
+
+        Drive のアップロードは他の申請と並行して行い、Sheets への行追加は
+        差引残高と空き行の読み書きが交錯しないよう、スプレッドシートごとに1件ずつ行う。
+        """
+        drive_link = row_data.get("レシート", "")
+        if image_bytes and not drive_link:
+            try:
+                with span("drive.upload"):
+                    drive_service = await asyncio.to_thread(self.services.drive, target)
+                    drive_link = await drive_service.upload_image_async(image_bytes, filename)
+            except Exception as e:
+                logger.error(f"Drive アップロード失敗: {e}")
+        if drive_link:
+            row_data = {**row_data, "レシート": drive_link}
+
+        # 初回はサービスの作成（シート情報の取得）に googleapiclient を使うため別スレッドで
+        sheets_service = await asyncio.to_thread(self._sheets, target)
+        async with self.append_lock(target):
+            with span("sheets.append_row"):
+                await sheets_service.append_row_async(row_data)
+
+        # ファイルロックを待つことがあるため、別スレッドで登録する
+        await asyncio.to_thread(self._learn_merchant, store, row_data)
+        return {"drive_link": drive_link}
+
+    def _learn_merchant(self, store: str, row_data: dict) -> None:
+        """店名（OCR で検出したもの）と入力された使用用途・勘定科目を店名辞書に登録する"""
+        if not self.merchant_index or not store:
+            return
+        try:
+            with span("merchant_learn"):
+                self.merchant_index.learn(store, row_data.get("使用用途", ""), row_data.get("勘定科目", ""))
+        except Exception as e:
+            logger.warning(f"店名辞書の更新に失敗: {e}")
+
+    def find_unsettled(
+        self,
+        target: str | None,
+        column: str,
+        payer: str | None = None,
+        date_from: str | None = None,
+        date_to: str | None = None,
+    ) -> dict:
+        """
+        一括精算の対象行を探す（日付は ISO 形式の文字列で受け取る）
+
+        Returns:
+            {"entries": [{"sheet", "row", "date_str", "payer", "expense"}, ...]}
+        """
+        entries = self._sheets(target).find_unsettled(
+            column,
+            payer,
+            date.fromisoformat(date_from) if date_from else None,
+            date.fromisoformat(date_to) if date_to else None,
+        )
+        return {
+            "entries": [
+                {
+                    "sheet": e["sheet"],
+                    "row": e["row"],
+                    "date_str": e["date_str"],
+                    "payer": e["payer"],
+                    "expense": e["expense"],
+                }
+                for e in entries
+            ]
+        }
+
+    def mark_rows(self, target: str | None, entries: list[dict], column: str, value: str) -> dict:
+        """
+        会計Check / 精算 列を一括更新する（entries は find_unsettled の entries）
+
+        書き込む前に、すべての対象行が確認した時から変わっていないことを確かめ
+        （1つでも変わっていれば何も書き込まずに LedgerChangedError を送出する）、
+        年度シートをまたぐ場合も values.batchUpdate 1回で書き込む（SheetsService.mark_entries）。
+
+        Returns:
+            {"updated": int}
+        """
+        return {"updated": self._sheets(target).mark_entries(entries, column, value)}
+
+    def export(
+        self,
+        target: str | None,
+        fmt: str,
+        date_from: str | None = None,
+        date_to: str | None = None,
+        include_links: bool = False,
+        sheet_name: str | None = None,
+    ) -> dict:
+        """
+        台帳を期間で絞り込んで一時ファイルに書き出す（日付は ISO 形式の文字列で受け取る）
+
+        sheet_name を省略した場合は、期間に重なる年度シートをすべて読む（SheetsService.iter_ledger）。
+        ワーカーからも結果を受け渡せるよう、ファイルはパスで返す。削除は呼び出し元が行う。
+
+        Returns:
+            {"path": str, "rows": int, "size": int}
+        """
+        sheets_service = self._sheets(target)
+        start = date.fromisoformat(date_from) if date_from else None
+        end = date.fromisoformat(date_to) if date_to else None
+        fd, path = tempfile.mkstemp(prefix="ledger_export_", suffix=f".{fmt}")
+        try:
+            with os.fdopen(fd, "wb") as fp, span("export.write"):
+                rows = export_ledger(
+                    sheets_service.iter_ledger(config.EXPORT_CHUNK_ROWS, start, end, sheet_name),
+                    fp,
+                    fmt,
+                    start,
+                    end,
+                    include_links,
+                )
+        except Exception:
+            os.remove(path)
+            raise
+        return {"path": path, "rows": rows, "size": os.path.getsize(path)}
+
+    def recompute_balances(self, target: str | None, dry_run: bool = False) -> dict:
+        """差引残高を計算し直し、違うセルだけを書き直す（SheetsService.recompute_balances 参照）"""
+        return self._sheets(target).recompute_balances(dry_run)
+
+    def append_lock(self, target: str | None) -> asyncio.Lock:
+        """台帳のスプレッドシートへの書き込みを直列化する asyncio.Lock（submit_async と同じもの）"""
+        return self._append_locks[self._sheets(target).spreadsheet_id]
+
+    def _sheets(self, target: str | None):
+        sheets_service = self.services.sheets(target)
+        if not sheets_service:
+            raise RuntimeError("Google Sheets への接続が確立されていません。管理者に連絡してください。")
+        return sheets_service
+
+
+def parse_amount_input(text: str) -> int:
+    """
+    入力された金額（「1,500」「¥1500」等）を整数にする
+
+    Raises:
+        ValueError: 金額として読めない
+    """
+    return int(
+        str(text)
+        .replace(",", "").replace("¥", "").replace("￥", "")
+        .replace(" ", "").replace("　", "")
+    )
+
+
+def build_row_data(
+    author: str,
+    date_str: str,
+    category: str,
+    payer: str,
+    purpose: str,
+    amount: int,
+) -> dict:
+    """申請1件分の書き込みデータ（submit ジョブの row_data。入力日は今日）"""
+    return {
+        "入力日": date.today().strftime("%Y/%m/%d"),
+        "日付": date_str,
+        "記入者": author,
+        "勘定科目": category,
+        "立て替えた人": payer,
+        "使用用途": purpose,
+        "入金": 0,
+        "出金": amount,
+        "会計Check": "",
+        "精算": "",
+    }
+
+
+def run_job(pipeline: ReceiptPipeline, kind: str, payload: dict, blob: bytes | None = None) -> dict:
+    """
+    ジョブ1件を実行する（同一プロセス実行とワーカー実行の共通入口）
+
+    kind: "analyze" | "submit" | "find_unsettled" | "mark_rows" | "export" | "recompute_balances"
+    blob: 画像データ（analyze / submit のみ）
+    """
+    with span(f"job.{kind}"):
+        return _dispatch(pipeline, kind, payload, blob)
+
+
+async def run_job_async(pipeline: ReceiptPipeline, kind: str, payload: dict, blob: bytes | None = None) -> dict:
+    """
+    run_job の非同期版（同一プロセス実行用。入出力は run_job と同じ）
+
+    analyze は OCR を別スレッドで、submit は submit_async で実行する。
+    それ以外（Sheets の一括読み書き・エクスポートのファイル書き出し）も、
+    Discord のハートビートを止めないよう別スレッドで実行する。
+    recompute_balances は、実行中の行追加が終わるのを待ってから実行する。
+    """
+    with span(f"job.{kind}"):
+        if kind == "analyze":
+            return await asyncio.to_thread(pipeline.analyze, blob or b"")
+        if kind == "submit":
+            return await pipeline.submit_async(
+                payload.get("target"),
+                payload["row_data"],
+                blob,
+                payload.get("filename"),
+                payload.get("store", ""),
+            )
+        if kind == "recompute_balances":
+            async with pipeline.append_lock(payload.get("target")):
+                return await asyncio.to_thread(_dispatch, pipeline, kind, payload, blob)
+        return await asyncio.to_thread(_dispatch, pipeline, kind, payload, blob)
+
+
+def _dispatch(pipeline: ReceiptPipeline, kind: str, payload: dict, blob: bytes | None) -> dict:
+    if kind == "analyze":
+        return pipeline.analyze(blob or b"")
+    if kind == "submit":
+        return pipeline.submit(
+            payload.get("target"),
+            payload["row_data"],
+            blob,
+            payload.get("filename"),
+            payload.get("store", ""),
+        )
+    if kind == "find_unsettled":
+        return pipeline.find_unsettled(
+            payload.get("target"),
+            payload["column"],
+            payload.get("payer"),
+            payload.get("date_from"),
+            payload.get("date_to"),
+        )
+    if kind == "mark_rows":
+        return pipeline.mark_rows(
+            payload.get("target"),
+            payload["entries"],
+            payload["column"],
+            payload["value"],
+        )
+    if kind == "recompute_balances":
+        return pipeline.recompute_balances(payload.get("target"), payload.get("dry_run", False))
+    if kind == "export":
+        return pipeline.export(
+            payload.get("target"),
+            payload["format"],
+            payload.get("date_from"),
+            payload.get("date_to"),
+            payload.get("include_links", False),
+            payload.get("sheet_name"),
+        )
+    raise ValueError(f"不明なジョブ種別: {kind}")
@@ -0,0 +1,129 @@
+"""
+レシート判定の前処理 - OCR（有料の API 呼び出し）の前に、画像がレシートらしいかを手元で判定する
+
+縮小したグレースケール・HSV 画像から次の特徴を求め、重み付きの合計をスコア（0.0〜1.0）にする:
+    paper   明るい無彩色の画素の割合（感熱紙・白い紙）
+    ink     紙の上の黒い細い線（印字）の密度が文字として妥当か
+            （無地の画像・白抜き文字・ダークモードのスクリーンショットは外れる）
+    color   彩度の低さ（写真・イラスト・ミーム画像は彩度が高い）
+    sharp   エッジの強さのばらつき（ピンぼけ・低コントラストは小さい）
+    aspect  縦長・横長の度合い（レシートは細長いことが多い）
+
+Pillow が必要。未インストールの場合は判定を行わず、すべての画像をレシートとして扱う。
+"""
+import io
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image, ImageChops, ImageFilter, ImageStat
+except ImportError:  # 任意の依存パッケージ
+    Image = None
+
+# 特徴ごとの重み（合計 1.0）
+WEIGHTS = {
+    "print": 0.60,   # min(paper, ink)
+    "sharp": 0.15,
+    "aspect": 0.15,
+    "color": 0.10,
+}
+
+# 判定に使う縮小後の長辺（px）
+ANALYSIS_SIZE = 384
+
+# 紙とみなす明るさ・彩度、印字とみなす周囲との明るさの差・彩度（0〜255）
+_PAPER_BRIGHTNESS = 150
+_PAPER_SATURATION = 60
+_INK_CONTRAST = 40
+_INK_SATURATION = 90
+
+
+def _clamp(value: float) -> float:
+    return max(0.0, min(1.0, value))
+
+
+def _ratio(mask) -> float:
+    """2値画像（0 / 255）の 255 の割合"""
+    return ImageStat.Stat(mask).mean[0] / 255
+
+
+def _band(value: float, low: float, high: float, ramp: float) -> float:
+    """low〜high で 1.0、その外側は ramp の幅で 0.0 に下がる"""
+    if value < low:
+        return _clamp(value / low)
+    return _clamp(1 - (value - high) / ramp)
+
+
+class ReceiptPrefilter:
+    """画像がレシートらしいかを特徴量のスコアで判定する"""
+
+    def __init__(self, threshold: float = 0.5):
+        if Image is None:
+            raise RuntimeError("Pillow がインストールされていません")
+        self.threshold = threshold
+
+    def classify(self, image_bytes: bytes) -> dict:
+        """
+        画像を判定する
+
+        Returns:
+            {"is_receipt": bool, "score": float, "features": {名前: 0.0〜1.0}, "elapsed_ms": float}
+        """
+        started = time.perf_counter()
+        image = Image.open(io.BytesIO(image_bytes))
+        image.draft("RGB", (ANALYSIS_SIZE, ANALYSIS_SIZE))  # JPEG は縮小しながら読み込む
+        image = image.convert("RGB")
+        width, height = image.size
+        image.thumbnail((ANALYSIS_SIZE, ANALYSIS_SIZE))
+
+        gray = image.convert("L")
+        _, saturation, brightness = image.convert("HSV").split()
+
+        # 明るく彩度の低い画素 = 紙
+        bright = brightness.point(lambda p: 255 if p >= _PAPER_BRIGHTNESS else 0)
+        pale = saturation.point(lambda p: 255 if p <= _PAPER_SATURATION else 0)
+        paper_ratio = _ratio(ImageChops.multiply(bright, pale))  # 両方を満たす画素
+
+        # 周囲（5x5 の最大値 = 背景の明るさ）より十分暗い無彩色の細い線 = 印字（ブラックハット変換）
+        background = gray.filter(ImageFilter.MaxFilter(5))
+        darker = ImageChops.subtract(background, gray).point(lambda p: 255 if p >= _INK_CONTRAST else 0)
+        neutral = saturation.point(lambda p: 255 if p <= _INK_SATURATION else 0)
+        ink_ratio = _ratio(ImageChops.multiply(darker, neutral))
+
+        edge_spread = ImageStat.Stat(gray.filter(ImageFilter.FIND_EDGES)).stddev[0]
+        mean_saturation = ImageStat.Stat(saturation).mean[0] / 255
+
+        aspect = max(width, height) / max(1, min(width, height))
+        features = {
+            "paper": _clamp(paper_ratio / 0.3),
+            # 紙の面積に対する印字の割合（文字の多いレシートで 5%〜35% 程度）
+            "ink": _band(ink_ratio / paper_ratio, 0.05, 0.35, 0.30) if paper_ratio else 0.0,
+            "color": _clamp(1 - (mean_saturation - 0.1) / 0.3),
+            "sharp": _clamp(edge_spread / 40),
+            "aspect": _clamp((aspect - 1.0) / 1.0),
+        }
+        # 紙と印字は両方そろって初めてレシートらしいので、小さい方を使う
+        evidence = {**features, "print": min(features["paper"], features["ink"])}
+        score = sum(weight * evidence[name] for name, weight in WEIGHTS.items())
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        return {
+            "is_receipt": score >= self.threshold,
+            "score": round(score, 3),
+            "features": {name: round(value, 3) for name, value in features.items()},
+            "elapsed_ms": round(elapsed_ms, 1),
+        }
+
+
+def build_prefilter(mode: str, threshold: float) -> ReceiptPrefilter | None:
+    """PREFILTER_MODE が off でなければ ReceiptPrefilter を作る（Pillow がなければ None）"""
+    if mode == "off":
+        return None
+    try:
+        prefilter = ReceiptPrefilter(threshold)
+    except Exception as e:
+        logger.warning(f"レシート判定の前処理を無効にします: {e}")
+        return None
+    logger.info(f"レシート判定の前処理: mode={mode} threshold={threshold}")
+    return prefilter
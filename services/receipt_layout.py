@@ -0,0 +1,172 @@
+"""
+レシートの配置解析 - 1枚の写真に並べて撮られた複数のレシートを、OCR の単語の位置から切り分ける
+
+Vision API の text_annotations（2番目以降が単語ごとの bounding_poly）を使い、
+1回の API 呼び出しの結果だけでレシートごとのテキストに分ける。
+
+    1. 単語の外接矩形を、すき間で再帰的に分割する（XY-cut）
+       横方向: どの行もまたがない縦のすき間（並べて置いたレシートの間）
+       縦方向: 行間よりも十分広い横のすき間（上下に置いたレシートの間）
+    2. 分割した領域ごとにテキストを組み立て（単語を行にまとめて左から並べる）、日付と金額を読み取る
+    3. 日付と金額がそろわない領域（1枚のレシートの途中の空白で分かれた合計欄・フッターなど）は
+       最も近い領域に戻す
+
+日付と金額がそろった領域が2つ以上にならなければ、1枚のレシートとして扱う。
+"""
+import logging
+import statistics
+from typing import NamedTuple
+
+from services.receipt_parser import parse_receipt_text
+
+logger = logging.getLogger(__name__)
+
+# 分割するすき間の最小幅（単語の高さの中央値に対する倍率）
+X_GAP = 2.0
+Y_GAP = 4.0
+# 1枚のレシートとみなす領域の最小単語数
+MIN_WORDS = 4
+
+
+class Word(NamedTuple):
+    """OCR で検出した単語と外接矩形（画像の座標）"""
+    text: str
+    left: float
+    top: float
+    right: float
+    bottom: float
+
+    @property
+    def height(self) -> float:
+        return self.bottom - self.top
+
+    @property
+    def center(self) -> tuple[float, float]:
+        return (self.left + self.right) / 2, (self.top + self.bottom) / 2
+
+
+def words_from_annotations(annotations) -> list[Word]:
+    """Vision API の text_annotations（先頭の全文を除く）を Word のリストにする"""
+    words = []
+    for annotation in annotations[1:]:
+        vertices = annotation.bounding_poly.vertices
+        if not vertices or not annotation.description.strip():
+            continue
+        xs = [v.x for v in vertices]
+        ys = [v.y for v in vertices]
+        words.append(Word(annotation.description, min(xs), min(ys), max(xs), max(ys)))
+    return words
+
+
+def split_receipts(words: list[Word], max_receipts: int = 5) -> list[str]:
+    """
+    単語の配置からレシートを切り分け、レシートごとのテキストを返す
+
+    レシートが1枚と判断した場合（または max_receipts 枚を超えた場合）は空のリストを返す。
+    並び順は左から右、上から下。
+    """
+    if max_receipts < 2 or len(words) < MIN_WORDS * 2:
+        return []
+    unit = statistics.median(w.height for w in words) or 1.0
+
+    regions = [r for r in _xy_cut(words, unit) if r]
+    if len(regions) < 2:
+        return []
+
+    receipts: list[list[Word]] = []
+    leftovers: list[list[Word]] = []
+    for region in regions:
+        parsed = parse_receipt_text(region_text(region, unit)) if len(region) >= MIN_WORDS else {}
+        if parsed.get("amount") and parsed.get("date"):
+            receipts.append(region)
+        else:
+            leftovers.append(region)
+    if len(receipts) < 2:
+        return []
+    if len(receipts) > max_receipts:
+        logger.info(f"レシートの切り分けを中止: {len(receipts)}枚 (上限 {max_receipts}枚)")
+        return []
+
+    # レシートとみなせなかった領域は、中心が最も近いレシートに戻す
+    for region in leftovers:
+        cx, cy = _bounds_center(region)
+        nearest = min(
+            receipts,
+            key=lambda r: (_bounds_center(r)[0] - cx) ** 2 + (_bounds_center(r)[1] - cy) ** 2,
+        )
+        nearest.extend(region)
+
+    return [region_text(region, unit) for region in receipts]
+
+
+def region_text(words: list[Word], unit: float | None = None) -> str:
+    """領域内の単語を行にまとめ、上から下・左から右の順にテキストにする"""
+    if not words:
+        return ""
+    unit = unit or statistics.median(w.height for w in words) or 1.0
+
+    lines: list[list[Word]] = []
+    line_center = None
+    for word in sorted(words, key=lambda w: w.center[1]):
+        cy = word.center[1]
+        if line_center is not None and abs(cy - line_center) <= unit / 2:
+            lines[-1].append(word)
+        else:
+            lines.append([word])
+            line_center = cy
+
+    return "\n".join(join_line(line, unit) for line in lines)
+
+
+def join_line(words: list[Word], unit: float) -> str:
+    """
+    1行分の単語を左から順につなげる
+
+    単語の高さ（unit）の半分以上離れている場合だけ空白を入れる。
+    日本語は1〜数文字ずつに分かれて検出されるため、空白でつなぐと「合 計 ¥ 1 , 5 0 0」のようになる。
+    """
+    line = sorted(words, key=lambda w: w.left)
+    if not line:
+        return ""
+    parts = [line[0].text]
+    for previous, word in zip(line, line[1:]):
+        if word.left - previous.right >= unit / 2:
+            parts.append(" ")
+        parts.append(word.text)
+    return "".join(parts)
+
+
+def _xy_cut(words: list[Word], unit: float) -> list[list[Word]]:
+    """横方向、次に縦方向のすき間で、分割できなくなるまで再帰的に分ける"""
+    for axis, gap in ((0, X_GAP * unit), (1, Y_GAP * unit)):
+        parts = _cut(words, axis, gap)
+        if len(parts) > 1:
+            return [region for part in parts for region in _xy_cut(part, unit)]
+    return [words]
+
+
+def _cut(words: list[Word], axis: int, min_gap: float) -> list[list[Word]]:
+    """axis（0: x, 1: y）方向に射影し、min_gap 以上のすき間ごとに分ける"""
+    if axis == 0:
+        spans = sorted(words, key=lambda w: w.left)
+        start, end = (lambda w: w.left), (lambda w: w.right)
+    else:
+        spans = sorted(words, key=lambda w: w.top)
+        start, end = (lambda w: w.top), (lambda w: w.bottom)
+
+    parts: list[list[Word]] = [[]]
+    reach = None
+    for word in spans:
+        if reach is not None and start(word) - reach >= min_gap:
+            parts.append([])
+        parts[-1].append(word)
+        reach = end(word) if reach is None else max(reach, end(word))
+    return parts
+
+
+def _bounds_center(words: list[Word]) -> tuple[float, float]:
+    left = min(w.left for w in words)
+    right = max(w.right for w in words)
+    top = min(w.top for w in words)
+    bottom = max(w.bottom for w in words)
+    return (left + right) / 2, (top + bottom) / 2
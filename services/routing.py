@@ -0,0 +1,244 @@
+"""
+台帳ルーティング - サーバー（guild）・チャンネルから書き込み先の台帳を決める
+
+1つのボットプロセスで複数の団体・部署の台帳を扱うため、
+ルーティング表（ROUTES_FILE の JSON）でチャンネルごとに書き込み先を指定する。
+
+    [
+      {
+        "name": "吹奏楽部",
+        "guild_id": 123456789012345678,
+        "channel_ids": [234567890123456789],
+        "spreadsheet_id": "1abc...",
+        "sheet_name": "",
+        "sheet_gid": 0,
+        "drive_folder_id": ""
+      }
+    ]
+
+channel_ids を省略した場合は channel_name（既定は CHANNEL_NAME）でそのサーバーの
+チャンネルに一致させる。ROUTES_FILE が未設定なら .env の単一設定を "default" として使う。
+SheetsService / DriveService は台帳ごとに初回利用時に作成し、以降は使い回す。
+"""
+import json
+import logging
+import threading
+
+from services.drive import DriveService
+from services.google_rest import AsyncDriveApi, AsyncSheetsApi, GoogleRestSession
+from services.sheets import SheetsService
+import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TARGET = "default"
+
+
+class LedgerTarget:
+    """書き込み先の台帳（スプレッドシート・シート・Drive フォルダ）"""
+
+    def __init__(
+        self,
+        name: str,
+        spreadsheet_id: str,
+        sheet_name: str = "",
+        sheet_gid: int = 0,
+        drive_folder_id: str = "",
+        guild_id: int | None = None,
+        channel_ids: list[int] | None = None,
+        channel_name: str = "",
+    ):
+        self.name = name
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet_name = sheet_name
+        self.sheet_gid = sheet_gid
+        self.drive_folder_id = drive_folder_id
+        self.guild_id = guild_id
+        self.channel_ids = channel_ids or []
+        self.channel_name = channel_name
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LedgerTarget":
+        channel_ids = [int(c) for c in data.get("channel_ids", [])]
+        return cls(
+            name=data["name"],
+            spreadsheet_id=data["spreadsheet_id"],
+            sheet_name=data.get("sheet_name", ""),
+            sheet_gid=int(data.get("sheet_gid", 0)),
+            drive_folder_id=data.get("drive_folder_id", ""),
+            guild_id=int(data["guild_id"]) if data.get("guild_id") else None,
+            channel_ids=channel_ids,
+            channel_name="" if channel_ids else data.get("channel_name", config.CHANNEL_NAME),
+        )
+
+    def __repr__(self):
+        return f"LedgerTarget({self.name!r}, spreadsheet_id={self.spreadsheet_id!r})"
+
+
+class LedgerRouter:
+    """チャンネル ID（または guild + チャンネル名）→ LedgerTarget の対応表"""
+
+    def __init__(self, targets: list[LedgerTarget]):
+        self.targets: dict[str, LedgerTarget] = {}
+        self.by_channel_id: dict[int, LedgerTarget] = {}
+        self.by_channel_name: dict[tuple[int | None, str], LedgerTarget] = {}
+        self.by_guild: dict[int, LedgerTarget] = {}
+
+        for target in targets:
+            if target.name in self.targets:
+                raise ValueError(f"台帳名が重複しています: {target.name}")
+            self.targets[target.name] = target
+            for channel_id in target.channel_ids:
+                self.by_channel_id[channel_id] = target
+            if target.channel_name:
+                self.by_channel_name[(target.guild_id, target.channel_name)] = target
+            if target.guild_id is not None:
+                # サーバー内の最初のルートを、そのサーバーの既定の台帳にする
+                self.by_guild.setdefault(target.guild_id, target)
+
+    @classmethod
+    def from_config(cls) -> "LedgerRouter":
+        """ROUTES_FILE があれば読み込み、なければ .env の単一設定から作る"""
+        if config.ROUTES_FILE:
+            with open(config.ROUTES_FILE, encoding="utf-8") as f:
+                routes = json.load(f)
+            targets = [LedgerTarget.from_dict(r) for r in routes]
+            logger.info(f"ルーティング表を読み込みました: {len(targets)}件 ({config.ROUTES_FILE})")
+        else:
+            targets = [LedgerTarget(
+                name=DEFAULT_TARGET,
+                spreadsheet_id=config.SPREADSHEET_ID,
+                sheet_name=config.SHEET_NAME,
+                sheet_gid=config.SHEET_GID,
+                drive_folder_id=config.DRIVE_FOLDER_ID,
+                channel_name=config.CHANNEL_NAME,
+            )]
+        return cls(targets)
+
+    @property
+    def watched_channel_ids(self) -> set[int]:
+        return set(self.by_channel_id)
+
+    @property
+    def default_target_name(self) -> str:
+        """チャンネルによらない入口（CLI・HTTP 受付）の既定の台帳名（default、なければ先頭の台帳）"""
+        return DEFAULT_TARGET if DEFAULT_TARGET in self.targets else next(iter(self.targets))
+
+    def resolve_channel(self, channel_id: int, guild_id: int | None, channel_name: str | None) -> LedgerTarget | None:
+        """レシートを受け付けるチャンネルなら書き込み先を返す（それ以外は None）"""
+        target = self.by_channel_id.get(channel_id)
+        if target is not None:
+            return target
+        if channel_name and self.by_channel_name:
+            return (
+                self.by_channel_name.get((guild_id, channel_name))
+                or self.by_channel_name.get((None, channel_name))
+            )
+        return None
+
+    def resolve_interaction(self, channel_id: int | None, guild_id: int | None, channel_name: str | None) -> LedgerTarget | None:
+        """
+        スラッシュコマンドの書き込み先を返す
+
+        チャンネルのルート → サーバーの既定ルート → 台帳が1つだけならそれ、の順で探す。
+        """
+        if channel_id is not None:
+            target = self.resolve_channel(channel_id, guild_id, channel_name)
+            if target is not None:
+                return target
+        if guild_id is not None and guild_id in self.by_guild:
+            return self.by_guild[guild_id]
+        if len(self.targets) == 1:
+            return next(iter(self.targets.values()))
+        return None
+
+    def channel_labels(self, guild_id: int | None) -> list[str]:
+        """サーバーでレシートを受け付けるチャンネルの表示名（<#ID> または #チャンネル名）"""
+        labels: list[str] = []
+        for target in self.targets.values():
+            if target.guild_id is not None and target.guild_id != guild_id:
+                continue
+            names = [f"<#{channel_id}>" for channel_id in target.channel_ids]
+            if target.channel_name:
+                names.append(f"#{target.channel_name}")
+            labels.extend(name for name in names if name not in labels)
+        return labels
+
+
+class ServicePool:
+    """台帳ごとの SheetsService / DriveService を遅延作成してキャッシュする"""
+
+    def __init__(self, router: LedgerRouter, rest: GoogleRestSession | None = None):
+        # rest を渡すと、サービスに非同期クライアント（services/google_rest.py）も持たせる
+        self.router = router
+        self.async_sheets = AsyncSheetsApi(rest) if rest else None
+        self.async_drive = AsyncDriveApi(rest) if rest else None
+        self._sheets: dict[str, SheetsService] = {}
+        self._drive: dict[str, DriveService] = {}
+        # 別スレッドで実行するジョブからも呼ばれるため、同じ台帳のサービスを二重に作らないようにする
+        # （作成は通信を伴うので台帳ごとのロックで行い、別の台帳の作成・取得を待たせない）
+        self._locks: dict[tuple[str, str], threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    def register(self, name: str, sheets: SheetsService | None = None, drive: DriveService | None = None) -> None:
+        """作成済みのサービスを登録する（負荷試験用フェイク等）"""
+        if sheets is not None:
+            self._sheets[name] = sheets
+        if drive is not None:
+            self._drive[name] = drive
+
+    def sheets(self, target: LedgerTarget | str | None) -> SheetsService | None:
+        """台帳の SheetsService を返す（初期化に失敗した場合は None、次回再試行）"""
+        target = self._target(target)
+        if target is None:
+            return None
+        service = self._sheets.get(target.name)
+        if service is not None:
+            return service
+        with self._lock_for("sheets", target.name):
+            return self._sheets.get(target.name) or self._create_sheets(target)
+
+    def _create_sheets(self, target: LedgerTarget) -> SheetsService | None:
+        try:
+            service = SheetsService(
+                spreadsheet_id=target.spreadsheet_id,
+                sheet_name=target.sheet_name,
+                sheet_gid=target.sheet_gid,
+                async_service=self.async_sheets,
+            )
+        except Exception as e:
+            logger.error(f"Sheets API 初期化失敗 (台帳: {target.name}): {e}")
+            return None
+        self._sheets[target.name] = service
+        logger.info(f"Sheets API 初期化完了 (台帳: {target.name})")
+        return service
+
+    def drive(self, target: LedgerTarget | str | None) -> DriveService | None:
+        """台帳の DriveService を返す（初期化に失敗した場合は None、次回再試行）"""
+        target = self._target(target)
+        if target is None:
+            return None
+        service = self._drive.get(target.name)
+        if service is not None:
+            return service
+        with self._lock_for("drive", target.name):
+            return self._drive.get(target.name) or self._create_drive(target)
+
+    def _create_drive(self, target: LedgerTarget) -> DriveService | None:
+        try:
+            service = DriveService(folder_id=target.drive_folder_id, async_service=self.async_drive)
+        except Exception as e:
+            logger.error(f"Drive API 初期化失敗 (台帳: {target.name}): {e}")
+            return None
+        self._drive[target.name] = service
+        logger.info(f"Drive API 初期化完了 (台帳: {target.name})")
+        return service
+
+    def _lock_for(self, kind: str, name: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault((kind, name), threading.Lock())
+
+    def _target(self, target: LedgerTarget | str | None) -> LedgerTarget | None:
+        if isinstance(target, str):
+            return self.router.targets.get(target)
+        return target
@@ -2,15 +2,32 @@
 Google Sheets サービス - Sheets API v4 を直接使用してスプレッドシートへ書き込む
 （アップロードされた .xlsx ファイルにも対応）
 """
+import asyncio
 import logging
-from googleapiclient.discovery import build
+import re
+import threading
+import zlib
+from datetime import date
 from googleapiclient.errors import HttpError
-from services.google_auth import get_credentials
+from services.google_auth import build_service, get_credentials
+from services.ledger_index import (
+    COL_DATE,
+    LedgerIndex,
+    contiguous_runs,
+    entry_matches,
+    parse_amount,
+    parse_sheet_date,
+)
+from services.tracing import span, traced_execute, traced_execute_async
 import config
 
 logger = logging.getLogger(__name__)
 
 
+class LedgerChangedError(RuntimeError):
+    """一括更新の対象行が、確認した後に書き換えられている（行の挿入・削除などで行番号がずれた）"""
+
+
 class SheetsService:
     """Google Sheets API v4 で直接スプレッドシートを操作する"""
 
@@ -27,25 +44,76 @@ class SheetsService:
         "差引残高",       # I: 8
         "会計Check",      # J: 9
         "精算",           # K: 10
+        "レシート",        # L: 11
     ]
 
-    def __init__(self):
-        credentials = get_credentials()
-        self.service = build("sheets", "v4", credentials=credentials)
-        self.drive_service = build("drive", "v3", credentials=credentials)
-        self.spreadsheet_id = config.SPREADSHEET_ID
-        self.sheet_name = getattr(config, "SHEET_NAME", "")
+    # 最終列の列名（A1 表記）
+    LAST_COLUMN = chr(ord("A") + len(COLUMNS) - 1)
+
+    # 一括更新できる列（列名 → 0-indexed）
+    MARK_COLUMNS = {
+        "会計Check": 9,
+        "精算": 10,
+    }
+
+    # 年度シートの繰越行の勘定科目（D列）
+    OPENING_CATEGORY = "前期繰越"
+
+    # iter_rows で、この数だけ続けて空のチャンクがあれば以降は空とみなす
+    EMPTY_CHUNKS_TO_STOP = 3
+
+    def __init__(
+        self,
+        service=None,
+        drive_service=None,
+        spreadsheet_id: str | None = None,
+        sheet_name: str | None = None,
+        sheet_gid: int | None = None,
+        async_service=None,
+    ):
+        # service / drive_service を渡すと API クライアントを差し替えられる
+        # （オフライン負荷試験用のフェイク等。services/fakes.py 参照）
+        # async_service は行追加を非同期で行うクライアント（services/google_rest.py の AsyncSheetsApi）
+        # spreadsheet_id / sheet_name / sheet_gid を省略した場合は .env の設定を使う
+        if service is None or drive_service is None:
+            credentials = get_credentials()
+        self.service = service or build_service("sheets", "v4", credentials)
+        self.drive_service = drive_service or build_service("drive", "v3", credentials)
+        self.async_service = async_service
+        self.spreadsheet_id = config.SPREADSHEET_ID if spreadsheet_id is None else spreadsheet_id
+        self.sheet_name = getattr(config, "SHEET_NAME", "") if sheet_name is None else sheet_name
+        # シートごとの台帳インデックス（年度切り替え後も前年度のシートを一括精算できるように）
+        self._indexes: dict[str, LedgerIndex] = {}
+        self._rollover_lock = threading.Lock()  # 年度シートの切り替え（複数スレッドから呼ばれる）
 
         # .xlsx ファイルの場合、ネイティブ Google Sheets に変換する
         self._ensure_native_sheet()
 
         # シート名が設定で指定されていなければ自動検出を試みる
         if not self.sheet_name:
-            self.sheet_name = self._resolve_sheet_name(config.SHEET_GID)
+            gid = config.SHEET_GID if sheet_gid is None else sheet_gid
+            self.sheet_name = self._resolve_sheet_name(gid)
         logger.info(
             f"スプレッドシート接続完了: ID={self.spreadsheet_id} "
             f"シート: '{self.sheet_name}'"
         )
+        # 設定されたシート（年度シートに切り替える前の台帳）
+        self.base_sheet_name = self.sheet_name
+
+        # 年度ごとのシート切り替えが有効なら、今年度のシートに移る
+        # （作成は最初の書き込み時に行う。読み取りだけの利用でシートを増やさない）
+        self._ensure_fiscal_sheet(create=False)
+
+    @property
+    def index(self) -> LedgerIndex:
+        """現在の書き込み先シートの台帳インデックス"""
+        return self._index_for(self.sheet_name)
+
+    def _index_for(self, sheet_name: str) -> LedgerIndex:
+        index = self._indexes.get(sheet_name)
+        if index is None:
+            index = self._indexes[sheet_name] = LedgerIndex(ttl=config.LEDGER_INDEX_TTL)
+        return index
 
     def _ensure_native_sheet(self):
         """
@@ -115,100 +183,161 @@ class SheetsService:
             )
             return ""
 
-    def _make_range(self, col_range: str = "") -> str:
-        """シート名付きのレンジ文字列を生成する"""
-        if self.sheet_name:
-            base = f"'{self.sheet_name}'"
+    def _make_range(self, col_range: str = "", sheet_name: str | None = None) -> str:
+        """シート名付きのレンジ文字列を生成する（sheet_name を省略した場合は現在のシート）"""
+        sheet_name = sheet_name or self.sheet_name
+        if sheet_name:
+            base = f"'{sheet_name}'"
         else:
             base = "Sheet1"  # デフォルト
         if col_range:
             return f"{base}!{col_range}"
         return base
 
-    def _get_all_values(self) -> list[list[str]]:
-        """シートの全データを取得する"""
-        range_str = self._make_range()
-        result = (
+    def _get_all_values(self, sheet_name: str | None = None) -> list[list[str]]:
+        """シートの全データを取得する（sheet_name を省略した場合は現在のシート）"""
+        range_str = self._make_range(sheet_name=sheet_name)
+        result = traced_execute(
+            "sheets.values.get",
             self.service.spreadsheets()
             .values()
-            .get(spreadsheetId=self.spreadsheet_id, range=range_str)
-            .execute()
+            .get(spreadsheetId=self.spreadsheet_id, range=range_str),
         )
         return result.get("values", [])
 
     def get_last_balance(self) -> int:
         """最後の行の差引残高を取得する"""
         try:
-            all_values = self._get_all_values()
-            if len(all_values) <= 1:  # ヘッダーのみ
-                return 0
-
-            # 最後の行から差引残高を取得（I列 = index 8）
-            for row in reversed(all_values[1:]):
-                if len(row) > 8 and row[8].strip():
-                    balance_str = row[8].strip()
-                    # カンマ、¥記号を除去して数値化
-                    balance_str = (
-                        balance_str.replace(",", "")
-                        .replace("¥", "")
-                        .replace("￥", "")
-                        .replace(" ", "")
-                    )
-                    try:
-                        return int(float(balance_str))
-                    except ValueError:
-                        continue
-            return 0
+            return self._last_balance(self._get_all_values())
         except Exception as e:
             logger.error(f"差引残高の取得に失敗: {e}")
             return 0
 
+    @staticmethod
+    def _last_balance(all_values: list[list[str]]) -> int:
+        """シートの値から最後の差引残高を取り出す（見つからなければ 0）"""
+        if len(all_values) <= 1:  # ヘッダーのみ
+            return 0
+
+        # 最後の行から差引残高を取得（I列 = index 8）
+        for row in reversed(all_values[1:]):
+            if len(row) > 8 and row[8].strip():
+                balance_str = row[8].strip()
+                # カンマ、¥記号を除去して数値化
+                balance_str = (
+                    balance_str.replace(",", "")
+                    .replace("¥", "")
+                    .replace("￥", "")
+                    .replace(" ", "")
+                )
+                try:
+                    return int(float(balance_str))
+                except ValueError:
+                    continue
+        return 0
+
     def append_row(self, data: dict) -> None:
         """
         会計データをスプレッドシートに1行追加する
         """
-        income = int(data.get("入金", 0))
-        expense = int(data.get("出金", 0))
+        self._ensure_fiscal_sheet()
 
         # 差引残高を計算
-        last_balance = self.get_last_balance()
-        new_balance = last_balance + income - expense
+        with span("sheets.balance"):
+            last_balance = self.get_last_balance()
+        row = self._build_row(data, last_balance)
+
+        # 次の空き行を探して update で書き込む
+        with span("sheets.next_row"):
+            next_row = self._get_next_empty_row()
 
-        row = [
+        # シートの行数が足りなければ自動拡張
+        with span("sheets.capacity"):
+            self._ensure_row_capacity(next_row)
+
+        traced_execute(
+            "sheets.values.update",
+            self.service.spreadsheets().values().update(
+                spreadsheetId=self.spreadsheet_id,
+                range=self._make_range(f"A{next_row}:{self.LAST_COLUMN}{next_row}"),
+                valueInputOption="USER_ENTERED",
+                body={"values": [row]},
+            ),
+        )
+        self._row_appended(next_row, row, data)
+
+    async def append_row_async(self, data: dict) -> None:
+        """
+        append_row の非同期版（async_service で呼び出し、待っている間もイベントループを止めない）
+
+        差引残高と次の空き行は1回の読み込みから求める。読み込みに失敗した場合は
+        行を上書きしないよう、既定値で続行せずに例外を送出する。
+        async_service がない場合は append_row を別スレッドで呼ぶ。
+        同じシートへの追加は呼び出し側で直列化すること（ReceiptPipeline.submit_async）。
+        """
+        if self.async_service is None:
+            await asyncio.to_thread(self.append_row, data)
+            return
+        # 年度シートの確認・作成は googleapiclient（同期）で行うため別スレッドで
+        await asyncio.to_thread(self._ensure_fiscal_sheet)
+
+        with span("sheets.read"):
+            all_values = await self._get_all_values_async()
+        row = self._build_row(data, self._last_balance(all_values))
+        next_row = len(all_values) + 1
+
+        with span("sheets.capacity"):
+            await self._ensure_row_capacity_async(next_row)
+
+        await traced_execute_async(
+            "sheets.values.update",
+            self.async_service.spreadsheets().values().update(
+                spreadsheetId=self.spreadsheet_id,
+                range=self._make_range(f"A{next_row}:{self.LAST_COLUMN}{next_row}"),
+                valueInputOption="USER_ENTERED",
+                body={"values": [row]},
+            ),
+        )
+        self._row_appended(next_row, row, data)
+
+    @staticmethod
+    def _build_row(data: dict, last_balance: int) -> list:
+        """追加する行の値（差引残高は last_balance から計算する）"""
+        income = int(data.get("入金", 0))
+        expense = int(data.get("出金", 0))
+        return [
             data.get("入力日", ""),
             data.get("日付", ""),
             data.get("記入者", ""),
-            "経費",
+            data.get("勘定科目") or "経費",
             data.get("立て替えた人", ""),
             data.get("使用用途", ""),
             income if income else "",
             expense if expense else "",
-            new_balance,
+            last_balance + income - expense,
             "未",
             "未",
+            data.get("レシート", ""),
         ]
 
-        # 次の空き行を探して update で書き込む
-        next_row = self._get_next_empty_row()
-
-        # シートの行数が足りなければ自動拡張
-        self._ensure_row_capacity(next_row)
-
-        range_str = self._make_range(f"A{next_row}:K{next_row}")
-        body = {"values": [row]}
-
-        self.service.spreadsheets().values().update(
-            spreadsheetId=self.spreadsheet_id,
-            range=range_str,
-            valueInputOption="USER_ENTERED",
-            body=body,
-        ).execute()
-
+    def _row_appended(self, row_number: int, row: list, data: dict) -> None:
+        if not self.index.stale:
+            self.index.update(row_number, row)
         logger.info(
-            f"行を追加 (行{next_row}): 日付={data.get('日付')} "
-            f"出金={expense} 差引残高={new_balance}"
+            f"行を追加 (行{row_number}): 日付={data.get('日付')} "
+            f"出金={row[7] or 0} 差引残高={row[8]}"
         )
 
+    async def _get_all_values_async(self) -> list[list[str]]:
+        """_get_all_values の非同期版"""
+        result = await traced_execute_async(
+            "sheets.values.get",
+            self.async_service.spreadsheets()
+            .values()
+            .get(spreadsheetId=self.spreadsheet_id, range=self._make_range()),
+        )
+        return result.get("values", [])
+
     def _get_next_empty_row(self) -> int:
         """シートの次の空き行番号を返す（1-indexed）"""
         try:
@@ -217,39 +346,613 @@ class SheetsService:
         except Exception:
             return 2  # ヘッダー行の次をデフォルトにする
 
+    def iter_rows(self, chunk_rows: int = 1000, sheet_name: str | None = None):
+        """
+        ヘッダーを除く行を (行番号, 行の値) として chunk_rows 行ずつ読み出して返す
+
+        シート全体を一度に読み込まないため、台帳の大きさによらずメモリ使用量は一定。
+        sheet_name を省略した場合は現在の書き込み先シート（年度シート）を読む。
+        途中に空行のかたまりがあっても続きを読み、シートの末尾に達するか、
+        空のチャンクが EMPTY_CHUNKS_TO_STOP 回続いたところで終える。
+
+        Raises:
+            ValueError: 指定したシートが存在しない
+        """
+        sheet_name = sheet_name or self.sheet_name
+        props = self._sheet_properties().get(sheet_name)
+        if props is None:
+            raise ValueError(f"シート '{sheet_name}' が見つかりません")
+        max_rows = props.get("gridProperties", {}).get("rowCount", 0)
+
+        start = 2
+        empty_chunks = 0
+        while start <= max_rows and empty_chunks < self.EMPTY_CHUNKS_TO_STOP:
+            end = min(start + chunk_rows - 1, max_rows)
+            result = traced_execute(
+                "sheets.values.get",
+                self.service.spreadsheets()
+                .values()
+                .get(
+                    spreadsheetId=self.spreadsheet_id,
+                    range=f"'{sheet_name}'!A{start}:{self.LAST_COLUMN}{end}",
+                ),
+            )
+            values = result.get("values", [])
+            empty_chunks = 0 if values else empty_chunks + 1
+            for offset, row in enumerate(values):
+                yield start + offset, row
+            start = end + 1
+
+    def export_sheets(self, date_from: date | None = None, date_to: date | None = None) -> list[str]:
+        """
+        期間（支払日）に重なるシートを古い順に返す
+
+        年度シートの切り替えが無効なら現在のシートだけ。有効なら、期間に重なる年度の年度シートと、
+        最初の年度シートの年度以前を含む期間なら切り替え前のシート（設定のシート）も返す。
+        年度の途中で切り替えた場合、切り替え前のシートにはその年度の行も残っているため、
+        最初の年度シートと同じ年度の期間でも含める（行は呼び出し側で支払日により絞り込む）。
+        """
+        self._ensure_fiscal_sheet(create=False)
+        if not config.FISCAL_YEAR_ROLLOVER:
+            return [self.sheet_name]
+        titles = self._sheet_properties()
+        pattern = re.compile(
+            re.escape(config.FISCAL_SHEET_NAME_FORMAT).replace(re.escape("{year}"), r"(\d{4})")
+        )
+        fiscal = sorted(
+            (int(match.group(1)), title)
+            for title in titles
+            if (match := pattern.fullmatch(title))
+        )
+        first = self.fiscal_year(date_from) if date_from else None
+        last = self.fiscal_year(date_to) if date_to else None
+
+        sheets = []
+        base = self.base_sheet_name
+        if (
+            base in titles
+            and not pattern.fullmatch(base)
+            and (not fiscal or first is None or first <= fiscal[0][0])
+        ):
+            sheets.append(base)
+        sheets += [
+            title
+            for year, title in fiscal
+            if (first is None or year >= first) and (last is None or year <= last)
+        ]
+        return sheets or [self.sheet_name]
+
+    def iter_ledger(
+        self,
+        chunk_rows: int = 1000,
+        date_from: date | None = None,
+        date_to: date | None = None,
+        sheet_name: str | None = None,
+    ):
+        """
+        期間に重なるシート（export_sheets）の行を古い順に iter_rows で読み出して返す
+
+        sheet_name を指定した場合はそのシートだけを読む。
+        複数の年度シートにまたがる場合、2枚目以降の繰越行（前年度の残高の再掲）は返さない。
+        """
+        sheet_names = [sheet_name] if sheet_name else self.export_sheets(date_from, date_to)
+        for i, name in enumerate(sheet_names):
+            for row_number, row in self.iter_rows(chunk_rows, name):
+                if i and len(row) > 3 and str(row[3]).strip() == self.OPENING_CATEGORY:
+                    continue
+                yield row_number, row
+
     def _ensure_row_capacity(self, needed_row: int) -> None:
         """シートの行数が足りない場合、行を追加して拡張する"""
         try:
-            meta = (
-                self.service.spreadsheets()
-                .get(spreadsheetId=self.spreadsheet_id)
-                .execute()
+            meta = traced_execute(
+                "sheets.get",
+                self.service.spreadsheets().get(spreadsheetId=self.spreadsheet_id),
             )
-            sheet_id = getattr(self, '_sheet_id', 0)
-            for sheet in meta.get("sheets", []):
-                props = sheet.get("properties", {})
-                if props.get("title") == self.sheet_name:
-                    sheet_id = props.get("sheetId", 0)
-                    max_rows = props.get("gridProperties", {}).get("rowCount", 0)
-                    break
-            else:
-                max_rows = 0
-
-            if max_rows > 0 and needed_row > max_rows:
-                add_rows = needed_row - max_rows + 100  # 余裕を持って追加
-                request_body = {
-                    "requests": [{
-                        "appendDimension": {
-                            "sheetId": sheet_id,
-                            "dimension": "ROWS",
-                            "length": add_rows,
-                        }
-                    }]
-                }
-                self.service.spreadsheets().batchUpdate(
+            request_body = self._capacity_request(meta, needed_row)
+            if request_body:
+                traced_execute(
+                    "sheets.batchUpdate",
+                    self.service.spreadsheets().batchUpdate(
+                        spreadsheetId=self.spreadsheet_id,
+                        body=request_body,
+                    ),
+                )
+        except Exception as e:
+            logger.warning(f"シート行数の拡張に失敗: {e}")
+
+    async def _ensure_row_capacity_async(self, needed_row: int) -> None:
+        """_ensure_row_capacity の非同期版"""
+        try:
+            meta = await traced_execute_async(
+                "sheets.get",
+                self.async_service.spreadsheets().get(
                     spreadsheetId=self.spreadsheet_id,
-                    body=request_body,
-                ).execute()
-                logger.info(f"シートを {add_rows} 行拡張しました (合計: {max_rows + add_rows} 行)")
+                    fields="sheets.properties",
+                ),
+            )
+            request_body = self._capacity_request(meta, needed_row)
+            if request_body:
+                await traced_execute_async(
+                    "sheets.batchUpdate",
+                    self.async_service.spreadsheets().batchUpdate(
+                        spreadsheetId=self.spreadsheet_id,
+                        body=request_body,
+                    ),
+                )
         except Exception as e:
             logger.warning(f"シート行数の拡張に失敗: {e}")
+
+    def _capacity_request(self, meta: dict, needed_row: int) -> dict | None:
+        """
+        シートの行数が needed_row に足りない、または列数が A〜L 列（COLUMNS）に足りなければ、
+        行・列を追加する batchUpdate の本文を返す
+        """
+        sheet_id = getattr(self, '_sheet_id', 0)
+        for sheet in meta.get("sheets", []):
+            props = sheet.get("properties", {})
+            if props.get("title") == self.sheet_name:
+                sheet_id = props.get("sheetId", 0)
+                grid = props.get("gridProperties", {})
+                max_rows = grid.get("rowCount", 0)
+                max_columns = grid.get("columnCount", 0)
+                break
+        else:
+            max_rows = max_columns = 0
+
+        requests = []
+        if 0 < max_rows < needed_row:
+            add_rows = needed_row - max_rows + 100  # 余裕を持って追加
+            logger.info(f"シートを {add_rows} 行拡張します (合計: {max_rows + add_rows} 行)")
+            requests.append({
+                "appendDimension": {
+                    "sheetId": sheet_id,
+                    "dimension": "ROWS",
+                    "length": add_rows,
+                }
+            })
+        if 0 < max_columns < len(self.COLUMNS):
+            add_columns = len(self.COLUMNS) - max_columns
+            logger.info(f"シートを {add_columns} 列拡張します (合計: {len(self.COLUMNS)} 列)")
+            requests.append({
+                "appendDimension": {
+                    "sheetId": sheet_id,
+                    "dimension": "COLUMNS",
+                    "length": add_columns,
+                }
+            })
+        return {"requests": requests} if requests else None
+
+    # =================================================================
+    #  年度ごとのシート切り替え（FISCAL_YEAR_ROLLOVER）
+    # =================================================================
+    @staticmethod
+    def fiscal_year(today: date | None = None) -> int:
+        """入力日が属する年度（FISCAL_YEAR_START_MONTH 月始まり。開始月の年で表す）"""
+        today = today or date.today()
+        return today.year if today.month >= config.FISCAL_YEAR_START_MONTH else today.year - 1
+
+    @staticmethod
+    def fiscal_sheet_name(year: int) -> str:
+        return config.FISCAL_SHEET_NAME_FORMAT.format(year=year)
+
+    def _ensure_fiscal_sheet(self, create: bool = True) -> None:
+        """
+        書き込み先を今年度のシートにする
+
+        シート名の比較だけで判定するため、年度が変わらない限り API は呼ばない。
+        今年度のシートがなければ前年度のシートに移り（再起動直後は設定のシートを指しているため）、
+        create=True（行の追加）の場合だけ、前年度（現在のシート）の最終差引残高を繰越行として
+        ヘッダーと一緒に書き込んだシートを、batchUpdate 1回で作成する。
+        create=False（読み取り・既存行の修正）の場合はシートを作成しない。
+        """
+        if not config.FISCAL_YEAR_ROLLOVER:
+            return
+        year = self.fiscal_year()
+        name = self.fiscal_sheet_name(year)
+        if name == self.sheet_name:
+            return
+
+        with self._rollover_lock, span("sheets.rollover"):
+            if name == self.sheet_name:  # 待っている間に別のスレッドが切り替えた
+                return
+            sheets = self._sheet_properties()
+            if name in sheets:
+                self._switch_to(name, sheets[name])
+                return
+            previous = self.fiscal_sheet_name(year - 1)
+            if previous != self.sheet_name and previous in sheets:
+                self._switch_to(previous, sheets[previous])
+            if create:
+                self._create_fiscal_sheet(name, year)
+
+    def _sheet_properties(self) -> dict[str, dict]:
+        """シート名 → シートのプロパティ（sheetId, gridProperties など）"""
+        meta = traced_execute(
+            "sheets.get",
+            self.service.spreadsheets().get(
+                spreadsheetId=self.spreadsheet_id,
+                fields="sheets.properties",
+            ),
+        )
+        return {
+            sheet["properties"].get("title"): sheet["properties"]
+            for sheet in meta.get("sheets", [])
+            if "properties" in sheet
+        }
+
+    def _switch_to(self, name: str, props: dict) -> None:
+        logger.info(f"年度シートに切り替え: '{self.sheet_name}' → '{name}'")
+        self._switch_sheet(name, props.get("sheetId", 0))
+
+    def _create_fiscal_sheet(self, name: str, year: int) -> None:
+        """
+        前年度の最終残高を繰り越した年度シートを作成し、書き込み先を切り替える
+
+        繰越行の日付は、繰り越す残高がいつの時点のものかを表す。通常は年度の初日だが、
+        年度の途中で切り替えを有効にした場合は、前のシートにその年度の行が含まれているため、
+        前のシートの最後の支払日にする（年度の初日にすると、年度内の入出金を含む残高が
+        年度の初めの残高に見え、期間で絞り込んだエクスポートで二重に数えられる）。
+        """
+        previous = self.sheet_name
+        all_values = self._get_all_values() if previous else []
+        header = all_values[0] if all_values else self.COLUMNS
+        closing = self._last_balance(all_values)
+
+        fiscal_start = date(year, config.FISCAL_YEAR_START_MONTH, 1)
+        row_dates = [
+            d for row in all_values[1:]
+            if len(row) > COL_DATE and (d := parse_sheet_date(str(row[COL_DATE]).strip()))
+        ]
+        as_of = max([fiscal_start, *row_dates])
+        if as_of > fiscal_start:
+            logger.warning(
+                f"年度の途中で年度シートに切り替えます: '{previous}' に {year}年度の行があるため、"
+                f"繰越行の日付を {as_of:%Y/%m/%d} にします"
+            )
+        opening_date = as_of.strftime("%Y/%m/%d")
+        opening_row = [
+            opening_date,       # A: 入力日
+            opening_date,       # B: 日付
+            "",                 # C: 記入者
+            self.OPENING_CATEGORY,  # D: 勘定科目
+            "",                 # E: 立て替えた人
+            f"{previous}より繰越" if previous else "前期繰越",  # F: 使用用途
+            closing,            # G: 入金
+            "",                 # H: 出金
+            closing,            # I: 差引残高
+            "",                 # J: 会計Check
+            "",                 # K: 精算
+            "",                 # L: レシート
+        ]
+
+        def cell(value) -> dict:
+            if isinstance(value, (int, float)):
+                return {"userEnteredValue": {"numberValue": value}}
+            return {"userEnteredValue": {"stringValue": str(value)}}
+
+        sheet_id = zlib.crc32(f"{self.spreadsheet_id}:{name}".encode()) & 0x7FFFFFFF
+        requests = [
+            {
+                "addSheet": {
+                    "properties": {
+                        "sheetId": sheet_id,
+                        "title": name,
+                        "gridProperties": {
+                            "rowCount": config.FISCAL_SHEET_ROWS,
+                            "columnCount": len(self.COLUMNS),
+                            "frozenRowCount": 1,
+                        },
+                    }
+                }
+            },
+            {
+                "updateCells": {
+                    "start": {"sheetId": sheet_id, "rowIndex": 0, "columnIndex": 0},
+                    "rows": [
+                        {"values": [cell(v) for v in header]},
+                        {"values": [cell(v) for v in opening_row]},
+                    ],
+                    "fields": "userEnteredValue",
+                }
+            },
+        ]
+        try:
+            traced_execute(
+                "sheets.batchUpdate",
+                self.service.spreadsheets().batchUpdate(
+                    spreadsheetId=self.spreadsheet_id,
+                    body={"requests": requests},
+                ),
+            )
+        except HttpError:
+            # 他のプロセス（ワーカー）が先に作成した場合は、同名・同じ sheetId で失敗する
+            props = self._sheet_properties().get(name)
+            if props is None:
+                raise
+            logger.info(f"年度シート '{name}' は他のプロセスが作成済みでした")
+            self._switch_to(name, props)
+            return
+        logger.info(
+            f"年度シートを作成: '{name}' ({config.FISCAL_SHEET_ROWS}行) "
+            f"前年度 '{previous}' からの繰越残高 {closing}"
+        )
+        self._switch_sheet(name, sheet_id)
+
+    def _switch_sheet(self, name: str, sheet_id: int) -> None:
+        self.sheet_name = name
+        self._sheet_id = sheet_id
+
+    # =================================================================
+    #  一括精算（会計Check / 精算 列の一括更新）
+    # =================================================================
+    def _ensure_index(self, sheet_name: str | None = None) -> LedgerIndex:
+        """シートの台帳インデックスが古ければ、シートを1回読み込んで作り直す"""
+        sheet_name = sheet_name or self.sheet_name
+        index = self._index_for(sheet_name)
+        if index.stale:
+            index.build(self._get_all_values(sheet_name))
+            logger.info(f"台帳インデックス作成: '{sheet_name}' {len(index.entries)}行")
+        return index
+
+    def settlement_sheets(self) -> list[str]:
+        """
+        一括精算で探すシート（古い順）
+
+        3月の立て替えは4月に精算することが多いため、年度シートの切り替え後は
+        前年度のシート（初めての切り替えなら切り替え前のシート）も対象にする。
+        """
+        self._ensure_fiscal_sheet(create=False)
+        if not config.FISCAL_YEAR_ROLLOVER:
+            return [self.sheet_name]
+        previous = self.fiscal_sheet_name(self.fiscal_year() - 1)
+        if previous == self.sheet_name:
+            return [self.sheet_name]  # 今年度のシートがまだない
+        titles = self._sheet_properties()
+        if previous not in titles:
+            previous = self.base_sheet_name
+        if previous and previous != self.sheet_name and previous in titles:
+            return [previous, self.sheet_name]
+        return [self.sheet_name]
+
+    def find_unsettled(
+        self,
+        column: str,
+        payer: str | None = None,
+        date_from=None,
+        date_to=None,
+    ) -> list[dict]:
+        """
+        指定列（会計Check / 精算）が未処理の行をインデックスから探す（settlement_sheets のシートから）
+
+        Returns:
+            行の要約のリスト（sheet, row, date_str, payer, expense を含む。シート・行番号順）
+        """
+        col = self.MARK_COLUMNS[column]
+        return [
+            {**entry, "sheet": sheet_name}
+            for sheet_name in self.settlement_sheets()
+            for entry in self._ensure_index(sheet_name).find_undone(col, payer, date_from, date_to)
+        ]
+
+    def mark_rows(
+        self,
+        row_numbers: list[int],
+        column: str,
+        value: str = "済",
+        expected: list[dict] | None = None,
+        sheet_name: str | None = None,
+    ) -> int:
+        """
+        指定行の会計Check / 精算 列を value に更新する（1つのシート）
+
+        expected（find_unsettled が返した行の要約）を渡すと、書き込む前に対象行を読み直し、
+        確認した時から内容が変わっていないことを確かめる。sheet_name を省略した場合は現在のシート。
+        複数のシートにまたがる場合は mark_entries を使う。
+
+        Returns:
+            更新したセル数
+
+        Raises:
+            LedgerChangedError: 対象行の内容が変わっている（何も書き込まない）
+        """
+        sheet_name = sheet_name or self.sheet_name
+        if expected:
+            self.verify_rows(expected, sheet_name)
+        return self._write_marks({sheet_name: row_numbers}, column, value)
+
+    def mark_entries(self, entries: list[dict], column: str, value: str = "済") -> int:
+        """
+        find_unsettled が返した行（複数のシートにまたがってよい）の会計Check / 精算 列を value に更新する
+
+        すべての対象行を values.batchGet 1回で読み直して確認し、変わっていなければ
+        すべてのシートの対象レンジを values.batchUpdate 1回で書き込む（同じスプレッドシートのため）。
+        各行は find_unsettled が返した sheet に書き込む（確認後に年度シートが切り替わっても、確認したシートに書く）。
+
+        Returns:
+            更新したセル数
+
+        Raises:
+            LedgerChangedError: 対象行の内容が変わっている（何も書き込まない）
+        """
+        if not entries:
+            return 0
+        self.verify_rows(entries)
+        by_sheet: dict[str, list[int]] = {}
+        for entry in entries:
+            by_sheet.setdefault(entry.get("sheet") or self.sheet_name, []).append(entry["row"])
+        return self._write_marks(by_sheet, column, value)
+
+    def _write_marks(self, rows_by_sheet: dict[str, list[int]], column: str, value: str) -> int:
+        """シートごとの行の指定列を、連続区間にまとめて values.batchUpdate 1回で書き込む"""
+        col = self.MARK_COLUMNS[column]
+        letter = chr(ord("A") + col)
+        data = [
+            {
+                "range": self._make_range(f"{letter}{start}:{letter}{end}", sheet_name),
+                "values": [[value]] * (end - start + 1),
+            }
+            for sheet_name, row_numbers in rows_by_sheet.items()
+            for start, end in contiguous_runs(row_numbers)
+        ]
+        if not data:
+            return 0
+
+        result = traced_execute(
+            "sheets.values.batchUpdate",
+            self.service.spreadsheets()
+            .values()
+            .batchUpdate(
+                spreadsheetId=self.spreadsheet_id,
+                body={"valueInputOption": "USER_ENTERED", "data": data},
+            ),
+        )
+        for sheet_name, row_numbers in rows_by_sheet.items():
+            self._index_for(sheet_name).set_mark(row_numbers, col, value)
+
+        updated = result.get("totalUpdatedCells", sum(len(rows) for rows in rows_by_sheet.values()))
+        sheets = "、".join(f"'{name}'" for name in rows_by_sheet)
+        logger.info(f"一括更新: {sheets} {column}={value} {updated}セル ({len(data)}レンジ)")
+        return updated
+
+    def verify_rows(self, expected: list[dict], sheet_name: str | None = None) -> None:
+        """
+        対象行を読み直し、日付・立て替えた人・出金がインデックスの内容と同じかを確かめる
+
+        インデックスは最大 LEDGER_INDEX_TTL 秒前の内容なので、その間に手作業で行が
+        挿入・削除されていると、同じ行番号が別の申請を指している。
+        行は entry["sheet"]（なければ sheet_name、現在のシート）から、すべてのシートの分を
+        values.batchGet 1回で読む。違う行があればそのシートのインデックスを作り直させて
+        LedgerChangedError を送出する。
+        """
+        default_sheet = sheet_name or self.sheet_name
+        by_sheet: dict[str, list[dict]] = {}
+        for entry in expected:
+            by_sheet.setdefault(entry.get("sheet") or default_sheet, []).append(entry)
+        runs = [
+            (name, start, end)
+            for name, entries in by_sheet.items()
+            for start, end in contiguous_runs([entry["row"] for entry in entries])
+        ]
+        result = traced_execute(
+            "sheets.values.batchGet",
+            self.service.spreadsheets()
+            .values()
+            .batchGet(
+                spreadsheetId=self.spreadsheet_id,
+                ranges=[self._make_range(f"A{start}:H{end}", name) for name, start, end in runs],
+            ),
+        )
+        current: dict[tuple[str, int], list] = {}
+        for (name, start, _), value_range in zip(runs, result.get("valueRanges", [])):
+            for offset, row in enumerate(value_range.get("values", [])):
+                current[(name, start + offset)] = row
+
+        changed = [
+            (name, entry["row"])
+            for name, entries in by_sheet.items()
+            for entry in entries
+            if not entry_matches(entry, current.get((name, entry["row"]), []))
+        ]
+        if changed:
+            for name in {name for name, _ in changed}:
+                self._index_for(name).invalidate()
+            labels = [
+                f"{name} 行{row}" if len(by_sheet) > 1 else f"行{row}"
+                for name, row in changed
+            ]
+            rows = "、".join(labels[:5]) + (f" ほか{len(labels) - 5}行" if len(labels) > 5 else "")
+            logger.warning(f"一括更新を中止: 対象行の内容が変わっています ({rows})")
+            raise LedgerChangedError(
+                f"対象行の内容が確認後に変わっています（{rows}）。もう一度 /精算 を実行してください。"
+            )
+
+    # =================================================================
+    #  差引残高の再計算（手作業で行を挿入・削除・修正した後の修復）
+    # =================================================================
+    def recompute_balances(self, dry_run: bool = False) -> dict:
+        """
+        入金・出金の累積から差引残高（I列）を計算し直し、値が違うセルだけを書き直す
+
+        D〜I列を values.get 1回で読み、入金 − 出金 の累積和と比べる。
+        書き直す行は連続区間にまとめ、values.batchUpdate 1回で書き込む（dry_run では書き込まない）。
+        G〜I列がすべて空の行は残高が変わらないものとして飛ばし、差引残高も書き込まない。
+        繰越行（勘定科目が OPENING_CATEGORY の行と、最初のデータ行で入金・出金が空のもの）は
+        記録されている差引残高から数え直し、その行は書き直さない。
+        それ以外で入金・出金が空なのに差引残高がある行は、古い値が残っているだけかもしれないため
+        信用せずに計算し直し、stale_rows として返す。
+
+        Returns:
+            {"rows": 確認した行数, "changed": 書き直した行数, "ranges": 書き込んだレンジ数,
+             "first_row": 最初に書き直した行番号（なければ None）,
+             "old_balance": 修正前の最終差引残高, "new_balance": 再計算した最終差引残高,
+             "stale_rows": 入金・出金が空で差引残高だけがある行（繰越行以外）の行番号}
+        """
+        self._ensure_fiscal_sheet(create=False)
+        result = traced_execute(
+            "sheets.values.get",
+            self.service.spreadsheets()
+            .values()
+            .get(
+                spreadsheetId=self.spreadsheet_id,
+                range=self._make_range("D2:I"),
+                valueRenderOption="UNFORMATTED_VALUE",
+            ),
+        )
+        # 各行を [勘定科目, 立て替えた人, 使用用途, 入金, 出金, 差引残高] の文字列に揃える（末尾の空セルは返らないため）
+        rows = [[str(v).strip() for v in row] + [""] * (6 - len(row)) for row in result.get("values", [])]
+
+        balance = 0
+        balances = []
+        changed = []
+        stale = []
+        started = False  # 最初のデータ行（G〜I列のどれかが入っている行）を過ぎたか
+        for i, (category, _, _, g, h, current) in enumerate(rows):
+            opening = category == self.OPENING_CATEGORY or not (started or g or h)
+            started = started or bool(g or h or current)
+            if current and opening:
+                balance = parse_amount(current)
+            else:
+                if current and not (g or h):
+                    stale.append(i + 2)
+                balance += parse_amount(g) - parse_amount(h)
+                if (g or h or current) and (not current or parse_amount(current) != balance):
+                    changed.append(i + 2)
+            balances.append(balance)
+
+        if changed and not dry_run:
+            data = [
+                {
+                    "range": self._make_range(f"I{start}:I{end}"),
+                    "values": [[balances[n - 2]] for n in range(start, end + 1)],
+                }
+                for start, end in contiguous_runs(changed)
+            ]
+            traced_execute(
+                "sheets.values.batchUpdate",
+                self.service.spreadsheets()
+                .values()
+                .batchUpdate(
+                    spreadsheetId=self.spreadsheet_id,
+                    body={"valueInputOption": "USER_ENTERED", "data": data},
+                ),
+            )
+            logger.info(
+                f"差引残高を再計算: {len(changed)}セルを修正 ({len(data)}レンジ) "
+                f"最初の修正行={changed[0]} 最終差引残高={balances[-1]}"
+            )
+
+        if not dry_run:
+            # 手作業で行が挿入・削除されていれば行番号がずれているので、台帳インデックスも作り直させる
+            self.index.invalidate()
+
+        last = next((row[5] for row in reversed(rows) if row[5]), "")
+        return {
+            "rows": len(rows),
+            "changed": len(changed),
+            "ranges": len(contiguous_runs(changed)),
+            "first_row": changed[0] if changed else None,
+            "old_balance": parse_amount(last),
+            "new_balance": balances[-1] if balances else 0,
+            "stale_rows": stale,
+        }
@@ -0,0 +1,201 @@
+"""
+トレーシング - 申請（submission_id）ごとに処理段階と API 呼び出しの所要時間を記録する
+
+    with tracing.span("on_message", trace_id=submission_id):
+        with tracing.span("download"):
+            ...
+
+trace_id を指定した span が起点になり、その中で開いた span は入れ子として記録される。
+起点のない場所（トレース対象外の処理）で開いた span は何もしない。
+終了した span は TRACE_FILE に JSONL で1行ずつ追記される（空の場合は記録しない）。
+書き込みは QueueHandler でキューに入れ、別スレッドの RotatingFileHandler が行う
+（span を閉じる処理ではファイルを開かない）。ファイルが TRACE_MAX_BYTES を超えると
+TRACE_BACKUP_COUNT 世代まで .1, .2 ... に移して新しいファイルに切り替える。
+集計は trace_report.py で行う。
+
+ワーカーモードでは、ジョブ登録時の context() をジョブに含め、
+ワーカー側で resume() することで同じトレースの続きとして記録する。
+1つのファイルを複数のプロセスで切り替えることはできないため、ワーカープロセスは
+「traces.worker-0.jsonl」のようにプロセス名を付けたファイルに書く（trace_files() 参照）。
+"""
+import atexit
+import contextvars
+import glob
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# 現在の span: (trace_id, span_id)
+_current: contextvars.ContextVar[tuple[str, str] | None] = contextvars.ContextVar(
+    "tracing_current_span", default=None
+)
+
+# span の書き出し先（ルートロガーに伝播させない専用のロガー）
+_span_logger = logging.getLogger("tracing.spans")
+_span_logger.propagate = False
+_span_logger.setLevel(logging.INFO)
+_setup_lock = threading.Lock()
+_listener: logging.handlers.QueueListener | None = None
+_listener_pid: int | None = None
+
+
+def trace_path(path: str, process_name: str | None = None) -> str:
+    """このプロセスが書き込むトレースファイル（メインプロセス以外はプロセス名を付ける）"""
+    process_name = process_name or multiprocessing.current_process().name
+    if process_name == "MainProcess":
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{process_name}{ext}"
+
+
+def trace_files(path: str) -> list[str]:
+    """path と、ワーカープロセスのファイル・切り替え済みの古いファイルのうち存在するもの"""
+    root, ext = os.path.splitext(path)
+    candidates = {path, *glob.glob(f"{glob.escape(path)}.*"), *glob.glob(f"{glob.escape(root)}.*{ext}*")}
+    return sorted(p for p in candidates if os.path.isfile(p))
+
+
+def _start_listener() -> None:
+    """初回の書き込み時に、キューとファイル書き込みスレッドを用意する（fork 後の子プロセスでは作り直す）"""
+    global _listener, _listener_pid
+    with _setup_lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            return
+        file_handler = logging.handlers.RotatingFileHandler(
+            trace_path(config.TRACE_FILE),
+            maxBytes=config.TRACE_MAX_BYTES,
+            backupCount=config.TRACE_BACKUP_COUNT,
+            encoding="utf-8",
+            delay=True,
+        )
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        for handler in list(_span_logger.handlers):
+            _span_logger.removeHandler(handler)
+        _span_logger.addHandler(logging.handlers.QueueHandler(records))
+        _listener = logging.handlers.QueueListener(records, file_handler)
+        _listener.start()
+        _listener_pid = os.getpid()
+        atexit.register(close)
+
+
+def close() -> None:
+    """
+    キューに残っている span を書き出して終了する
+
+    通常の終了時は atexit で呼ばれる。multiprocessing の子プロセスは atexit を実行しないため、
+    ワーカープロセスは終了前に明示的に呼ぶこと。
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+        _listener = None
+
+
+def _write(record: dict) -> None:
+    if not config.TRACE_FILE:
+        return
+    if _listener is None or _listener_pid != os.getpid():
+        try:
+            _start_listener()
+        except OSError as e:
+            logger.warning(f"トレースファイルを開けません: {e}")
+            return
+    _span_logger.info(json.dumps(record, ensure_ascii=False))
+
+
+@contextmanager
+def span(name: str, trace_id: str | None = None, **attrs):
+    """
+    処理区間を計測する
+
+    trace_id を指定すると新しいトレースの起点になる。
+    指定せず、起点となる span の外で呼ばれた場合は何も記録しない。
+    属性の dict を返すので、処理結果（判定結果など）を後から追加できる:
+
+        with tracing.span("prefilter") as attrs:
+            attrs["score"] = ...
+    """
+    parent = _current.get()
+    if trace_id is None:
+        if parent is None:
+            yield {}
+            return
+        trace_id, parent_id = parent
+    else:
+        parent_id = parent[1] if parent and parent[0] == trace_id else None
+
+    span_id = uuid.uuid4().hex[:16]
+    token = _current.set((trace_id, span_id))
+    start = time.time()
+    started = time.perf_counter()
+    error = None
+    try:
+        yield attrs
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        duration_ms = (time.perf_counter() - started) * 1000
+        _current.reset(token)
+        record = {
+            "trace_id": trace_id,
+            "span_id": span_id,
+            "parent_id": parent_id,
+            "name": name,
+            "start": start,
+            "duration_ms": round(duration_ms, 3),
+            "pid": os.getpid(),
+        }
+        if attrs:
+            record["attrs"] = attrs
+        if error:
+            record["error"] = error
+        _write(record)
+
+
+def traced_execute(name: str, request):
+    """googleapiclient のリクエストを span 付きで execute() する"""
+    with span(name):
+        return request.execute()
+
+
+async def traced_execute_async(name: str, request):
+    """非同期クライアント（services/google_rest.py）のリクエストを span 付きで実行する"""
+    with span(name):
+        return await request.execute_async()
+
+
+def context() -> dict | None:
+    """別プロセスに引き継ぐための現在のトレース情報"""
+    current = _current.get()
+    if current is None:
+        return None
+    return {"trace_id": current[0], "parent_id": current[1]}
+
+
+@contextmanager
+def resume(ctx: dict | None):
+    """context() で取得したトレースの続きとして、この中の span を記録する"""
+    if not ctx:
+        yield
+        return
+    token = _current.set((ctx["trace_id"], ctx["parent_id"]))
+    try:
+        yield
+    finally:
+        _current.reset(token)
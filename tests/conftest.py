@@ -0,0 +1,9 @@
+"""
+テスト共通設定 - リポジトリ直下のモジュール（config, services）を import できるようにする
+
+Google API・Discord には接続しない。Sheets / Drive は services/fakes.py のインメモリ実装を使う。
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
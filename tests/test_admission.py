@@ -0,0 +1,97 @@
+"""受付制御（トークンバケット・同時実行数・待ち行列）のテスト"""
+import asyncio
+
+import pytest
+
+from services import admission
+from services.admission import AdmissionController, AdmissionError, TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission.time, "monotonic", clock)
+    return clock
+
+
+def test_token_bucket_allows_burst_then_waits(clock):
+    bucket = TokenBucket(rate=0.1, capacity=3)
+    assert [bucket.take() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take() == pytest.approx(10.0)  # 次の1つまで 1 / 0.1 秒
+
+    clock.now += 5
+    assert bucket.take() == pytest.approx(5.0)
+    clock.now += 5
+    assert bucket.take() == 0.0
+
+
+def test_token_bucket_does_not_exceed_capacity(clock):
+    bucket = TokenBucket(rate=1, capacity=2)
+    bucket.take()
+    clock.now += 100
+    assert bucket.full
+    assert bucket.tokens == 2
+
+
+def test_check_user_limits_each_user_separately(clock):
+    controller = AdmissionController(user_rate_per_minute=6, user_burst=2)
+    controller.check_user(1)
+    controller.check_user(1)
+    with pytest.raises(AdmissionError) as excinfo:
+        controller.check_user(1)
+    assert excinfo.value.retry_after == pytest.approx(10.0)
+    controller.check_user(2)  # 別のユーザーは影響を受けない
+
+    clock.now += 10
+    controller.check_user(1)
+
+
+def test_queue_is_fifo_and_bounded():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, queue_size=2)
+        await controller.acquire()
+        positions = []
+        first = asyncio.create_task(controller.acquire(lambda p: positions.append(("first", p))))
+        second = asyncio.create_task(controller.acquire(lambda p: positions.append(("second", p))))
+        await asyncio.sleep(0)
+        assert controller.waiting == 2
+
+        with pytest.raises(AdmissionError):
+            await controller.acquire()
+
+        controller.release()
+        await first
+        assert not second.done()
+        assert controller.in_flight == 1
+        controller.release()
+        await second
+        controller.release()
+        assert controller.in_flight == 0
+        return positions
+
+    positions = asyncio.run(scenario())
+    assert positions == [("first", 1), ("second", 2), ("second", 1)]
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, queue_size=5)
+        await controller.acquire()
+        waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert controller.waiting == 0
+        controller.release()
+        assert controller.in_flight == 0
+
+    asyncio.run(scenario())
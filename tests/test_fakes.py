@@ -0,0 +1,82 @@
+"""オフライン用フェイクバックエンド（services/fakes.py）のテスト"""
+import asyncio
+
+import pytest
+from googleapiclient.errors import HttpError
+
+from services.fakes import FakeDriveAPI, FakeSheetsAPI, FakeVisionClient
+
+
+@pytest.fixture
+def api():
+    return FakeSheetsAPI(header=["A", "B", "C"], row_count=10)
+
+
+def test_values_round_trip_and_trailing_blanks_are_trimmed(api):
+    values = api.spreadsheets().values()
+    values.update(spreadsheetId="", range="Sheet1!A2:C3", body={"values": [[1, "", ""], ["x", 2]]}).execute()
+
+    result = values.get(spreadsheetId="", range="Sheet1!A1:C").execute()
+    assert result["values"] == [["A", "B", "C"], ["1"], ["x", "2"]]
+    assert values.get(spreadsheetId="", range="Sheet1!A5:C6").execute().get("values") is None
+
+
+def test_writes_beyond_row_count_fail_like_the_real_api(api):
+    with pytest.raises(HttpError) as excinfo:
+        api.spreadsheets().values().update(
+            spreadsheetId="", range="Sheet1!A11:C11", body={"values": [["x"]]}
+        ).execute()
+    assert excinfo.value.resp.status == 400
+
+    api.spreadsheets().batchUpdate(spreadsheetId="", body={"requests": [
+        {"appendDimension": {"sheetId": 0, "dimension": "ROWS", "length": 5}},
+    ]}).execute()
+    api.spreadsheets().values().update(spreadsheetId="", range="Sheet1!A11:C11", body={"values": [["x"]]}).execute()
+
+
+def test_batch_get_and_batch_update_are_single_calls(api):
+    values = api.spreadsheets().values()
+    values.batchUpdate(spreadsheetId="", body={"data": [
+        {"range": "Sheet1!A2", "values": [["a"]]},
+        {"range": "Sheet1!A4", "values": [["b"]]},
+    ]}).execute()
+    result = values.batchGet(spreadsheetId="", ranges=["Sheet1!A2", "Sheet1!A4"]).execute()
+
+    assert [r.get("values") for r in result["valueRanges"]] == [[["a"]], [["b"]]]
+    assert api.calls["values.batchUpdate"] == 1
+    assert api.calls["values.batchGet"] == 1
+
+
+def test_duplicate_sheet_is_rejected(api):
+    add = {"requests": [{"addSheet": {"properties": {"title": "2026年度"}}}]}
+    api.spreadsheets().batchUpdate(spreadsheetId="", body=add).execute()
+    with pytest.raises(HttpError):
+        api.spreadsheets().batchUpdate(spreadsheetId="", body=add).execute()
+
+
+def test_quota_returns_429():
+    api = FakeSheetsAPI(quota_per_minute=2)
+    request = api.spreadsheets().values().get(spreadsheetId="", range="Sheet1!A1")
+    request.execute()
+    request.execute()
+    with pytest.raises(HttpError) as excinfo:
+        request.execute()
+    assert excinfo.value.resp.status == 429
+    assert api.total_calls() == 3
+
+
+def test_async_execution_and_drive_links():
+    drive = FakeDriveAPI()
+
+    async def upload():
+        return await drive.files().create(body={"name": "r.png"}).execute_async()
+
+    file = asyncio.run(upload())
+    assert file["webViewLink"].startswith("https://drive.google.com/")
+    assert drive.calls["files.create"] == 1
+
+
+def test_vision_returns_configured_texts_in_turn():
+    vision = FakeVisionClient(texts=["一枚目", "二枚目"])
+    texts = [vision.text_detection().text_annotations[0].description for _ in range(3)]
+    assert texts == ["一枚目", "二枚目", "一枚目"]
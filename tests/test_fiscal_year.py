@@ -0,0 +1,132 @@
+"""年度の判定・年度シートの切り替えと繰越行・エクスポート対象のシートのテスト"""
+from datetime import date
+
+import pytest
+
+import config
+from services import sheets
+from services.export import filter_rows
+from services.fakes import FakeDriveAPI, FakeSheetsAPI
+from services.sheets import SheetsService
+
+
+class May2026(date):
+    """今日を 2026/05/01（2026年度）にする"""
+
+    @classmethod
+    def today(cls):
+        return cls(2026, 5, 1)
+
+
+class Oct2025(date):
+    """今日を 2025/10/01（2025年度の途中）にする"""
+
+    @classmethod
+    def today(cls):
+        return cls(2025, 10, 1)
+
+
+@pytest.fixture
+def fiscal_config(monkeypatch):
+    monkeypatch.setattr(config, "FISCAL_YEAR_START_MONTH", 4)
+    monkeypatch.setattr(config, "FISCAL_SHEET_NAME_FORMAT", "{year}年度")
+
+
+def _ledger(rows: list[tuple[str, int]], title: str = "台帳") -> FakeSheetsAPI:
+    """(支払日, 出金) の行が入った台帳（差引残高は 10000 から数える）"""
+    api = FakeSheetsAPI(header=SheetsService.COLUMNS, sheet_title=title)
+    balance = 10000
+    values = [["", "", "", "前期繰越", "", "", balance, "", balance]]
+    for day, expense in rows:
+        balance -= expense
+        values.append([day, day, "", "経費", "A", "", "", expense, balance, "未", "未"])
+    api.spreadsheets().values().update(
+        spreadsheetId="", range=f"'{title}'!A2", body={"values": values}
+    ).execute()
+    return api
+
+
+@pytest.mark.parametrize("day, year", [
+    (date(2026, 3, 31), 2025),
+    (date(2026, 4, 1), 2026),
+    (date(2026, 12, 31), 2026),
+    (date(2027, 1, 1), 2026),
+])
+def test_fiscal_year_starts_in_april(fiscal_config, day, year):
+    assert SheetsService.fiscal_year(day) == year
+
+
+def test_fiscal_year_starting_in_january(monkeypatch):
+    monkeypatch.setattr(config, "FISCAL_YEAR_START_MONTH", 1)
+    assert SheetsService.fiscal_year(date(2026, 1, 1)) == 2026
+    assert SheetsService.fiscal_year(date(2025, 12, 31)) == 2025
+
+
+def test_fiscal_sheet_name_uses_format(fiscal_config, monkeypatch):
+    assert SheetsService.fiscal_sheet_name(2026) == "2026年度"
+    monkeypatch.setattr(config, "FISCAL_SHEET_NAME_FORMAT", "FY{year}")
+    assert SheetsService.fiscal_sheet_name(2026) == "FY2026"
+
+
+def test_switches_to_the_existing_fiscal_sheet(fiscal_config, monkeypatch):
+    monkeypatch.setattr(config, "FISCAL_YEAR_ROLLOVER", True)
+    monkeypatch.setattr(sheets, "date", May2026)
+    api = FakeSheetsAPI(header=SheetsService.COLUMNS, sheet_title="台帳")
+    api.spreadsheets().batchUpdate(spreadsheetId="", body={"requests": [
+        {"addSheet": {"properties": {"title": title}}} for title in ("2025年度", "2026年度")
+    ]}).execute()
+    service = SheetsService(service=api, drive_service=FakeDriveAPI(), sheet_name="台帳")
+
+    assert service.sheet_name == "2026年度"
+    assert service.base_sheet_name == "台帳"
+    assert service.settlement_sheets() == ["2025年度", "2026年度"]
+
+
+def test_carry_forward_is_dated_at_the_fiscal_year_start(fiscal_config, monkeypatch):
+    monkeypatch.setattr(config, "FISCAL_YEAR_ROLLOVER", True)
+    monkeypatch.setattr(sheets, "date", May2026)
+    api = _ledger([("2026/03/20", 300), ("2026/03/31", 200)], title="2025年度")
+    service = SheetsService(service=api, drive_service=FakeDriveAPI(), sheet_name="2025年度")
+
+    service.append_row({"日付": "2026/04/02", "立て替えた人": "A", "出金": 100})
+
+    opening, row = api.sheets["2026年度"]["values"][1:3]
+    assert opening[:9] == ["2026/04/01", "2026/04/01", "", "前期繰越", "", "2025年度より繰越", "9500", "", "9500"]
+    assert row[8] == "9400"
+
+
+def test_mid_year_rollover_keeps_base_rows_in_the_fiscal_year(fiscal_config, monkeypatch):
+    monkeypatch.setattr(config, "FISCAL_YEAR_ROLLOVER", True)
+    monkeypatch.setattr(sheets, "date", Oct2025)
+    api = _ledger([("2025/03/31", 1000), ("2025/06/01", 300), ("2025/09/30", 200)])
+    service = SheetsService(service=api, drive_service=FakeDriveAPI(), sheet_name="台帳")
+    service.append_row({"日付": "2025/10/05", "立て替えた人": "A", "出金": 100})
+
+    # 繰越残高は 2025/09/30 までの入出金を含むため、年度の初日ではなくその日付にする
+    opening = api.sheets["2025年度"]["values"][1]
+    assert opening[:2] == ["2025/09/30", "2025/09/30"] and opening[8] == "8500"
+
+    start, end = date(2025, 4, 1), date(2026, 3, 31)
+    assert service.export_sheets(start, end) == ["台帳", "2025年度"]
+    exported = list(filter_rows(service.iter_ledger(100, start, end), start, end))
+    assert [(row[1], row[7], row[8]) for row in exported] == [
+        ("2025/06/01", "300", "8700"),
+        ("2025/09/30", "200", "8500"),
+        ("2025/10/05", "100", "8400"),
+    ]
+
+
+def test_export_sheets_cover_the_date_range(fiscal_config, monkeypatch):
+    monkeypatch.setattr(config, "FISCAL_YEAR_ROLLOVER", True)
+    monkeypatch.setattr(sheets, "date", May2026)
+    api = FakeSheetsAPI(header=SheetsService.COLUMNS, sheet_title="台帳")
+    api.spreadsheets().batchUpdate(spreadsheetId="", body={"requests": [
+        {"addSheet": {"properties": {"title": title}}} for title in ("2025年度", "2026年度")
+    ]}).execute()
+    service = SheetsService(service=api, drive_service=FakeDriveAPI(), sheet_name="台帳")
+
+    assert service.export_sheets() == ["台帳", "2025年度", "2026年度"]
+    assert service.export_sheets(date(2026, 4, 1)) == ["2026年度"]
+    # 切り替え前のシートに最初の年度シートと同じ年度の行が残っていることがある
+    assert service.export_sheets(date(2025, 6, 1), date(2026, 3, 31)) == ["台帳", "2025年度"]
+    assert service.export_sheets(date(2024, 6, 1), date(2025, 3, 31)) == ["台帳"]
@@ -0,0 +1,174 @@
+"""非同期 Google REST クライアント（再試行・認証・リクエストの形）のテスト"""
+import asyncio
+import contextlib
+
+import aiohttp
+import pytest
+from aiohttp import web
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaInMemoryUpload
+
+from services import google_rest
+from services.google_rest import AsyncDriveApi, AsyncSheetsApi, GoogleRestSession
+
+
+class FakeCredentials:
+    def __init__(self):
+        self.valid = False
+        self.token = None
+        self.refreshed = 0
+
+    def refresh(self, request):
+        self.refreshed += 1
+        self.token = f"t{self.refreshed}"
+        self.valid = True
+
+    def apply(self, headers):
+        headers["authorization"] = f"Bearer {self.token}"
+
+
+@contextlib.asynccontextmanager
+async def serve(routes):
+    """テスト用の API サーバーを起動し、そこを向いたセッションを返す"""
+    app = web.Application()
+    app.add_routes(routes)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    rest = GoogleRestSession(FakeCredentials(), max_retries=3)
+    try:
+        yield rest, f"http://{host}:{port}"
+    finally:
+        await rest.close()
+        await runner.cleanup()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(GoogleRestSession, "_backoff", staticmethod(lambda attempt: 0))
+
+
+def _flaky(hits: list, failures: int, status: int = 503):
+    async def handler(request):
+        hits.append(request.method)
+        if len(hits) <= failures:
+            return web.Response(status=status)
+        return web.json_response({"ok": True})
+    return handler
+
+
+def test_get_is_retried_on_5xx():
+    hits = []
+
+    async def run():
+        async with serve([web.get("/r", _flaky(hits, 2))]) as (rest, base):
+            return await rest.request("GET", f"{base}/r")
+
+    assert asyncio.run(run()) == {"ok": True}
+    assert len(hits) == 3
+
+
+def test_post_is_not_retried_on_5xx_but_is_on_429():
+    hits_503, hits_429 = [], []
+
+    async def run():
+        routes = [web.post("/a", _flaky(hits_503, 1)), web.post("/b", _flaky(hits_429, 1, status=429))]
+        async with serve(routes) as (rest, base):
+            with pytest.raises(HttpError) as excinfo:
+                await rest.request("POST", f"{base}/a")
+            assert excinfo.value.resp.status == 503
+            return await rest.request("POST", f"{base}/b")
+
+    assert asyncio.run(run()) == {"ok": True}
+    assert len(hits_503) == 1  # 処理済みかもしれないので再送しない
+    assert len(hits_429) == 2
+
+
+def test_connection_refused_post_is_retried(monkeypatch):
+    attempts = []
+    original = aiohttp.ClientSession._request
+
+    async def counting(self, method, url, **kwargs):
+        attempts.append(method)
+        return await original(self, method, url, **kwargs)
+
+    monkeypatch.setattr(aiohttp.ClientSession, "_request", counting)
+
+    async def run():
+        rest = GoogleRestSession(FakeCredentials(), max_retries=3)
+        try:
+            with pytest.raises(aiohttp.ClientConnectorError):
+                await rest.request("POST", "http://127.0.0.1:9/x")
+        finally:
+            await rest.close()
+
+    asyncio.run(run())
+    assert len(attempts) == 4  # 届いていないことが確かなので再試行する
+
+
+def test_401_refreshes_the_token_once():
+    async def handler(request):
+        if request.headers["authorization"] == "Bearer t1":
+            return web.Response(status=401)
+        return web.json_response({"auth": request.headers["authorization"]})
+
+    async def run():
+        async with serve([web.get("/r", handler)]) as (rest, base):
+            return await rest.request("GET", f"{base}/r")
+
+    assert asyncio.run(run()) == {"auth": "Bearer t2"}
+
+
+def test_values_get_quotes_the_range_and_uses_a_fields_mask(monkeypatch):
+    async def handler(request):
+        return web.json_response({"range": request.match_info["range"], "query": dict(request.query)})
+
+    async def run():
+        async with serve([web.get("/v4/spreadsheets/{id}/values/{range}", handler)]) as (rest, base):
+            monkeypatch.setattr(google_rest, "SHEETS_URL", f"{base}/v4/spreadsheets")
+            values = AsyncSheetsApi(rest).spreadsheets().values()
+            return await values.get(spreadsheetId="S", range="'台帳 2026'!A1:L").execute_async()
+
+    result = asyncio.run(run())
+    assert result["range"] == "'台帳 2026'!A1:L"
+    assert result["query"] == {"fields": "range,values"}
+
+
+def test_drive_upload_is_a_single_multipart_request(monkeypatch):
+    async def handler(request):
+        reader = await request.multipart()
+        parts = [(part.headers["Content-Type"], await part.read()) async for part in reader]
+        return web.json_response({
+            "types": [content_type for content_type, _ in parts],
+            "media": parts[1][1].decode(),
+            "query": dict(request.query),
+        })
+
+    async def run():
+        async with serve([web.post("/upload", handler)]) as (rest, base):
+            monkeypatch.setattr(google_rest, "DRIVE_UPLOAD_URL", f"{base}/upload")
+            media = MediaInMemoryUpload(b"PNGDATA", mimetype="image/png")
+            return await AsyncDriveApi(rest).files().create(
+                body={"name": "r.png"}, media_body=media, fields="id, webViewLink"
+            ).execute_async()
+
+    result = asyncio.run(run())
+    assert result["types"][0].startswith("application/json") and result["types"][1] == "image/png"
+    assert result["media"] == "PNGDATA"
+    assert result["query"] == {"supportsAllDrives": "true", "fields": "id, webViewLink", "uploadType": "multipart"}
+
+
+def test_unknown_arguments_are_rejected():
+    rest = GoogleRestSession(FakeCredentials())
+    with pytest.raises(TypeError):
+        AsyncSheetsApi(rest).spreadsheets().get(spreadsheetId="S", bogus=1)
+    files = AsyncDriveApi(rest).files()
+    with pytest.raises(TypeError):
+        files.get(fileId="F", bogus=1)
+    with pytest.raises(TypeError):
+        files.copy(fileId="F", body={}, bogus=1)
+    with pytest.raises(TypeError):
+        files.create(body={}, bogus=1)
+    assert files.get(fileId="F", supportsAllDrives=False).params["supportsAllDrives"] == "false"
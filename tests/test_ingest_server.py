@@ -0,0 +1,148 @@
+"""HTTP 受付サーバー（認証・申請・一部失敗からの再試行・処理中のジョブ）のテスト"""
+import asyncio
+import contextlib
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from services.admission import AdmissionController
+from services.ingest_server import IngestServer
+from services.jobqueue import JobStillRunning
+from services.routing import LedgerRouter, LedgerTarget
+
+TOKEN = "secret"
+AUTH = {"Authorization": f"Bearer {TOKEN}"}
+
+
+class FakeJobs:
+    """AccountingCog.run_job の代わり（submit の失敗・処理中を指定できる）"""
+
+    def __init__(self, receipts: list[dict] | None = None, failures: dict[int, Exception] | None = None):
+        self.receipts = receipts or [{"ocr_text": "", "ocr_data": {}}]
+        self.failures = failures or {}  # n 回目（1から）の submit で送出する例外
+        self.calls = 0
+        self.submitted: list[dict] = []
+        self.uploads = 0
+
+    async def __call__(self, kind: str, payload: dict, blob: bytes | None) -> dict:
+        if kind == "analyze":
+            return {"ocr_text": "text", "receipts": self.receipts}
+        self.calls += 1
+        if self.calls in self.failures:
+            raise self.failures[self.calls]
+        if blob is not None:
+            self.uploads += 1
+        self.submitted.append(payload)
+        return {"drive_link": "https://drive.example/1" if blob else payload["row_data"].get("レシート", "")}
+
+
+@contextlib.asynccontextmanager
+async def serve(jobs: FakeJobs, tmp_path):
+    server = IngestServer(
+        jobs,
+        LedgerRouter([LedgerTarget("default", "sheet-1")]),
+        AdmissionController(max_in_flight=2, queue_size=5, user_rate_per_minute=60, user_burst=5),
+        token=TOKEN,
+        upload_dir=str(tmp_path),
+    )
+    runner = web.AppRunner(server.make_app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    try:
+        async with aiohttp.ClientSession(f"http://{host}:{port}", headers=AUTH) as client:
+            yield client
+    finally:
+        await server.stop()
+        await runner.cleanup()
+
+
+async def _finished(client: aiohttp.ClientSession, job_id: str) -> dict:
+    for _ in range(100):
+        async with client.get(f"/jobs/{job_id}") as resp:
+            job = await resp.json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError("ジョブが終わりません")
+
+
+def _receipt_form() -> aiohttp.FormData:
+    form = aiohttp.FormData()
+    form.add_field("image", b"\x89PNG" * 10, filename="r.png", content_type="image/png")
+    return form
+
+
+@pytest.mark.parametrize("header", ["", "Bearer wrong", "Bearer 秘密"])
+def test_bad_tokens_are_rejected(tmp_path, header):
+    async def run():
+        async with serve(FakeJobs(), tmp_path) as client:
+            async with client.get("/jobs/x", headers={"Authorization": header}) as resp:
+                return resp.status
+
+    assert asyncio.run(run()) == 401
+
+
+def test_entry_is_submitted(tmp_path):
+    jobs = FakeJobs()
+
+    async def run():
+        async with serve(jobs, tmp_path) as client:
+            async with client.post("/entries", json={"date": "2026/02/08", "amount": "1,500", "purpose": "交通費"}) as resp:
+                assert resp.status == 202
+                job_id = (await resp.json())["job_id"]
+            return await _finished(client, job_id)
+
+    job = asyncio.run(run())
+    assert job["status"] == "done"
+    assert jobs.submitted[0]["row_data"]["出金"] == 1500
+    assert jobs.submitted[0]["submission_key"] == f"{job['id']}/1"
+
+
+def test_partial_failure_retries_only_the_remaining_receipts(tmp_path):
+    receipts = [{"ocr_text": t, "ocr_data": {"amount": a}} for t, a in [("a", "100"), ("b", "200"), ("c", "300")]]
+    jobs = FakeJobs(receipts, failures={2: RuntimeError("Sheets 503")})
+
+    async def run():
+        async with serve(jobs, tmp_path) as client:
+            async with client.post("/receipts", data=_receipt_form()) as resp:
+                job_id = (await resp.json())["job_id"]
+            partial = await _finished(client, job_id)
+
+            async with client.post(f"/jobs/{job_id}/retry") as resp:
+                assert resp.status == 202
+            done = await _finished(client, job_id)
+            async with client.post(f"/jobs/{job_id}/retry") as resp:
+                assert resp.status == 409
+            return partial, done
+
+    partial, done = asyncio.run(run())
+    assert partial["status"] == "partial"
+    assert partial["result"]["remaining"] == 2
+    assert done["status"] == "done"
+    assert [p["row_data"]["出金"] for p in jobs.submitted] == [100, 200, 300]
+    assert jobs.uploads == 1  # 同じ画像は1回だけアップロードする
+    assert {p["row_data"]["レシート"] for p in jobs.submitted[1:]} == {"https://drive.example/1"}
+    assert not list(tmp_path.iterdir())  # 一時ファイルは残さない
+
+
+def test_job_still_running_in_the_worker_is_not_a_failure(tmp_path):
+    jobs = FakeJobs(failures={1: JobStillRunning("worker-job-1")})
+
+    async def run():
+        async with serve(jobs, tmp_path) as client:
+            async with client.post("/entries", json={"amount": "500"}) as resp:
+                job_id = (await resp.json())["job_id"]
+            processing = await _finished(client, job_id)
+            async with client.post(f"/jobs/{job_id}/retry") as resp:
+                assert resp.status == 202
+            return processing, await _finished(client, job_id)
+
+    processing, done = asyncio.run(run())
+    assert processing["status"] == "processing"
+    assert "worker-job-1" in processing["error"]
+    assert done["status"] == "done"
+    # 再試行は同じ submission_key で送るため、ワーカーは同じジョブの結果を返す
+    assert [p["submission_key"] for p in jobs.submitted] == [f"{done['id']}/1"]
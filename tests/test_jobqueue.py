@@ -0,0 +1,106 @@
+"""SQLite ジョブキュー（取り出し・直列化・完了待ち・再送信の重複排除）のテスト"""
+import asyncio
+import sqlite3
+
+import pytest
+
+from services.jobqueue import JobError, JobQueue, JobStillRunning
+from services.routing import LedgerRouter, LedgerTarget
+
+
+@pytest.fixture
+def queue(tmp_path):
+    router = LedgerRouter([
+        LedgerTarget("本部", "sheet-1"),
+        LedgerTarget("本部2", "sheet-1"),  # 同じスプレッドシートの別のシート
+        LedgerTarget("支部", "sheet-2"),
+    ])
+    queue = JobQueue(str(tmp_path / "jobs.db"), router)
+    yield queue
+    queue.close()
+
+
+def test_writes_to_the_same_spreadsheet_are_serialized(queue):
+    first = queue.enqueue("submit", {"target": "本部", "row_data": {}})
+    same_sheet = queue.enqueue("submit", {"target": "本部2", "row_data": {}})
+    other = queue.enqueue("submit", {"target": "支部", "row_data": {}})
+    read = queue.enqueue("find_unsettled", {"target": "本部", "column": "精算"})
+
+    assert queue.claim("w1")["id"] == first
+    # 本部2 は本部と同じスプレッドシートなので、本部の書き込みが終わるまで取り出さない
+    assert queue.claim("w2")["id"] == other
+    assert queue.claim("w3")["id"] == read
+    assert queue.claim("w4") is None
+
+    queue.complete(first, {})
+    assert queue.claim("w4")["id"] == same_sheet
+
+
+def test_dry_run_recompute_is_not_serialized(queue):
+    queue.enqueue("submit", {"target": "本部", "row_data": {}})
+    dry_run = queue.enqueue("recompute_balances", {"target": "本部", "dry_run": True})
+    queue.claim("w1")
+    assert queue.claim("w2")["id"] == dry_run
+
+
+def test_wait_returns_result_and_raises_worker_errors(queue):
+    done = queue.enqueue("analyze", {})
+    failed = queue.enqueue("analyze", {})
+    queue.complete(done, {"ocr_text": "x"})
+    queue.fail(failed, "Vision API エラー")
+
+    assert asyncio.run(queue.wait(done, timeout=1)) == {"ocr_text": "x"}
+    with pytest.raises(JobError, match="Vision API エラー"):
+        asyncio.run(queue.wait(failed, timeout=1))
+
+
+def test_timeout_cancels_unclaimed_job(queue):
+    job_id = queue.enqueue("analyze", {})
+    with pytest.raises(JobError, match="取り消しました"):
+        asyncio.run(queue.wait(job_id, timeout=0, poll_interval=0))
+    assert queue.get(job_id)["status"] == "cancelled"
+    assert queue.claim("w1") is None
+
+
+def test_timeout_of_running_job_is_not_a_failure(queue):
+    job_id = queue.enqueue("submit", {"target": "本部", "row_data": {}, "submission_key": "r1"})
+    queue.claim("w1")
+
+    with pytest.raises(JobStillRunning) as excinfo:
+        asyncio.run(queue.wait(job_id, timeout=0, poll_interval=0))
+    assert not isinstance(excinfo.value, JobError)
+    assert excinfo.value.job_id == job_id and job_id in str(excinfo.value)
+    assert queue.get(job_id)["status"] == "running"
+
+
+def test_resubmission_waits_for_the_same_job(queue):
+    payload = {"target": "本部", "row_data": {"出金": 100}, "submission_key": "r1"}
+    job_id = queue.enqueue("submit", payload)
+    queue.claim("w1")
+
+    assert queue.enqueue("submit", payload) == job_id  # 実行中
+    queue.complete(job_id, {"drive_link": ""})
+    assert queue.enqueue("submit", payload) == job_id  # 完了済み（結果をそのまま返す）
+    assert asyncio.run(queue.run("submit", payload, timeout=1)) == {"drive_link": ""}
+
+    # 失敗したジョブは書き込んでいないので、新しく登録する
+    other = queue.enqueue("submit", {**payload, "submission_key": "r2"})
+    queue.claim("w1")
+    queue.fail(other, "Sheets API エラー")
+    assert queue.enqueue("submit", {**payload, "submission_key": "r2"}) != other
+
+
+def test_old_queue_file_is_migrated(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, target TEXT, payload TEXT NOT NULL, "
+        "blob BLOB, status TEXT NOT NULL DEFAULT 'queued', result TEXT, error TEXT, worker TEXT, "
+        "created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+    )
+    conn.close()
+
+    queue = JobQueue(path)
+    job_id = queue.enqueue("submit", {"target": "本部", "row_data": {}, "submission_key": "r1"})
+    assert queue.enqueue("submit", {"target": "本部", "row_data": {}, "submission_key": "r1"}) == job_id
+    queue.close()
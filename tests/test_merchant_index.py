@@ -0,0 +1,61 @@
+"""店名辞書（Aho-Corasick 照合・店名欄の判定・学習）のテスト"""
+from services.merchant_index import AhoCorasick, MerchantIndex, guess_store, is_store_key, store_key
+
+RECEIPT = "領収書\nセブンイレブン 渋谷店\n2026/02/08 12:34\nお茶 ¥150\n合計 ¥450"
+
+
+def test_aho_corasick_finds_all_patterns_in_order():
+    automaton = AhoCorasick(["he", "she", "his", "hers"])
+    found = [(pos, automaton.patterns[i]) for pos, i in automaton.search("ushers")]
+    # 各位置で最長のパターン（"she" と "he" が同じ位置で終わる場合は "she"）
+    assert found == [(3, "she"), (5, "hers")]
+
+
+def test_aho_corasick_follows_failure_links():
+    automaton = AhoCorasick(["ローソン", "ソンポ"])
+    found = [automaton.patterns[i] for _, i in automaton.search("ローソンポイント")]
+    assert found == ["ローソン", "ソンポ"]
+
+
+def test_aho_corasick_without_match():
+    assert list(AhoCorasick(["abc"]).search("xyz")) == []
+
+
+def test_store_key_normalizes_and_drops_branch():
+    assert store_key("セブン－イレブン　渋谷店") == "セブンイレブン"
+    assert store_key("ｾﾌﾞﾝｲﾚﾌﾞﾝ") == "セブンイレブン"
+    assert store_key("ＡＢＣ Mart 新宿店") == "abcmart"
+
+
+def test_header_words_are_not_store_names():
+    # 「領収書」などの見出しを店名として学習・照合しない
+    for header in ("領収書", "レシート", "合計¥450", "No.123", "お茶"):
+        assert not is_store_key(store_key(header)), header
+    assert guess_store(RECEIPT) == "セブンイレブン 渋谷店"
+    assert guess_store("領収書\nお買上げ明細\n2026/02/08") == ""
+
+
+def test_learn_ignores_header_words_and_matches_store(tmp_path):
+    index = MerchantIndex(str(tmp_path / "merchants.json"))
+    index.learn("領収書", "文房具", "消耗品費")
+    assert index.entries == {}
+    assert index.match(RECEIPT) is None
+
+    index.learn("セブンイレブン 渋谷店", "飲み物", "会議費")
+    index.learn("セブンイレブン 新宿店", "飲み物", "会議費")
+    index.learn("セブンイレブン", "文房具", "消耗品費")
+    match = index.match(RECEIPT)
+    assert match == {"store": "セブンイレブン 渋谷店", "purpose": "飲み物", "category": "会議費"}
+
+
+def test_match_only_looks_at_store_lines(tmp_path):
+    index = MerchantIndex(str(tmp_path / "merchants.json"))
+    index.learn("ファミリーマート", "飲み物", "会議費")
+    # 日付・金額の行より下（品名欄）に店名があっても照合しない
+    assert index.match("領収書\n2026/02/08\nファミリーマート ¥100") is None
+
+
+def test_learned_entries_are_saved(tmp_path):
+    path = str(tmp_path / "merchants.json")
+    MerchantIndex(path).learn("ローソン 新宿店", "お茶", "会議費")
+    assert MerchantIndex(path).match("ローソン 渋谷店\n2026/02/09")["purpose"] == "お茶"
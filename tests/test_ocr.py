@@ -0,0 +1,98 @@
+"""OCR エンジンの切り替え（OcrService）と Tesseract のプロセスプールのテスト"""
+import time
+import types
+
+import pytest
+
+from services import ocr
+from services.ocr import OcrEngine, OcrService, TesseractEngine
+
+
+class FakeEngine(OcrEngine):
+    def __init__(self, name: str, text: str = "", confidence: float = 1.0, error: Exception | None = None):
+        self.name = name
+        self.text = text
+        self.confidence = confidence
+        self.error = error
+        self.calls = 0
+
+    def recognize(self, image_bytes: bytes) -> dict:
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return {"text": self.text, "confidence": self.confidence}
+
+
+RECEIPT = "2026/02/08\n合計 ¥1,500"
+
+
+def test_escalates_only_when_confidence_is_low():
+    tesseract = FakeEngine("tesseract", RECEIPT, confidence=0.4)
+    vision = FakeEngine("vision", "2026/02/08\n合計 ¥1,600")
+    service = OcrService([tesseract, vision], escalate=True, threshold=0.6)
+    assert service.analyze_receipt(b"")[1]["amount"] == "1600"
+
+    tesseract.confidence = 0.9
+    assert service.analyze_receipt(b"")[1]["amount"] == "1500"
+    assert vision.calls == 1
+
+
+def test_fallback_on_error_and_last_error_is_raised():
+    service = OcrService([FakeEngine("vision", error=RuntimeError("quota")), FakeEngine("tesseract", RECEIPT)])
+    assert service.analyze_receipt(b"")[1]["amount"] == "1500"
+
+    service = OcrService([FakeEngine("vision", error=RuntimeError("quota")), FakeEngine("tesseract")])
+    with pytest.raises(RuntimeError, match="quota"):
+        service.analyze_receipt(b"")
+
+
+def test_tesseract_characters_are_joined_into_words(monkeypatch):
+    data = {k: [] for k in ("text", "conf", "block_num", "par_num", "line_num", "left", "top", "width", "height")}
+
+    def add(text, left, line, top, width=20, height=20):
+        for key, value in zip(data, (text, 90, 1, 1, line, left, top, width, height)):
+            data[key].append(value)
+
+    add("2026/02/08", 0, 1, 0, width=200)
+    for text, left in [("合", 0), ("計", 22), ("¥", 80), ("1", 102), (",", 120), ("5", 130), ("0", 150), ("0", 170)]:
+        add(text, left, 2, 40, *((8, 8) if text == "," else (20, 20)))
+
+    image = types.SimpleNamespace(convert=lambda mode: image)
+    monkeypatch.setattr(ocr, "Image", types.SimpleNamespace(open=lambda f: image))
+    monkeypatch.setattr(ocr, "pytesseract", types.SimpleNamespace(
+        pytesseract=types.SimpleNamespace(),
+        image_to_data=lambda *args, **kwargs: data,
+        Output=types.SimpleNamespace(DICT="dict"),
+    ))
+
+    result = ocr._tesseract_recognize(b"", "jpn", "")
+    assert result["text"].splitlines()[1].replace(" ", "") == "合計¥1,500"
+    assert result["confidence"] == pytest.approx(0.9)
+
+
+def _hang(image_bytes: bytes, lang: str, tesseract_cmd: str) -> dict:
+    time.sleep(30)
+    return {}
+
+
+def _echo(image_bytes: bytes, lang: str, tesseract_cmd: str) -> dict:
+    return {"text": image_bytes.decode(), "confidence": 1.0}
+
+
+def test_timeout_recycles_the_process_pool(monkeypatch):
+    monkeypatch.setattr(ocr, "pytesseract", types.SimpleNamespace())
+    engine = TesseractEngine(processes=1, timeout=0.5)
+    try:
+        monkeypatch.setattr(ocr, "_tesseract_recognize", _hang)
+        old_pool = engine._pool
+        started = time.monotonic()
+        with pytest.raises(TimeoutError):
+            engine.recognize(b"")
+        assert time.monotonic() - started < 5
+        assert engine._pool is not old_pool
+
+        # 作り直したプールでは、次の OCR が応答しない子プロセスを待たずに実行される
+        monkeypatch.setattr(ocr, "_tesseract_recognize", _echo)
+        assert engine.recognize("合計 ¥1,500".encode())["text"] == "合計 ¥1,500"
+    finally:
+        engine._pool.shutdown(wait=False, cancel_futures=True)
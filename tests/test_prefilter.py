@@ -0,0 +1,112 @@
+"""OCR 前のレシート判定（ReceiptPrefilter）と、レシート以外と判定した投稿の扱いのテスト"""
+import asyncio
+import io
+import random
+import types
+
+import pytest
+
+pytest.importorskip("PIL")
+from PIL import Image, ImageDraw
+
+import config
+from cogs.accounting import PREFILTER_SKIPPED_REACTION, AccountingCog
+from services.admission import AdmissionController
+from services.prefilter import ReceiptPrefilter, build_prefilter
+
+
+def _png(image: Image.Image) -> bytes:
+    buf = io.BytesIO()
+    image.save(buf, "PNG")
+    return buf.getvalue()
+
+
+def _receipt() -> bytes:
+    """白い縦長の紙に、黒い細い文字が並んだ画像"""
+    rng = random.Random(1)
+    image = Image.new("RGB", (300, 800), "white")
+    draw = ImageDraw.Draw(image)
+    for y in range(20, 780, 22):
+        x = 15
+        while x < 270:
+            width = rng.randint(4, 12)
+            draw.rectangle([x, y, x + width, y + 12], outline="black")
+            x += width + rng.randint(3, 8)
+    return _png(image)
+
+
+def _photo() -> bytes:
+    """彩度の高いグラデーション（写真・イラスト）"""
+    image = Image.new("RGB", (640, 480))
+    pixels = image.load()
+    for x in range(640):
+        for y in range(480):
+            pixels[x, y] = (255 * x // 640, 180 * y // 480 + 40, 200 - 150 * x // 640)
+    return _png(image)
+
+
+def _dark_screenshot() -> bytes:
+    """ダークモードのスクリーンショット（暗い背景に明るい文字）"""
+    image = Image.new("RGB", (400, 800), (30, 30, 35))
+    draw = ImageDraw.Draw(image)
+    for y in range(20, 780, 22):
+        draw.text((10, y), "hello world message text", fill=(220, 220, 220))
+    return _png(image)
+
+
+def _blank_paper() -> bytes:
+    return _png(Image.new("RGB", (300, 800), "white"))
+
+
+@pytest.fixture
+def prefilter():
+    return ReceiptPrefilter(threshold=0.45)
+
+
+def test_receipt_is_accepted(prefilter):
+    result = prefilter.classify(_receipt())
+    assert result["is_receipt"]
+    assert set(result["features"]) == {"paper", "ink", "color", "sharp", "aspect"}
+
+
+@pytest.mark.parametrize("image", [_photo, _dark_screenshot, _blank_paper])
+def test_non_receipts_are_rejected(prefilter, image):
+    assert not prefilter.classify(image())["is_receipt"]
+
+
+def test_build_prefilter_off():
+    assert build_prefilter("off", 0.45) is None
+    assert isinstance(build_prefilter("skip", 0.45), ReceiptPrefilter)
+
+
+class FakeMessage:
+    def __init__(self):
+        self.author = types.SimpleNamespace(display_name="A", id=1)
+        self.reactions: list[str] = []
+        self.replies: list[str] = []
+
+    async def add_reaction(self, emoji: str) -> None:
+        self.reactions.append(emoji)
+
+    async def reply(self, content: str, **kwargs):
+        self.replies.append(content)
+
+
+def test_skipped_image_gets_a_reaction(monkeypatch):
+    monkeypatch.setattr(config, "PREFILTER_MODE", "skip")
+    cog = AccountingCog.__new__(AccountingCog)
+    cog.pending = {}
+    cog.prefilter = ReceiptPrefilter(threshold=0.45)
+    cog.admission = AdmissionController(max_in_flight=1, queue_size=1, user_rate_per_minute=6, user_burst=5)
+    message = FakeMessage()
+    image = _photo()
+
+    async def read():
+        return image
+
+    attachment = types.SimpleNamespace(read=read, size=len(image), url="", filename="photo.png")
+    asyncio.run(cog._process_receipt(message, types.SimpleNamespace(name="default"), attachment, "sub-1"))
+
+    assert message.reactions == [PREFILTER_SKIPPED_REACTION]
+    assert message.replies == []
+    assert cog.pending == {}
@@ -0,0 +1,61 @@
+"""1枚の写真に並んだ複数のレシートの切り分け（XY-cut）のテスト"""
+from services.receipt_layout import Word, join_line, region_text, split_receipts
+
+HEIGHT = 10
+
+
+def words_for(lines: list[str], left: float = 0, top: float = 0) -> list[Word]:
+    """行ごとのテキストから、空白区切りの語を左から並べた Word のリストを作る"""
+    words = []
+    for row, line in enumerate(lines):
+        x = left
+        y = top + row * HEIGHT * 1.5
+        for token in line.split():
+            width = len(token) * HEIGHT
+            words.append(Word(token, x, y, x + width, y + HEIGHT))
+            x += width + HEIGHT  # 語の間は高さ1つ分あける
+    return words
+
+
+SEVEN = ["セブンイレブン", "2026/02/08", "お茶 ¥150", "おにぎり ¥300", "合計 ¥450"]
+LAWSON = ["ローソン", "2026/02/09", "パン ¥130", "コーヒー ¥150", "合計 ¥280"]
+
+
+def test_side_by_side_receipts_are_split_left_to_right():
+    words = words_for(SEVEN) + words_for(LAWSON, left=400)
+    texts = split_receipts(words)
+    assert len(texts) == 2
+    assert texts[0].startswith("セブンイレブン") and "¥450" in texts[0]
+    assert texts[1].startswith("ローソン") and "¥280" in texts[1]
+
+
+def test_stacked_receipts_are_split_top_to_bottom():
+    words = words_for(SEVEN) + words_for(LAWSON, top=300)
+    texts = split_receipts(words)
+    assert [t.splitlines()[0] for t in texts] == ["セブンイレブン", "ローソン"]
+
+
+def test_single_receipt_is_not_split():
+    assert split_receipts(words_for(SEVEN)) == []
+
+
+def test_region_without_date_is_merged_into_nearest_receipt():
+    # 合計欄が空白で離れていても、日付と金額がそろわない領域は近いレシートに戻す
+    footer = words_for(["ポイント 12P", "ありがとう ございました"], left=0, top=200)
+    words = words_for(SEVEN) + words_for(LAWSON, left=400) + footer
+    texts = split_receipts(words)
+    assert len(texts) == 2
+    assert "ポイント" in texts[0] and "ポイント" not in texts[1]
+
+
+def test_max_receipts_limits_splitting():
+    words = words_for(SEVEN) + words_for(LAWSON, left=400)
+    assert split_receipts(words, max_receipts=1) == []
+
+
+def test_join_line_inserts_spaces_only_for_gaps():
+    # 1文字ずつ検出された語は詰めてつなぎ、離れた語の間にだけ空白を入れる
+    chars = [Word(ch, i * HEIGHT, 0, (i + 1) * HEIGHT, HEIGHT) for i, ch in enumerate("合計")]
+    amount = [Word("¥1,500", 40, 0, 100, HEIGHT)]
+    assert join_line(chars + amount, HEIGHT) == "合計 ¥1,500"
+    assert region_text(words_for(["お茶 ¥150"])) == "お茶 ¥150"
@@ -0,0 +1,110 @@
+"""差引残高の再計算（SheetsService.recompute_balances）のテスト"""
+import pytest
+
+from services.fakes import FakeDriveAPI, FakeSheetsAPI
+from services.sheets import SheetsService
+
+
+@pytest.fixture
+def ledger():
+    """(SheetsService, シートの値のリスト) 先頭はヘッダー行"""
+    api = FakeSheetsAPI(header=SheetsService.COLUMNS)
+    service = SheetsService(service=api, drive_service=FakeDriveAPI())
+    return service, api.sheets[service.sheet_name]["values"]
+
+
+def row(income="", expense="", balance="", category="経費"):
+    return ["", "2026/04/01", "", category, "A", "x", income, expense, balance, "未", "未", ""]
+
+
+def balances(grid):
+    return [r[8] for r in grid[1:]]
+
+
+def test_fixes_only_wrong_cells(ledger):
+    service, grid = ledger
+    grid += [row(income="1000", balance="1000"), row(expense="300", balance="999"), row(expense="200", balance="500")]
+
+    result = service.recompute_balances()
+
+    assert result["changed"] == 1
+    assert result["first_row"] == 3
+    assert (result["old_balance"], result["new_balance"]) == (500, 500)
+    assert balances(grid) == ["1000", "700", "500"]
+
+
+def test_dry_run_does_not_write(ledger):
+    service, grid = ledger
+    grid += [row(income="1000", balance="1000"), row(expense="300", balance="")]
+
+    result = service.recompute_balances(dry_run=True)
+
+    assert result["changed"] == 1
+    assert result["new_balance"] == 700
+    assert balances(grid) == ["1000", ""]
+
+
+def test_blank_rows_are_skipped(ledger):
+    service, grid = ledger
+    grid += [row(income="1000", balance="1000"), [], row(expense="100", balance="")]
+
+    service.recompute_balances()
+
+    assert grid[2] == []
+    assert grid[3][8] == "900"
+
+
+def test_opening_balance_only_in_column_i_is_kept(ledger):
+    # 入金・出金が空で差引残高だけの繰越行を 0 から数え直して書き換えない
+    service, grid = ledger
+    grid += [row(balance="50000", category=SheetsService.OPENING_CATEGORY), row(expense="1000", balance="49000")]
+
+    result = service.recompute_balances(dry_run=True)
+
+    assert result == {
+        "rows": 2, "changed": 0, "ranges": 0, "first_row": None,
+        "old_balance": 49000, "new_balance": 49000, "stale_rows": [],
+    }
+    grid[2][8] = "0"
+    assert service.recompute_balances()["changed"] == 1
+    assert balances(grid) == ["50000", "49000"]
+
+
+def test_first_row_with_only_a_balance_is_an_opening_row(ledger):
+    service, grid = ledger
+    grid += [[], row(balance="50000", category="繰越"), row(expense="1000", balance="")]
+
+    result = service.recompute_balances()
+
+    assert result["stale_rows"] == []
+    assert [grid[2][8], grid[3][8]] == ["50000", "49000"]
+
+
+def test_stale_balance_on_a_cleared_row_is_reported_not_trusted(ledger):
+    # 出金を消したが差引残高が残っている行の値から数え直すと、以降の行がすべて間違ったままになる
+    service, grid = ledger
+    grid += [
+        row(income="1000", balance="1000"),
+        row(balance="700"),
+        row(expense="200", balance="500"),
+    ]
+
+    result = service.recompute_balances()
+
+    assert result["stale_rows"] == [3]
+    assert result["first_row"] == 3
+    assert balances(grid) == ["1000", "1000", "800"]
+
+
+def test_fiscal_opening_row_restarts_the_balance(ledger):
+    service, grid = ledger
+    grid += [
+        row(income="-100", balance="-100", category=SheetsService.OPENING_CATEGORY),
+        row(expense="200", balance=""),
+    ]
+    # 前の行の残高にかかわらず、前期繰越行の差引残高から数え直す
+    grid.insert(1, row(income="5000", balance="5000"))
+
+    service.recompute_balances()
+
+    assert balances(grid) == ["5000", "-100", "-300"]
@@ -0,0 +1,96 @@
+"""ルーティング表（LedgerRouter）による書き込み先の解決と、台帳ごとのサービスのキャッシュのテスト"""
+import json
+import threading
+
+import pytest
+
+import config
+from services.routing import LedgerRouter, LedgerTarget, ServicePool
+
+ROUTES = [
+    {"name": "本部", "spreadsheet_id": "s1", "guild_id": 1, "channel_ids": [100, 101]},
+    {"name": "支部", "spreadsheet_id": "s2", "guild_id": 1, "channel_name": "支部会計"},
+    {"name": "別サーバー", "spreadsheet_id": "s3", "guild_id": 2, "channel_name": "会計申請"},
+    {"name": "共通", "spreadsheet_id": "s4", "channel_name": "経費"},
+]
+
+
+@pytest.fixture
+def router():
+    return LedgerRouter([LedgerTarget.from_dict(r) for r in ROUTES])
+
+
+def test_channel_id_takes_priority(router):
+    assert router.resolve_channel(100, 1, "支部会計").name == "本部"
+    assert router.watched_channel_ids == {100, 101}
+
+
+def test_channel_name_is_scoped_to_guild(router):
+    assert router.resolve_channel(200, 1, "支部会計").name == "支部"
+    assert router.resolve_channel(200, 2, "会計申請").name == "別サーバー"
+    assert router.resolve_channel(200, 1, "会計申請") is None
+    # guild_id のないルートはどのサーバーのチャンネル名にも一致する
+    assert router.resolve_channel(200, 3, "経費").name == "共通"
+
+
+def test_interaction_falls_back_to_guild_default(router):
+    assert router.resolve_interaction(300, 1, "雑談").name == "本部"  # サーバー内の最初のルート
+    assert router.resolve_interaction(None, 2, None).name == "別サーバー"
+    assert router.resolve_interaction(300, 9, "雑談") is None  # 台帳が複数あれば決められない
+
+
+def test_single_target_is_used_everywhere():
+    router = LedgerRouter([LedgerTarget("default", "s1", channel_name="会計申請")])
+    assert router.resolve_interaction(None, None, None).name == "default"
+    assert router.resolve_channel(1, None, "雑談") is None  # 受け付けるのは指定のチャンネルだけ
+    assert router.default_target_name == "default"
+
+
+def test_default_target_name_without_default():
+    router = LedgerRouter([LedgerTarget("本部", "s1"), LedgerTarget("支部", "s2")])
+    assert router.default_target_name == "本部"
+
+
+def test_duplicate_names_are_rejected():
+    with pytest.raises(ValueError):
+        LedgerRouter([LedgerTarget("本部", "s1"), LedgerTarget("本部", "s2")])
+
+
+def test_from_config_reads_routes_file(tmp_path, monkeypatch):
+    path = tmp_path / "routes.json"
+    path.write_text(json.dumps(ROUTES, ensure_ascii=False), encoding="utf-8")
+    monkeypatch.setattr(config, "ROUTES_FILE", str(path))
+    router = LedgerRouter.from_config()
+    assert list(router.targets) == ["本部", "支部", "別サーバー", "共通"]
+    assert router.targets["本部"].channel_name == ""  # channel_ids があればチャンネル名では照合しない
+
+
+def test_channel_labels_for_guild(router):
+    assert router.channel_labels(1) == ["<#100>", "<#101>", "#支部会計", "#経費"]
+    assert router.channel_labels(2) == ["#会計申請", "#経費"]
+
+
+def test_slow_service_creation_does_not_block_other_targets(router, monkeypatch):
+    pool = ServicePool(router)
+    started, release = threading.Event(), threading.Event()
+    created = []
+
+    def create(target):
+        if target.name == "本部":
+            started.set()
+            release.wait(5)
+        created.append(target.name)
+        pool._sheets[target.name] = target.name
+        return target.name
+
+    monkeypatch.setattr(pool, "_create_sheets", create)
+    slow = threading.Thread(target=pool.sheets, args=("本部",))
+    slow.start()
+    assert started.wait(5)
+    try:
+        assert pool.sheets("支部") == "支部"  # 本部の作成中でも待たない
+    finally:
+        release.set()
+        slow.join(5)
+    assert pool.sheets("本部") == "本部"
+    assert created == ["支部", "本部"]
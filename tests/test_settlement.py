@@ -0,0 +1,89 @@
+"""一括精算（台帳インデックス・対象行の確認・一括更新）のテスト"""
+import pytest
+
+from services.fakes import FakeDriveAPI, FakeSheetsAPI
+from services.ledger_index import COL_SETTLE, LedgerIndex, contiguous_runs, entry_matches
+from services.sheets import LedgerChangedError, SheetsService
+
+
+def _row(day: str, payer: str, expense: int) -> list:
+    return ["2026/04/01", day, "", "", payer, "", "", str(expense), "", "未", "未", ""]
+
+
+@pytest.fixture
+def api():
+    api = FakeSheetsAPI(header=SheetsService.COLUMNS, sheet_title="2025年度")
+    api.spreadsheets().batchUpdate(spreadsheetId="", body={"requests": [
+        {"addSheet": {"properties": {"title": "2026年度"}}},
+    ]}).execute()
+    values = api.spreadsheets().values()
+    values.update(spreadsheetId="", range="'2025年度'!A2:L3", body={"values": [
+        _row("2026/03/30", "A", 100),
+        _row("2026/03/31", "B", 200),
+    ]}).execute()
+    values.update(spreadsheetId="", range="'2026年度'!A1:L3", body={"values": [
+        SheetsService.COLUMNS,
+        _row("2026/04/02", "A", 300),
+        _row("2026/04/03", "A", 400),
+    ]}).execute()
+    return api
+
+
+@pytest.fixture
+def service(api):
+    return SheetsService(service=api, drive_service=FakeDriveAPI(), spreadsheet_id="", sheet_name="2026年度")
+
+
+def _unsettled(service: SheetsService, payer: str) -> list[dict]:
+    return [
+        {**entry, "sheet": name}
+        for name in ("2025年度", "2026年度")
+        for entry in service._ensure_index(name).find_undone(COL_SETTLE, payer)
+    ]
+
+
+def test_contiguous_runs():
+    assert contiguous_runs([5, 2, 3, 3, 9, 10]) == [(2, 3), (5, 5), (9, 10)]
+    assert contiguous_runs([]) == []
+
+
+def test_index_finds_undone_rows_and_reflects_marks():
+    index = LedgerIndex()
+    index.build([SheetsService.COLUMNS, _row("2026/04/02", "A", 300), ["", "", "", "", ""], _row("2026/04/03", "B", 50)])
+
+    assert [e["row"] for e in index.find_undone(COL_SETTLE)] == [2, 4]
+    assert [e["row"] for e in index.find_undone(COL_SETTLE, payer="B")] == [4]
+
+    index.set_mark([2], COL_SETTLE, "済")
+    assert [e["row"] for e in index.find_undone(COL_SETTLE)] == [4]
+    assert entry_matches(index.entries[4], _row("2026/04/03", "B", 50))
+    assert not entry_matches(index.entries[4], _row("2026/04/03", "B", 51))
+
+
+def test_mark_entries_across_sheets_is_one_read_and_one_write(api, service):
+    entries = _unsettled(service, "A")
+    assert [(e["sheet"], e["row"]) for e in entries] == [("2025年度", 2), ("2026年度", 2), ("2026年度", 3)]
+    api.calls.clear()
+
+    assert service.mark_entries(entries, "精算") == 3
+    assert api.calls["values.batchGet"] == 1
+    assert api.calls["values.batchUpdate"] == 1
+    assert api.sheets["2025年度"]["values"][1][10] == "済"
+    assert api.sheets["2025年度"]["values"][2][10] == "未"
+    assert [row[10] for row in api.sheets["2026年度"]["values"][1:]] == ["済", "済"]
+    assert _unsettled(service, "A") == []
+
+
+def test_shifted_rows_abort_without_writing(api, service):
+    entries = _unsettled(service, "A")
+    api.sheets["2026年度"]["values"].insert(1, _row("2026/04/01", "C", 50))  # 手作業で行を挿入
+    api.calls.clear()
+
+    with pytest.raises(LedgerChangedError, match="2026年度 行2"):
+        service.mark_entries(entries, "精算")
+    assert api.calls["values.batchUpdate"] == 0
+
+    # インデックスを作り直せば、ずれた後の行番号で精算できる
+    entries = _unsettled(service, "A")
+    assert [(e["sheet"], e["row"]) for e in entries] == [("2025年度", 2), ("2026年度", 3), ("2026年度", 4)]
+    assert service.mark_entries(entries, "精算") == 3
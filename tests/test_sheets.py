@@ -0,0 +1,61 @@
+"""SheetsService の行追加（シートの行数・列数の拡張）と行の読み出しのテスト"""
+import asyncio
+
+import pytest
+
+from services.fakes import FakeDriveAPI, FakeSheetsAPI
+from services.sheets import SheetsService
+
+
+def _service(api: FakeSheetsAPI) -> SheetsService:
+    return SheetsService(service=api, drive_service=FakeDriveAPI(), spreadsheet_id="", sheet_name="台帳")
+
+
+ROW = {"日付": "2026/04/02", "立て替えた人": "A", "出金": 100, "レシート": "https://drive.example/1"}
+
+
+def test_append_adds_missing_columns():
+    api = FakeSheetsAPI(header=SheetsService.COLUMNS[:11], sheet_title="台帳", column_count=11)
+    _service(api).append_row(ROW)
+
+    assert api.sheets["台帳"]["columnCount"] == len(SheetsService.COLUMNS)
+    assert api.sheets["台帳"]["values"][1][11] == "https://drive.example/1"
+
+
+def test_append_adds_rows_and_columns_in_one_request():
+    api = FakeSheetsAPI(header=SheetsService.COLUMNS[:11], sheet_title="台帳", row_count=1, column_count=11)
+    _service(api).append_row(ROW)
+
+    assert api.calls["spreadsheets.batchUpdate"] == 1
+    assert api.sheets["台帳"]["rowCount"] == 102
+    assert api.sheets["台帳"]["columnCount"] == len(SheetsService.COLUMNS)
+
+
+def test_capacity_request_is_none_when_the_sheet_is_large_enough():
+    service = _service(FakeSheetsAPI(header=SheetsService.COLUMNS, sheet_title="台帳"))
+    meta = {"sheets": [{"properties": {
+        "title": "台帳", "sheetId": 0, "gridProperties": {"rowCount": 10, "columnCount": 12},
+    }}]}
+    assert service._capacity_request(meta, 10) is None
+    assert service._capacity_request(meta, 11)["requests"][0]["appendDimension"]["dimension"] == "ROWS"
+
+
+def test_iter_rows_reads_past_blank_chunks():
+    api = FakeSheetsAPI(header=SheetsService.COLUMNS, sheet_title="台帳")
+    values = api.spreadsheets().values()
+    values.update(spreadsheetId="", range="'台帳'!A2", body={"values": [["2026/04/01", "2026/04/01"]]}).execute()
+    values.update(spreadsheetId="", range="'台帳'!A25", body={"values": [["2026/04/02", "2026/04/02"]]}).execute()
+    service = _service(api)
+
+    # 10行ずつ読むと、行 12〜21 のチャンクは空だが、続けて読む（チャンク内の空行はそのまま返す）
+    assert [n for n, row in service.iter_rows(chunk_rows=10) if row] == [2, 25]
+    assert [n for n, row in service.iter_ledger(chunk_rows=10) if row] == [2, 25]
+
+    with pytest.raises(ValueError):
+        list(service.iter_rows(sheet_name="存在しないシート"))
+
+
+def test_async_append_without_async_client_falls_back_to_threads():
+    api = FakeSheetsAPI(header=SheetsService.COLUMNS[:11], sheet_title="台帳", column_count=11)
+    asyncio.run(_service(api).append_row_async(ROW))
+    assert api.sheets["台帳"]["values"][1][8] == "-100"
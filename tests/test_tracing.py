@@ -0,0 +1,80 @@
+"""トレーシング（span の記録・ファイルの切り替え・集計用の読み込み）のテスト"""
+import json
+
+import pytest
+
+import config
+from services import tracing
+from trace_report import load_traces
+
+
+@pytest.fixture
+def trace_file(tmp_path, monkeypatch):
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(config, "TRACE_FILE", str(path))
+    monkeypatch.setattr(config, "TRACE_MAX_BYTES", 0)
+    monkeypatch.setattr(config, "TRACE_BACKUP_COUNT", 2)
+    tracing.close()
+    yield path
+    tracing.close()
+
+
+def _records(path) -> list[dict]:
+    tracing.close()  # キューに残っている span を書き出す
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_nested_spans_share_the_trace(trace_file):
+    with tracing.span("on_submit", trace_id="sub-1") as attrs:
+        attrs["user"] = "A"
+        with tracing.span("drive.upload"):
+            pass
+        with pytest.raises(ValueError):
+            with tracing.span("sheets.append_row"):
+                raise ValueError("quota")
+
+    records = {r["name"]: r for r in _records(trace_file)}
+    root = records["on_submit"]
+    assert root["parent_id"] is None and root["attrs"] == {"user": "A"}
+    assert records["drive.upload"]["parent_id"] == root["span_id"]
+    assert records["sheets.append_row"]["error"] == "ValueError: quota"
+    assert {r["trace_id"] for r in records.values()} == {"sub-1"}
+
+
+def test_spans_outside_a_trace_are_not_recorded(trace_file):
+    with tracing.span("download") as attrs:
+        assert attrs == {}
+    tracing.close()
+    assert not trace_file.exists()
+
+
+def test_resume_continues_the_trace_in_another_process(trace_file):
+    with tracing.span("on_submit", trace_id="sub-1"):
+        ctx = tracing.context()
+    with tracing.resume(ctx):
+        with tracing.span("job.submit"):
+            pass
+
+    records = {r["name"]: r for r in _records(trace_file)}
+    assert records["job.submit"]["trace_id"] == "sub-1"
+    assert records["job.submit"]["parent_id"] == records["on_submit"]["span_id"]
+
+
+def test_files_are_rotated_and_read_together(trace_file, monkeypatch):
+    monkeypatch.setattr(config, "TRACE_MAX_BYTES", 300)
+    for i in range(10):
+        with tracing.span("on_message", trace_id=f"sub-{i}"):
+            pass
+    tracing.close()
+    worker_file = tracing.trace_path(str(trace_file), "worker-0")
+    with open(worker_file, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"trace_id": "sub-9", "name": "job.analyze"}) + "\n")
+
+    files = tracing.trace_files(str(trace_file))
+    assert worker_file.endswith("traces.worker-0.jsonl")
+    assert set(files) == {str(trace_file), f"{trace_file}.1", f"{trace_file}.2", worker_file}
+
+    # 古い世代は TRACE_BACKUP_COUNT を超えた分が削除されるため、新しい申請だけが残る
+    traces = load_traces(files)
+    assert "sub-9" in traces and "sub-0" not in traces
+    assert [s["name"] for s in traces["sub-9"]].count("job.analyze") == 1
@@ -0,0 +1,112 @@
+"""
+トレース集計 - TRACE_FILE（JSONL）から遅い申請の処理段階ごとの内訳を表示する
+
+    python trace_report.py                 # 最も遅い 10 件
+    python trace_report.py -n 5 traces.jsonl
+
+申請の所要時間は、起点となる span（on_message / open_form / on_submit）の合計。
+ユーザーがフォームに入力している時間は含まない。
+ワーカープロセスのファイル（traces.worker-0.jsonl 等）と、切り替え済みの古いファイル
+（traces.jsonl.1 等）もまとめて読む。
+"""
+import argparse
+import json
+import sys
+from collections import defaultdict
+
+import config
+from services.tracing import trace_files
+
+
+def load_traces(paths: list[str]) -> dict[str, list[dict]]:
+    """trace_id → span のリスト"""
+    traces: dict[str, list[dict]] = defaultdict(list)
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                traces[record["trace_id"]].append(record)
+    return traces
+
+
+def percentile(values: list[float], p: float) -> float:
+    """最近傍法によるパーセンタイル"""
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[k]
+
+
+def print_tree(spans: list[dict]) -> None:
+    """span を親子関係に従って字下げ表示する（同じ親の中では開始順）"""
+    ids = {s["span_id"] for s in spans}
+    children: dict[str | None, list[dict]] = defaultdict(list)
+    for s in spans:
+        parent = s["parent_id"] if s["parent_id"] in ids else None
+        children[parent].append(s)
+
+    def walk(parent_id: str | None, depth: int):
+        for s in sorted(children[parent_id], key=lambda x: x["start"]):
+            label = "  " * depth + s["name"]
+            mark = f"  ✗ {s['error']}" if s.get("error") else ""
+            print(f"    {label:<40}{s['duration_ms']:10.1f} ms{mark}")
+            walk(s["span_id"], depth + 1)
+
+    walk(None, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="申請ごとのトレースを集計する")
+    parser.add_argument("path", nargs="?", default=config.TRACE_FILE, help="トレースファイル（JSONL）")
+    parser.add_argument("-n", "--top", type=int, default=10, help="表示する遅い申請の件数")
+    args = parser.parse_args()
+
+    if not args.path:
+        print("TRACE_FILE が設定されていません", file=sys.stderr)
+        raise SystemExit(1)
+    paths = trace_files(args.path)
+    if not paths:
+        print(f"トレースファイルがありません: {args.path}", file=sys.stderr)
+        raise SystemExit(1)
+    traces = load_traces(paths)
+    if not traces:
+        print("トレースがありません")
+        return
+
+    # 申請ごとの所要時間（起点 span の合計）
+    totals = {}
+    for trace_id, spans in traces.items():
+        roots = [s for s in spans if s["parent_id"] is None]
+        totals[trace_id] = sum(s["duration_ms"] for s in roots)
+
+    # 段階ごとの分布（名前ごと。1つの申請で複数回あれば合計する）
+    by_stage: dict[str, list[float]] = defaultdict(list)
+    for spans in traces.values():
+        per_trace: dict[str, float] = defaultdict(float)
+        for s in spans:
+            per_trace[s["name"]] += s["duration_ms"]
+        for name, ms in per_trace.items():
+            by_stage[name].append(ms)
+
+    print(f"===== 段階別レイテンシ ({len(traces)}件の申請) =====")
+    print(f"  {'段階':<32}{'件数':>6}{'p50':>10}{'p95':>10}{'p99':>10}  (ms)")
+    for name, values in sorted(by_stage.items(), key=lambda kv: -percentile(kv[1], 95)):
+        print(
+            f"  {name:<32}{len(values):>6}"
+            + "".join(f"{percentile(values, p):10.1f}" for p in (50, 95, 99))
+        )
+
+    print(f"\n===== 遅い申請 上位{args.top}件 =====")
+    slowest = sorted(totals.items(), key=lambda kv: -kv[1])[: args.top]
+    for trace_id, total in slowest:
+        print(f"\n  {trace_id}  合計 {total:.1f} ms")
+        print_tree(traces[trace_id])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Discord 会計申請ボット - ワーカープロセス（WORKER_MODE=1 のとき使用）
+
+bot.py（ゲートウェイ）がジョブキュー（JOB_QUEUE_PATH の SQLite）に登録した
+OCR 解析・Drive アップロード・Sheets 書き込みを、複数のプロセスで実行する。
+
+    python worker.py --processes 2
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import time
+import traceback
+
+import config
+from services import tracing
+from services.jobqueue import JobQueue
+from services.merchant_index import MerchantIndex
+from services.ocr import build_ocr_service
+from services.pipeline import ReceiptPipeline, run_job
+from services.routing import LedgerRouter, ServicePool
+from services.vision import VisionService
+
+logger = logging.getLogger("accounting-worker")
+
+
+def _setup_logging():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(processName)s %(name)s: %(message)s",
+    )
+
+
+def worker_main(stop_event, poll_interval: float):
+    """ワーカー1プロセス分: ジョブを取り出して実行し、結果を書き戻す"""
+    _setup_logging()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # 停止は親プロセスから stop_event で行う
+    worker_id = f"{multiprocessing.current_process().name}:{os.getpid()}"
+
+    try:
+        vision_service = VisionService()
+        logger.info("Vision API 初期化完了")
+    except Exception as e:
+        logger.error(f"Vision API 初期化失敗: {e}")
+        vision_service = None
+    ocr_service = build_ocr_service(vision_service)
+    pipeline = ReceiptPipeline(
+        ocr_service,
+        ServicePool(LedgerRouter.from_config()),
+        MerchantIndex(config.MERCHANT_INDEX_FILE),
+    )
+    queue = JobQueue(config.JOB_QUEUE_PATH)
+    logger.info(f"ワーカー起動: {worker_id}")
+
+    while not stop_event.is_set():
+        job = queue.claim(worker_id)
+        if job is None:
+            stop_event.wait(poll_interval)
+            continue
+
+        started = time.perf_counter()
+        try:
+            payload = json.loads(job["payload"])
+            with tracing.resume(payload.get("_trace")):
+                result = run_job(pipeline, job["kind"], payload, job["blob"])
+            queue.complete(job["id"], result)
+            logger.info(
+                f"ジョブ完了: {job['kind']} {job['id']} "
+                f"({(time.perf_counter() - started) * 1000:.0f}ms)"
+            )
+        except Exception as e:
+            logger.error(f"ジョブ失敗: {job['kind']} {job['id']}: {e}\n{traceback.format_exc()}")
+            queue.fail(job["id"], str(e))
+
+    queue.close()
+    tracing.close()
+    logger.info(f"ワーカー停止: {worker_id}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会計申請ボットのワーカープロセスを起動する")
+    parser.add_argument("--processes", type=int, default=config.WORKER_PROCESSES, help="ワーカープロセス数")
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="キューが空のときの待ち時間（秒）")
+    args = parser.parse_args()
+    _setup_logging()
+
+    stop_event = multiprocessing.Event()
+
+    def handle_signal(signum, frame):
+        logger.info("停止シグナルを受信しました")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    def spawn(n: int) -> multiprocessing.Process:
+        proc = multiprocessing.Process(
+            target=worker_main,
+            args=(stop_event, args.poll_interval),
+            name=f"worker-{n}",
+        )
+        proc.start()
+        return proc
+
+    procs = [spawn(n) for n in range(args.processes)]
+    queue = JobQueue(config.JOB_QUEUE_PATH)
+    logger.info(f"ワーカー {args.processes}プロセスを起動しました (キュー: {config.JOB_QUEUE_PATH})")
+
+    # 監視ループ: 異常終了したワーカーの再起動と、キューの後始末
+    while not stop_event.wait(10):
+        for n, proc in enumerate(procs):
+            if not proc.is_alive():
+                logger.warning(f"{proc.name} が終了しました (exitcode={proc.exitcode})。再起動します")
+                procs[n] = spawn(n)
+        stale = queue.fail_stale(config.JOB_TIMEOUT * 2)
+        if stale:
+            logger.warning(f"応答のないジョブを {stale}件 失敗扱いにしました")
+        queue.purge(24 * 60 * 60)
+
+    for proc in procs:
+        proc.join(timeout=30)
+    queue.close()
+
+
+if __name__ == "__main__":
+    main()